@@ -0,0 +1,63 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+import argparse
+import asyncio
+import os
+import time
+
+import harness  # noqa: F401  Puts the repository root on sys.path.
+from promptweaver.clients.fake.fake_client import FakeLLMClient
+from promptweaver.core.prompt_template import PromptTemplate
+
+
+async def _consume(batch) -> int:
+    return sum([1 async for _ in batch])
+
+
+def main() -> None:
+    """
+    Measures the throughput of sequential, threaded and async batch generation.
+
+    The contact center classifier sample is rendered for every prompt and sent to
+    FakeLLMClient, which simulates network latency without calling any API.
+    """
+    parser = argparse.ArgumentParser(description="Compare batch generation strategies offline.")
+    parser.add_argument('--prompts', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated latency per call, in seconds.")
+    parser.add_argument('--max-concurrency', type=int, default=32)
+    parser.add_argument('--template', default=os.path.join(
+        os.path.dirname(__file__), '..', 'samples', '03-contact-center-transcriptions-classifier.yml.j2'))
+    args = parser.parse_args()
+
+    template = PromptTemplate.from_file(args.template)
+    prompts = list(template.render_many({'transcription': f"Speaker A: call #{i}"} for i in range(args.prompts)))
+    client = FakeLLMClient(latency=args.latency, jitter=args.latency / 2, seed=0)
+
+    runs = {
+        'sequential': lambda: sum(1 for config in prompts if client.generate_content(config)),
+        'generate_batch': lambda: sum(1 for _ in client.generate_batch(prompts, args.max_concurrency, ordered=False)),
+        'agenerate_batch': lambda: asyncio.run(_consume(client.agenerate_batch(prompts, args.max_concurrency, ordered=False))),
+    }
+    for name, run in runs.items():
+        start = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<18}{count:>6} prompts in {elapsed:6.2f}s  {count / elapsed:8.1f} prompts/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Callable, List
+import argparse
+import gc
+import glob
+import os
+import tracemalloc
+
+import harness  # noqa: F401  Puts the repository root on sys.path.
+from promptweaver.core.prompt_template import PromptConfig, PromptTemplate, YAMLParser
+
+
+def _retained_bytes(build: Callable[[], List[PromptConfig]]) -> int:
+    """Returns the memory still allocated by the configurations built by `build`."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        configs = build()
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del configs
+    return current
+
+
+def main() -> None:
+    """
+    Measures the memory held by rendered PromptConfig objects.
+
+    Every sample is rendered `--renders` times with its sample values and the rendered
+    configurations are kept alive, as a batch job materializing its prompts would. Renders
+    of a PromptTemplate share the template-level fields; they are compared with the same
+    configurations parsed independently from the rendered YAML, which share nothing.
+    """
+    parser = argparse.ArgumentParser(description="Measure the memory of rendered PromptConfig objects.")
+    parser.add_argument('--renders', type=int, default=10000)
+    parser.add_argument('--samples', default=os.path.join(os.path.dirname(__file__), '..', 'samples'))
+    args = parser.parse_args()
+
+    print(f"{'template':<52}{'shared B/config':>16}{'unshared B/config':>19}{'saved':>8}")
+    for file_path in sorted(glob.glob(os.path.join(args.samples, '*.yml.j2'))):
+        template = PromptTemplate.from_file(file_path)
+        compiled = YAMLParser.get_compiled_template(file_path)
+        params = template.sample_values
+        try:
+            template.render(params)
+        except ValueError as e:
+            print(f"{os.path.basename(file_path):<52}skipped: {str(e).splitlines()[0]}")
+            continue
+
+        def shared() -> List[PromptConfig]:
+            return [template.render(params) for _ in range(args.renders)]
+
+        def unshared() -> List[PromptConfig]:
+            return [PromptConfig(*YAMLParser.load_compiled_config(compiled, params, structural=False))
+                    for _ in range(args.renders)]
+
+        shared_bytes = _retained_bytes(shared) / args.renders
+        unshared_bytes = _retained_bytes(unshared) / args.renders
+        saved = 1 - shared_bytes / unshared_bytes if unshared_bytes else 0.0
+        print(f"{os.path.basename(file_path):<52}{shared_bytes:>16.0f}{unshared_bytes:>19.0f}{saved:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, Callable, Dict, List, Optional
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+# The benchmarks run from a checkout, without installing the package: importing this
+# module makes `promptweaver` importable.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(percentile / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn: Callable[[], Any], iterations: int = 100, warmup: int = 3,
+            setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """
+    Runs fn repeatedly and reports its latency distribution, throughput and peak memory.
+
+    Latencies are measured without tracing; peak memory is measured on one extra run with
+    tracemalloc enabled, so that tracing does not distort the timings.
+
+    Args:
+        fn (Callable): The operation to measure.
+        iterations (int): Number of timed runs.
+        warmup (int): Number of untimed runs before measuring.
+        setup (Callable, optional): Called before every run, outside of the timed section.
+
+    Returns:
+        Dict[str, float]: iterations, throughput (ops/s), mean, p50 and p99 latencies
+            (microseconds), and peak_memory_kb.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    latencies = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'throughput': len(latencies) / sum(latencies) if sum(latencies) else float('inf'),
+        'mean_us': statistics.fmean(latencies) * 1e6,
+        'p50_us': _percentile(latencies, 50) * 1e6,
+        'p99_us': _percentile(latencies, 99) * 1e6,
+        'peak_memory_kb': peak / 1024,
+    }
+
+
+def save_results(results: Dict[str, Any], path: str) -> None:
+    """Writes benchmark results as JSON, creating the parent directory if needed."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """Reads benchmark results written by `save_results`."""
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,93 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that template-only code imports, and must stay free of any Google SDK.
+DEFAULT_MODULES = [
+    'promptweaver',
+    'promptweaver.core.prompt_template',
+    'promptweaver.core.base_llm_client',
+    'promptweaver.clients.gemini.gemini_client',
+]
+FORBIDDEN_PREFIXES = ('vertexai', 'google')
+
+
+def measure(modules: list) -> list:
+    """
+    Imports the modules in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        list: (module name, cumulative microseconds, nesting level) for every module
+            imported by the statement, in import order.
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')]))}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + ', '.join(modules)],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        timings.append((name.strip(), int(cumulative), level))
+    # Drop the modules imported by the interpreter startup, before the statement runs.
+    first = next((i for i, (name, _, _) in enumerate(timings) if name.startswith('promptweaver')), len(timings))
+    start = first
+    while start > 0 and timings[start - 1][2] > 0:
+        start -= 1
+    return timings[start:]
+
+
+def main() -> int:
+    """
+    Measures the import time of promptweaver and fails if a Google SDK gets imported.
+
+    Exits with a non-zero status when a forbidden module is imported or when the total
+    import time exceeds --max-ms, so it can guard against regressions in CI.
+    """
+    parser = argparse.ArgumentParser(description="Measure and guard the import time of promptweaver.")
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--max-ms', type=float, default=None, help="Fail if the imports take longer.")
+    parser.add_argument('--top', type=int, default=10, help="Number of slowest modules to print.")
+    args = parser.parse_args()
+
+    timings = measure(args.modules)
+    total_ms = sum(cumulative for _, cumulative, level in timings if level == 0) / 1000
+    for name, cumulative, _ in sorted(timings, key=lambda item: -item[1])[:args.top]:
+        print(f"{cumulative / 1000:10.1f} ms  {name}")
+    print(f"total: {total_ms:.1f} ms")
+
+    status = 0
+    forbidden = sorted({name for name, _, _ in timings if name.startswith(FORBIDDEN_PREFIXES)})
+    if forbidden:
+        print(f"FAIL: importing {', '.join(args.modules)} loaded {', '.join(forbidden[:5])}"
+              + (f" and {len(forbidden) - 5} more" if len(forbidden) > 5 else ''))
+        status = 1
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"FAIL: import took {total_ms:.1f} ms, more than the {args.max_ms:.1f} ms budget.")
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import glob
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import load_results, measure, save_results  # noqa: E402
+from promptweaver.clients.fake.fake_client import FakeLLMClient  # noqa: E402
+from promptweaver.core.prompt_template import PromptConfig, PromptTemplate, YAMLParser, template_cache  # noqa: E402
+from promptweaver.utils.string_utils import add_indent_filters  # noqa: E402
+
+_REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+_SAMPLES_DIR = os.path.join(_REPO_ROOT, 'samples')
+_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _synthetic_template(system_lines: int = 3, schema_depth: int = 1, user_parts: int = 1) -> str:
+    """Generates a .yml.j2 template with the requested sizes."""
+    lines = [
+        '# ---',
+        'name: Synthetic',
+        'description: A generated template used for benchmarking.',
+        'model:',
+        '  model_name: gemini-1.5-flash-002',
+        '  generation_config:',
+        '    temperature: 0',
+        '    max_output_tokens: 1000',
+        '    response_mime_type: application/json',
+        '    response_schema:',
+    ]
+    indent = '      '
+    for level in range(schema_depth):
+        lines += [
+            f'{indent}type: object',
+            f'{indent}properties:',
+            f'{indent}  field_{level}:',
+            f'{indent}    type: string',
+            f'{indent}    description: Field number {level} of the {{{{ topic }}}} report.',
+            f'{indent}  nested_{level}:',
+        ]
+        indent += '    '
+    lines.append(f'{indent}type: string')
+    lines.append('  system_instruction: |')
+    lines += [f'    Rule {i}: answer questions about {{{{ topic }}}} in a kind and objective way.' for i in range(system_lines)]
+    lines += [
+        '# ---',
+        'variables:',
+        '  topic:',
+        '    sample: cooking',
+        '  payload:',
+        '    sample: Hello!',
+        '# ---',
+        'user:',
+    ]
+    for i in range(user_parts):
+        lines += ['  - text: |', f'      Part {i} about {{{{ topic }}}}:', '      {{ payload }}']
+    return '\n'.join(lines) + '\n'
+
+
+def _synthetic_cases(directory: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Writes the synthetic templates to a directory and returns (name, path, params) cases."""
+    specs = {
+        'synthetic-long-system-instruction': (dict(system_lines=2000), None),
+        'synthetic-deep-schema': (dict(schema_depth=40), None),
+        'synthetic-many-user-parts': (dict(user_parts=200), None),
+        'synthetic-huge-variables': (dict(), 'A line of a very large variable payload.\n' * 25000),
+    }
+    cases = []
+    for name, (sizes, payload) in specs.items():
+        path = os.path.join(directory, f'{name}.yml.j2')
+        with open(path, 'w') as file:
+            file.write(_synthetic_template(**sizes))
+        params = YAMLParser.get_sample_values(path)
+        if payload is not None:
+            params['payload'] = payload
+        cases.append((name, path, params))
+    return cases
+
+
+def _sample_cases() -> List[Tuple[str, str, Dict[str, Any]]]:
+    cases = []
+    for path in sorted(glob.glob(os.path.join(_SAMPLES_DIR, '*.yml.j2'))):
+        name = os.path.basename(path)[:-len('.yml.j2')]
+        cases.append((name, path, YAMLParser.get_sample_values(path)))
+    return cases
+
+
+def _content_builder():
+    """Returns the Gemini content builder class, or None if the Vertex AI SDK is not installed."""
+    try:
+        from promptweaver.clients.gemini.multimodal_content_builder import GeminiMultimodalContentBuilder
+        GeminiMultimodalContentBuilder()
+    except ImportError:
+        return None
+    return GeminiMultimodalContentBuilder
+
+
+def _stages(path: str, params: Dict[str, Any]) -> Dict[str, Tuple[Callable[[], Any], Callable[[], Any]]]:
+    """Returns the (operation, setup) pairs measured for one template."""
+    with open(path) as file:
+        raw_template = file.read()
+    compiled = YAMLParser.get_compiled_template(path)
+    rendered = YAMLParser.render_compiled_template(compiled, params)
+    config = PromptConfig.from_file(path, params)
+    template = PromptTemplate.from_file(path)
+    client = FakeLLMClient(seed=0)
+
+    stages = {
+        'add_indent_filters': (lambda: add_indent_filters(raw_template.splitlines(keepends=True)), None),
+        'from_file_cold': (lambda: PromptConfig.from_file(path, params), lambda: template_cache.invalidate(path)),
+        'from_file_warm': (lambda: PromptConfig.from_file(path, params), None),
+        'render': (lambda: YAMLParser.render_compiled_template(compiled, params), None),
+        'parse_rendered_yaml': (lambda: YAMLParser.parse_rendered_yaml(rendered), None),
+        'template_render': (lambda: template.render(params), None),
+    }
+    builder_class = _content_builder()
+    if builder_class is not None:
+        stages['build_contents'] = (lambda: builder_class().build_contents(config.user), None)
+    stages['end_to_end'] = (lambda: client.generate_content(template.render(params)), None)
+    return stages
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=_REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(iterations: int, warmup: int, include: str = '') -> Dict[str, Any]:
+    """
+    Runs every stage over the samples and the synthetic templates.
+
+    Args:
+        iterations (int): Timed runs per stage.
+        warmup (int): Untimed runs per stage.
+        include (str): Only run the cases whose name contains this string.
+
+    Returns:
+        Dict[str, Any]: Environment metadata and, per case and stage, the measurements
+            returned by `harness.measure` (or the error the stage raised).
+    """
+    results = {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'iterations': iterations,
+        'cases': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, path, params in _sample_cases() + _synthetic_cases(directory):
+            if include not in name:
+                continue
+            case = results['cases'][name] = {}
+            try:
+                stages = _stages(path, params)
+            except Exception as e:
+                case['error'] = f"{type(e).__name__}: {e}"
+                print(f"{name}: skipped ({case['error']})")
+                continue
+            for stage, (fn, setup) in stages.items():
+                try:
+                    case[stage] = measure(fn, iterations, warmup, setup)
+                except Exception as e:
+                    case[stage] = {'error': f"{type(e).__name__}: {e}"}
+                _print_stage(name, stage, case[stage])
+    return results
+
+
+def _print_stage(case: str, stage: str, result: Dict[str, Any]) -> None:
+    if 'error' in result:
+        print(f"{case:<48}{stage:<22}error: {result['error'][:60]}")
+        return
+    print(f"{case:<48}{stage:<22}{result['throughput']:>11.1f}/s  p50 {result['p50_us']:>10.1f}us  "
+          f"p99 {result['p99_us']:>10.1f}us  peak {result['peak_memory_kb']:>9.1f}KB")
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Prints the p50 latency ratio (current / baseline) of every stage present in both runs."""
+    print(f"\nComparing {current['revision']} against {baseline['revision']} (p50 ratio, < 1 is faster):")
+    for case, stages in current['cases'].items():
+        for stage, result in stages.items():
+            previous = baseline['cases'].get(case, {}).get(stage)
+            if not isinstance(result, dict) or not isinstance(previous, dict) or 'p50_us' not in result or 'p50_us' not in previous:
+                continue
+            ratio = result['p50_us'] / previous['p50_us'] if previous['p50_us'] else float('inf')
+            flag = '  <-- slower' if ratio > 1.2 else ''
+            print(f"{case:<48}{stage:<22}{ratio:>6.2f}x{flag}")
+
+
+def main() -> None:
+    """
+    Benchmarks each stage of the template-to-request pipeline.
+
+    Every sample template and four synthetic large templates (a long system instruction,
+    a deep response schema, many user parts and a huge variable payload) go through
+    add_indent_filters, cold and warm PromptConfig.from_file, rendering, YAML parsing,
+    GeminiMultimodalContentBuilder.build_contents (when the Vertex AI SDK is installed)
+    and an end-to-end render and generate against FakeLLMClient. Throughput, p50/p99
+    latency and tracemalloc peak memory are printed and saved as JSON, so that runs on
+    different versions can be compared with --compare.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the template-to-request pipeline.")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--include', default='', help="Only run the cases whose name contains this string.")
+    parser.add_argument('--output', help="Where to save the results. Defaults to benchmarks/results/<revision>.json.")
+    parser.add_argument('--compare', help="A results file of a previous run to compare against.")
+    args = parser.parse_args()
+
+    results = run(args.iterations, args.warmup, args.include)
+    output = args.output or os.path.join(_RESULTS_DIR, f"{results['revision']}.json")
+    save_results(results, output)
+    print(f"\nResults saved to {output}.")
+    if args.compare:
+        compare(load_results(args.compare), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, Dict, Optional, Set, Tuple
+import argparse
+import glob
+import os
+import sys
+
+import harness  # noqa: F401  Puts the repository root on sys.path.
+from promptweaver.core.prompt_template import YAMLParser, template_cache
+from promptweaver.core.structural_template import StructuralFallback
+from promptweaver.utils.yaml_utils import YAML_BACKENDS
+
+# Values that YAML block and plain scalars do not read back verbatim.
+TRICKY_VALUES = [
+    '', ' ', '  lead', '\tlead', 'trail ', 'trail \n\n', 'x\n', 'x\ny', 'x\n  y', '\nx', 'x\n\n\ny',
+    'line\n  \n', 'x\n   ', 'a\n\tb', 'x\r\ny', 'x\x85y', ' x', 'a\x00b', 'a: b', 'a #b', '- a',
+    '"quoted"', "'quoted'", '{a}', '[a]', '|', '> a', '#', '123', 'true', 'null', 'é',
+]
+
+
+def _render_text(compiled, params: Dict[str, Any]) -> Any:
+    try:
+        return YAMLParser.parse_rendered_yaml(YAMLParser.render_compiled_template(compiled, params))
+    except Exception as e:
+        return f"error: {type(e).__name__}"
+
+
+def _check_template(file_path: str) -> Optional[Tuple[int, int, int]]:
+    """Returns the number of renders, fallbacks and mismatches, or None if the template is not eligible."""
+    compiled = YAMLParser.get_compiled_template(file_path)
+    if compiled.structural is None:
+        return None
+    base = {**compiled.default_values, **compiled.sample_values}
+    cases = [base] + [{**base, name: value} for name in base for value in TRICKY_VALUES]
+    fallbacks = mismatches = 0
+    for params in cases:
+        try:
+            structural = YAMLParser.render_structural(compiled, params)
+        except StructuralFallback:
+            fallbacks += 1
+            continue
+        except Exception as e:
+            structural = f"error: {type(e).__name__}"
+        if structural != _render_text(compiled, params):
+            mismatches += 1
+            print(f"  mismatch: {file_path} with {params!r}")
+    return len(cases), fallbacks, mismatches
+
+
+def main() -> None:
+    """
+    Checks that structural rendering produces the same configuration as text rendering.
+
+    Every template is rendered with its sample values, then with each variable replaced
+    in turn by values that YAML does not read back verbatim. A render either matches the
+    text rendering parsed as YAML, or falls back to it. The check runs with every available
+    YAML backend; a mismatch, or a template eligible for structural rendering with one
+    backend only, is reported and makes the script exit with a non-zero status.
+    """
+    parser = argparse.ArgumentParser(description="Compare structural and text rendering of templates.")
+    parser.add_argument('templates', nargs='*',
+                        help="Templates to check. Defaults to the shipped samples.")
+    parser.add_argument('--samples-dir', default=os.path.join(os.path.dirname(__file__), '..', 'samples'))
+    args = parser.parse_args()
+
+    file_paths = args.templates or sorted(glob.glob(os.path.join(args.samples_dir, '*.yml.j2')))
+    eligibility: Dict[str, Set[bool]] = {}
+    failures = 0
+    for backend in YAML_BACKENDS:
+        YAMLParser.set_yaml_backend(backend)
+        template_cache.invalidate()
+        print(f"{backend + ' backend':<52}{'renders':>10}{'fallbacks':>12}{'mismatches':>12}")
+        for file_path in file_paths:
+            result = _check_template(file_path)
+            eligibility.setdefault(file_path, set()).add(result is not None)
+            if result is None:
+                print(f"{os.path.basename(file_path):<52}not eligible for structural rendering")
+                continue
+            renders, fallbacks, mismatches = result
+            failures += mismatches
+            print(f"{os.path.basename(file_path):<52}{renders:>10}{fallbacks:>12}{mismatches:>12}")
+
+    YAMLParser.set_yaml_backend('auto')
+    template_cache.invalidate()
+    for file_path, eligible in eligibility.items():
+        if len(eligible) > 1:
+            failures += 1
+            print(f"  eligibility differs between YAML backends: {file_path}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
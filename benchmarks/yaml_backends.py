@@ -0,0 +1,66 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+import argparse
+import glob
+import os
+import timeit
+
+import harness  # noqa: F401  Puts the repository root on sys.path.
+from promptweaver.core.prompt_template import YAMLParser
+from promptweaver.utils.yaml_utils import YAML_BACKENDS
+
+
+def main() -> None:
+    """
+    Measures YAMLParser.parse_rendered_yaml with each available YAML backend.
+
+    Every shipped sample is rendered once with its sample values, then the rendered
+    document is parsed repeatedly with the pure-Python and the libyaml loaders.
+    """
+    parser = argparse.ArgumentParser(description="Compare YAML backends over the shipped samples.")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--samples-dir', default=os.path.join(os.path.dirname(__file__), '..', 'samples'))
+    args = parser.parse_args()
+
+    backends = list(YAML_BACKENDS)
+    print(f"{'sample':<52}{'bytes':>8}" + ''.join(f"{backend + ' (us)':>16}" for backend in backends) + f"{'speedup':>10}")
+    totals = dict.fromkeys(backends, 0.0)
+    for file_path in sorted(glob.glob(os.path.join(args.samples_dir, '*.yml.j2'))):
+        compiled = YAMLParser.get_compiled_template(file_path)
+        try:
+            rendered_yaml = YAMLParser.render_compiled_template(compiled, {**compiled.default_values, **compiled.sample_values})
+        except ValueError as e:
+            print(f"{os.path.basename(file_path):<52}skipped: {e}")
+            continue
+
+        timings = {}
+        for backend in backends:
+            YAMLParser.set_yaml_backend(backend)
+            seconds = min(timeit.repeat(lambda: YAMLParser.parse_rendered_yaml(rendered_yaml), number=args.iterations, repeat=3))
+            timings[backend] = seconds / args.iterations * 1e6
+            totals[backend] += timings[backend]
+
+        speedup = timings['python'] / timings['libyaml'] if 'libyaml' in timings else 1.0
+        print(f"{os.path.basename(file_path):<52}{len(rendered_yaml):>8}"
+              + ''.join(f"{timings[backend]:>16.1f}" for backend in backends) + f"{speedup:>9.1f}x")
+
+    YAMLParser.set_yaml_backend('auto')
+    print(f"{'total':<60}" + ''.join(f"{totals[backend]:>16.1f}" for backend in backends))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+from threading import Lock
+import asyncio
+import json
+import random
+import re
+import time
+from promptweaver.core.base_llm_client import BaseLLMClient, StreamChunk
+from promptweaver.core.instrumentation import stage
+from promptweaver.core.prompt_template import PromptConfig
+
+
+class FakeUsageMetadata:
+    """Token usage of a fake response, mirroring the fields of Gemini's usage metadata."""
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int, cached_content_token_count: int = 0) -> None:
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeGenerationResponse:
+    """
+    Response returned by FakeLLMClient.
+
+    Attributes:
+        text (str): The generated text.
+        usage_metadata (FakeUsageMetadata): Estimated token usage of the call.
+    """
+
+    def __init__(self, text: str, usage_metadata: FakeUsageMetadata) -> None:
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+    def __repr__(self) -> str:
+        return f"FakeGenerationResponse(text={self.text!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the response as a JSON-compatible dictionary."""
+        usage = self.usage_metadata
+        return {'text': self.text, 'usage_metadata': {
+            'prompt_token_count': usage.prompt_token_count,
+            'candidates_token_count': usage.candidates_token_count,
+            'cached_content_token_count': usage.cached_content_token_count,
+        }}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FakeGenerationResponse':
+        """Restores a response from the dictionary returned by `to_dict`."""
+        return cls(data['text'], FakeUsageMetadata(**data['usage_metadata']))
+
+
+class FakeLLMClient(BaseLLMClient):
+    """
+    Local stand-in for an LLM client, for tests and offline benchmarks.
+
+    It never makes network calls: each generation waits for a simulated latency and
+    returns a canned response. Token counts are estimated at four characters per token.
+
+    Attributes:
+        calls (int): Number of generations performed so far.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 response_fn: Optional[Callable[[PromptConfig], str]] = None, seed: Optional[int] = None) -> None:
+        """
+        Initializes the fake client.
+
+        Args:
+            latency (float): Simulated latency of each call, in seconds.
+            jitter (float): Maximum random latency added to each call, in seconds.
+            failure_rate (float): Probability of a call raising a RuntimeError.
+            response_fn (Callable[[PromptConfig], str], optional): Builds the response text.
+                Defaults to a short text echoing the prompt name.
+            seed (int, optional): Seed of the random generator, for reproducible runs.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.response_fn = response_fn or (lambda prompt_config: f"Fake response to '{prompt_config.name}'.")
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = Lock()
+
+    def generate_content(self, prompt_config: PromptConfig, verbose: bool = False) -> FakeGenerationResponse:
+        """
+        Generates a fake response after the simulated latency.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+            verbose (bool): Whether to print verbose information.
+
+        Returns:
+            FakeGenerationResponse: The fake response.
+        """
+        with stage('generate', template=prompt_config.name, model=prompt_config.model_name) as record:
+            delay, fail = self._next_call(prompt_config)
+            if verbose:
+                print(f"Prompt: {prompt_config.user}")
+            if delay:
+                time.sleep(delay)
+            response = self._respond(prompt_config, fail)
+            record.record_usage(response)
+        return response
+
+    async def agenerate_content(self, prompt_config: PromptConfig, verbose: bool = False) -> FakeGenerationResponse:
+        """
+        Asynchronously generates a fake response after the simulated latency.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+            verbose (bool): Whether to print verbose information.
+
+        Returns:
+            FakeGenerationResponse: The fake response.
+        """
+        with stage('generate', template=prompt_config.name, model=prompt_config.model_name) as record:
+            delay, fail = self._next_call(prompt_config)
+            if verbose:
+                print(f"Prompt: {prompt_config.user}")
+            if delay:
+                await asyncio.sleep(delay)
+            response = self._respond(prompt_config, fail)
+            record.record_usage(response)
+        return response
+
+    def stream_content(self, prompt_config: PromptConfig, verbose: bool = False) -> Iterator[StreamChunk]:
+        """
+        Streams a fake response word by word, spreading the simulated latency over the words.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+            verbose (bool): Whether to print verbose information.
+
+        Yields:
+            StreamChunk: Text deltas, then a final aggregated chunk.
+        """
+        delay, fail = self._next_call(prompt_config)
+        if verbose:
+            print(f"Prompt: {prompt_config.user}")
+        response = self._respond(prompt_config, fail)
+        deltas = self._split(response.text)
+        for delta in deltas:
+            if delay:
+                time.sleep(delay / len(deltas))
+            yield StreamChunk(delta)
+        yield StreamChunk(response.text, is_final=True, response=response, usage_metadata=response.usage_metadata)
+
+    async def astream_content(self, prompt_config: PromptConfig, verbose: bool = False) -> AsyncIterator[StreamChunk]:
+        """
+        Asynchronously streams a fake response word by word.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+            verbose (bool): Whether to print verbose information.
+
+        Yields:
+            StreamChunk: Text deltas, then a final aggregated chunk.
+        """
+        delay, fail = self._next_call(prompt_config)
+        if verbose:
+            print(f"Prompt: {prompt_config.user}")
+        response = self._respond(prompt_config, fail)
+        deltas = self._split(response.text)
+        for delta in deltas:
+            if delay:
+                await asyncio.sleep(delay / len(deltas))
+            yield StreamChunk(delta)
+        yield StreamChunk(response.text, is_final=True, response=response, usage_metadata=response.usage_metadata)
+
+    def validate_prompt(self, prompt_config: PromptConfig) -> bool:
+        """
+        Validates the prompt configuration.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            bool: True if the prompt has a model name and user content.
+        """
+        return bool(prompt_config.model_name and prompt_config.user)
+
+    def serialize_response(self, response: FakeGenerationResponse) -> bytes:
+        """Serializes a FakeGenerationResponse as JSON."""
+        return json.dumps(response.to_dict()).encode('utf-8')
+
+    def deserialize_response(self, data: bytes) -> FakeGenerationResponse:
+        """Restores a FakeGenerationResponse serialized with `serialize_response`."""
+        return FakeGenerationResponse.from_dict(json.loads(data))
+
+    def _next_call(self, prompt_config: PromptConfig):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.failure_rate > 0 and self._random.random() < self.failure_rate
+        return delay, fail
+
+    @staticmethod
+    def _split(text: str) -> list:
+        """Splits a text into word deltas that concatenate back to the original text."""
+        deltas = re.findall(r'\S+\s*|\s+', text)
+        return deltas or ['']
+
+    def _respond(self, prompt_config: PromptConfig, fail: bool) -> FakeGenerationResponse:
+        if fail:
+            raise RuntimeError("Simulated failure of the fake LLM client.")
+        text = self.response_fn(prompt_config)
+        return FakeGenerationResponse(text, FakeUsageMetadata(self._prompt_tokens(prompt_config), max(1, len(text) // 4)))
+
+    @staticmethod
+    def _prompt_tokens(prompt_config: PromptConfig) -> int:
+        prompt_chars = len(prompt_config.system_instruction) + sum(
+            len(str(value)) for entry in prompt_config.user for value in entry.values()
+        )
+        return max(1, prompt_chars // 4)
+
+
+class FakeQuotaExceeded(RuntimeError):
+    """
+    Quota error raised by FakeQuotaLLMClient, mirroring an HTTP 429 response.
+
+    Attributes:
+        code (int): The HTTP status code, 429.
+        retry_after (float): Seconds until the quota window has room again.
+    """
+
+    code = 429
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FakeQuotaLLMClient(FakeLLMClient):
+    """
+    FakeLLMClient enforcing server-side quotas, for testing rate limiting and retries.
+
+    Calls are counted in a sliding window of `window` seconds. A call that would exceed
+    the requests or tokens per window raises FakeQuotaExceeded, like a 429 response of
+    the Gemini API, and does not consume quota.
+
+    Attributes:
+        rejections (int): Number of calls rejected with FakeQuotaExceeded.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None,
+                 window: float = 60.0, **kwargs) -> None:
+        """
+        Initializes the fake client.
+
+        Args:
+            requests_per_minute (int, optional): Maximum calls per window.
+            tokens_per_minute (int, optional): Maximum prompt tokens per window, estimated
+                at four characters per token.
+            window (float): Length of the quota window, in seconds. Shorten it to test
+                quotas quickly.
+            **kwargs: Arguments of FakeLLMClient.
+        """
+        super().__init__(**kwargs)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        self.rejections = 0
+        self._usage = deque()
+
+    def _next_call(self, prompt_config: PromptConfig):
+        self._admit(self._prompt_tokens(prompt_config))
+        return super()._next_call(prompt_config)
+
+    def _admit(self, tokens: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            while self._usage and self._usage[0][0] <= now - self.window:
+                self._usage.popleft()
+            used_tokens = sum(tokens for _, tokens in self._usage)
+            if ((self.requests_per_minute is not None and len(self._usage) + 1 > self.requests_per_minute)
+                    or (self.tokens_per_minute is not None and used_tokens + tokens > self.tokens_per_minute)):
+                self.rejections += 1
+                retry_after = self._usage[0][0] + self.window - now if self._usage else self.window
+                raise FakeQuotaExceeded("429 Quota exceeded for the fake model.", max(0.0, retry_after))
+            self._usage.append((now, tokens))
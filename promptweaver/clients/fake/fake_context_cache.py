@@ -0,0 +1,119 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, AsyncIterator, Iterator, List
+import time
+from promptweaver.clients.fake.fake_client import FakeGenerationResponse, FakeUsageMetadata
+from promptweaver.clients.gemini.context_cache import ContextCacheAPI
+
+
+class FakeCachedContent:
+    """
+    A cached content held by FakeContextCacheAPI.
+
+    Attributes:
+        name (str): The resource name of the cached content.
+        model_name (str): The model the cache was created for.
+        system_instruction (str): The cached system instruction.
+        contents (List[Any]): The cached content parts.
+        expire_time (float): When the cached content expires, as a Unix timestamp.
+        deleted (bool): Whether the cached content was deleted.
+    """
+
+    def __init__(self, name: str, model_name: str, system_instruction: str, contents: List[Any], expire_time: float) -> None:
+        self.name = name
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.contents = contents
+        self.expire_time = expire_time
+        self.deleted = False
+
+    @property
+    def token_count(self) -> int:
+        """Estimated tokens of the cached prefix, at four characters per token."""
+        return (len(self.system_instruction) + sum(len(str(part)) for part in self.contents)) // 4
+
+
+class FakeCachedModel:
+    """A model prefixed by a FakeCachedContent, answering with canned responses."""
+
+    def __init__(self, api: 'FakeContextCacheAPI', cached_content: FakeCachedContent, generation_config: Any) -> None:
+        self.api = api
+        self.cached_content = cached_content
+        self.generation_config = generation_config
+
+    def generate_content(self, contents: List[Any], stream: bool = False) -> Any:
+        response = self._respond(contents)
+        return iter([response]) if stream else response
+
+    async def generate_content_async(self, contents: List[Any], stream: bool = False) -> Any:
+        response = self._respond(contents)
+        if not stream:
+            return response
+
+        async def chunks() -> AsyncIterator[FakeGenerationResponse]:
+            yield response
+        return chunks()
+
+    def _respond(self, contents: List[Any]) -> FakeGenerationResponse:
+        if self.cached_content.deleted or self.cached_content.expire_time <= time.time():
+            raise RuntimeError(f"Cached content {self.cached_content.name} is expired or deleted.")
+        self.api.requests.append((self.cached_content.name, contents))
+        cached_tokens = self.cached_content.token_count
+        prompt_tokens = cached_tokens + sum(len(str(part)) for part in contents) // 4
+        text = f"Fake response using {self.cached_content.name}."
+        return FakeGenerationResponse(text, FakeUsageMetadata(prompt_tokens, len(text) // 4, cached_tokens))
+
+
+class FakeContextCacheAPI(ContextCacheAPI):
+    """
+    Local stand-in for the Vertex AI context caching API, for tests and offline runs.
+
+    Attributes:
+        supported (bool): When False, `create` fails like a model without context caching.
+        cached_contents (List[FakeCachedContent]): Every cached content created.
+        refreshes (int): Number of expiry extensions.
+        requests (List[tuple]): (cached content name, contents) of each generation.
+    """
+
+    def __init__(self, supported: bool = True) -> None:
+        self.supported = supported
+        self.cached_contents: List[FakeCachedContent] = []
+        self.refreshes = 0
+        self.requests: List[tuple] = []
+
+    def create(self, model_name: str, system_instruction: str, contents: List[Any], ttl: float) -> FakeCachedContent:
+        if not self.supported:
+            raise ValueError(f"Model {model_name} does not support context caching.")
+        cached_content = FakeCachedContent(
+            f"cachedContents/{len(self.cached_contents) + 1}", model_name, system_instruction, list(contents), time.time() + ttl)
+        self.cached_contents.append(cached_content)
+        return cached_content
+
+    def refresh(self, handle: FakeCachedContent, ttl: float) -> None:
+        handle.expire_time = time.time() + ttl
+        self.refreshes += 1
+
+    def model_from_cache(self, handle: FakeCachedContent, generation_config: Any, safety_settings: Any) -> FakeCachedModel:
+        return FakeCachedModel(self, handle, generation_config)
+
+    def delete(self, handle: FakeCachedContent) -> None:
+        handle.deleted = True
+
+    def iter_live(self) -> Iterator[FakeCachedContent]:
+        """Yields the cached contents that are neither expired nor deleted."""
+        now = time.time()
+        return (content for content in self.cached_contents if not content.deleted and content.expire_time > now)
@@ -0,0 +1,288 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import glob
+import json
+import os
+import shutil
+import tempfile
+from promptweaver.core.batch_renderer import BatchRenderer, RowSource, iter_row_chunks, write_jsonl_shards
+from promptweaver.core.prompt_template import PromptTemplate
+from promptweaver.clients.gemini.batch_request import build_batch_request
+
+# Request label holding the input row index. Batch prediction copies each request into
+# its result line, which is how results are joined back to their rows.
+ROW_INDEX_LABEL = 'promptweaver_row'
+
+
+class BatchPredictionExporter:
+    """
+    Writes the Vertex AI batch prediction input files of a template and a source of rows.
+
+    Every row is rendered and converted like an online GeminiClient call, and written as
+    a {'request': ...} line labelled with its row index. Rows are streamed and the output
+    is split into shards of `shard_size` lines, ready to be uploaded to Cloud Storage and
+    used as the input of a batch prediction job.
+
+    Attributes:
+        renderer (BatchRenderer): The renderer of the rows.
+        exported (int): Number of requests written by the last export.
+    """
+
+    def __init__(self, template: Union[str, PromptTemplate], shard_size: int = 100000, chunk_size: int = 1000,
+                 processes: Optional[int] = None, skip_errors: bool = False, structural: bool = True,
+                 validate: bool = False) -> None:
+        """
+        Initializes the exporter.
+
+        Args:
+            template (Union[str, PromptTemplate]): The template, or the path to its .yml.j2 file.
+            shard_size (int): Maximum number of requests per output file.
+            chunk_size (int): Number of rows read and rendered at a time.
+            processes (int, optional): Number of worker processes rendering the rows.
+            skip_errors (bool): Whether rows that fail to render are skipped and recorded in
+                `errors`, instead of stopping the export.
+            structural (bool): Whether to use structural rendering when the template allows it.
+            validate (bool): Whether rows are checked against the 'variables' section of the
+                template before they are rendered and exported.
+        """
+        self.renderer = BatchRenderer(template, chunk_size, processes, skip_errors, structural, validate)
+        self.shard_size = shard_size
+        self.exported = 0
+
+    @property
+    def errors(self) -> List[Tuple[int, str]]:
+        """The index and error of the rows skipped by the last export."""
+        return self.renderer.errors
+
+    def iter_requests(self, source: RowSource) -> Iterator[Dict[str, Any]]:
+        """
+        Renders every row into a labelled batch prediction request.
+
+        Args:
+            source (RowSource): The parameter rows.
+
+        Yields:
+            Dict[str, Any]: The requests, in row order.
+        """
+        for index, payload in self.renderer.iter_indexed_payloads(source, build_batch_request):
+            payload['request'].setdefault('labels', {})[ROW_INDEX_LABEL] = str(index)
+            yield payload
+
+    def export(self, source: RowSource, output_dir: str, prefix: str = 'requests') -> List[str]:
+        """
+        Writes the batch prediction input files.
+
+        Args:
+            source (RowSource): The parameter rows.
+            output_dir (str): The directory the shards are written to.
+            prefix (str): Prefix of the shard file names.
+
+        Returns:
+            List[str]: The paths of the written shards.
+        """
+        self.exported = 0
+
+        def counted(requests: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            for request in requests:
+                self.exported += 1
+                yield request
+
+        return write_jsonl_shards(counted(self.iter_requests(source)), output_dir, prefix, self.shard_size)
+
+
+def get_response_text(response: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Returns the text of the first candidate of a batch prediction response.
+
+    Args:
+        response (Dict[str, Any], optional): The 'response' of a result line.
+
+    Returns:
+        Optional[str]: The concatenated text parts, or None if the response has no candidate.
+    """
+    candidates = (response or {}).get('candidates') or []
+    if not candidates:
+        return None
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts)
+
+
+class BatchPredictionImporter:
+    """
+    Joins the result files of a batch prediction job back to the rows they were exported from.
+
+    Batch prediction writes its results in no particular order. The importer first spills
+    the result lines to temporary files, one per range of `partition_size` row indices,
+    then reads the rows again in order and loads a single partition at a time, so neither
+    the results nor the rows are ever fully held in memory.
+
+    Attributes:
+        unmatched (int): Result lines of the last import without a row index label, or
+            whose index is past the last row.
+        missing (int): Rows of the last import without a result, such as rows skipped at
+            export.
+    """
+
+    def __init__(self, partition_size: int = 100000, spill_dir: Optional[str] = None, max_open_files: int = 64) -> None:
+        """
+        Initializes the importer.
+
+        Args:
+            partition_size (int): Number of row indices per spill file. It bounds the number
+                of results held in memory.
+            spill_dir (str, optional): The parent directory of the temporary spill files.
+                Defaults to the system temporary directory.
+            max_open_files (int): Maximum number of spill files kept open while splitting.
+        """
+        self.partition_size = partition_size
+        self.spill_dir = spill_dir
+        self.max_open_files = max_open_files
+        self.unmatched = 0
+        self.missing = 0
+
+    def iter_joined(self, results: Union[str, List[str]], source: RowSource,
+                    include_request: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Joins every row of a source with its batch prediction result.
+
+        Args:
+            results (Union[str, List[str]]): The result files: a path, a glob pattern (for
+                example 'output/prediction-*/predictions.jsonl') or a list of paths.
+            source (RowSource): The rows the requests were exported from, in the same order.
+            include_request (bool): Whether to include the request of each result.
+
+        Yields:
+            Dict[str, Any]: For each row, in order: 'index', 'row', 'text' (the text of the
+                first candidate), 'status' (the error message of failed requests, 'missing'
+                for rows without a result) and 'response'.
+        """
+        self.unmatched = 0
+        self.missing = 0
+        temp_dir = tempfile.mkdtemp(prefix='promptweaver-batch-', dir=self.spill_dir)
+        try:
+            partitions = self._spill(self._expand(results), temp_dir)
+            loaded_partition, loaded = None, {}
+            index = 0
+            for rows in iter_row_chunks(source):
+                for row in rows:
+                    partition = index // self.partition_size
+                    if partition != loaded_partition:
+                        self.unmatched += len(loaded)
+                        loaded_partition = partition
+                        loaded = self._load_partition(temp_dir, partition) if partition in partitions else {}
+                        partitions.discard(partition)
+                    yield self._join(index, row, loaded.pop(index, None), include_request)
+                    index += 1
+            # Results left over point past the last row.
+            self.unmatched += len(loaded)
+            self.unmatched += sum(1 for partition in partitions for _ in self._iter_lines(temp_dir, partition))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def write(self, results: Union[str, List[str]], source: RowSource, output_dir: str, prefix: str = 'results',
+              shard_size: int = 100000, include_request: bool = False) -> List[str]:
+        """
+        Joins the results to their rows and writes them as sharded JSON lines files.
+
+        Args:
+            results (Union[str, List[str]]): The result files, as in `iter_joined`.
+            source (RowSource): The rows the requests were exported from.
+            output_dir (str): The directory the shards are written to.
+            prefix (str): Prefix of the shard file names.
+            shard_size (int): Maximum number of lines per output file.
+            include_request (bool): Whether to include the request of each result.
+
+        Returns:
+            List[str]: The paths of the written shards.
+        """
+        return write_jsonl_shards(self.iter_joined(results, source, include_request), output_dir, prefix, shard_size)
+
+    @staticmethod
+    def _expand(results: Union[str, List[str]]) -> List[str]:
+        patterns = [results] if isinstance(results, str) else list(results)
+        paths = []
+        for pattern in patterns:
+            matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            if not matches:
+                raise ValueError(f"No batch prediction result file matches '{pattern}'.")
+            paths.extend(matches)
+        return paths
+
+    def _spill(self, paths: List[str], temp_dir: str) -> set:
+        """Splits the result lines into one spill file per partition of row indices."""
+        partitions = set()
+        files = OrderedDict()
+        try:
+            for path in paths:
+                with open(path, encoding='utf-8') as file:
+                    for line in file:
+                        if not line.strip():
+                            continue
+                        index = self._row_index(json.loads(line))
+                        if index is None:
+                            self.unmatched += 1
+                            continue
+                        partition = index // self.partition_size
+                        spill = files.pop(partition, None)
+                        if spill is None:
+                            if len(files) >= self.max_open_files:
+                                files.popitem(last=False)[1].close()
+                            spill = open(self._partition_path(temp_dir, partition), 'a', encoding='utf-8')
+                            partitions.add(partition)
+                        files[partition] = spill
+                        spill.write(line if line.endswith('\n') else line + '\n')
+        finally:
+            for spill in files.values():
+                spill.close()
+        return partitions
+
+    @staticmethod
+    def _row_index(result: Dict[str, Any]) -> Optional[int]:
+        labels = (result.get('request') or {}).get('labels') or {}
+        value = labels.get(ROW_INDEX_LABEL)
+        return int(value) if value is not None and str(value).isdigit() else None
+
+    @staticmethod
+    def _partition_path(temp_dir: str, partition: int) -> str:
+        return os.path.join(temp_dir, f'partition-{partition}.jsonl')
+
+    def _iter_lines(self, temp_dir: str, partition: int) -> Iterator[str]:
+        with open(self._partition_path(temp_dir, partition), encoding='utf-8') as file:
+            yield from file
+
+    def _load_partition(self, temp_dir: str, partition: int) -> Dict[int, Dict[str, Any]]:
+        loaded = {}
+        for line in self._iter_lines(temp_dir, partition):
+            result = json.loads(line)
+            # A request retried by the job can appear twice; keep its last result.
+            loaded[self._row_index(result)] = result
+        return loaded
+
+    def _join(self, index: int, row: Dict[str, Any], result: Optional[Dict[str, Any]],
+              include_request: bool) -> Dict[str, Any]:
+        if result is None:
+            self.missing += 1
+            joined = {'index': index, 'row': row, 'text': None, 'status': 'missing', 'response': None}
+        else:
+            response = result.get('response')
+            joined = {'index': index, 'row': row, 'text': get_response_text(response),
+                      'status': result.get('status', ''), 'response': response}
+        if include_request:
+            joined['request'] = result.get('request') if result is not None else None
+        return joined
@@ -0,0 +1,96 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, Dict, List, Optional
+from promptweaver.core.prompt_template import PromptConfig
+from promptweaver.clients.gemini.multimodal_content_builder import GeminiMultimodalContentBuilder
+from promptweaver.clients.gemini.sdk import load_generative_models
+from promptweaver.utils.tree_utils import thaw_tree
+
+
+def build_safety_settings(safety_settings_config: List[Dict[str, str]]) -> list:
+    """
+    Converts the safety settings of a template to Gemini SafetySetting objects.
+
+    Args:
+        safety_settings_config (List[Dict[str, str]]): The settings, each with a
+            'category', 'method' and 'threshold' enum name.
+
+    Returns:
+        list: The SafetySetting objects.
+    """
+    sdk = load_generative_models()
+    return [
+        sdk.SafetySetting(
+            category=getattr(sdk.HarmCategory, setting['category']),
+            method=getattr(sdk.SafetySetting.HarmBlockMethod, setting['method']),
+            threshold=getattr(sdk.HarmBlockThreshold, setting['threshold'])
+        )
+        for setting in safety_settings_config
+    ]
+
+
+def build_generation_config(generation_config: Dict[str, Any]) -> Any:
+    """
+    Converts the generation config of a template to a Gemini GenerationConfig object.
+
+    Args:
+        generation_config (Dict[str, Any]): The generation config. It is copied first, as
+            the SDK rewrites response schemas in place and the config of a PromptConfig
+            may be shared with other renders.
+
+    Returns:
+        GenerationConfig: The SDK object.
+    """
+    return load_generative_models().GenerationConfig(**thaw_tree(generation_config))
+
+
+def build_batch_request(prompt_config: PromptConfig, labels: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Converts a PromptConfig into a line of a Vertex AI batch prediction input file.
+
+    The request goes through the same conversions as online calls of GeminiClient: the
+    user section is built with GeminiMultimodalContentBuilder (local images are embedded
+    as inline data, Cloud Storage media are referenced by URI), and the generation config
+    and safety settings are validated by their SDK types.
+
+    Args:
+        prompt_config (PromptConfig): The rendered prompt configuration.
+        labels (Dict[str, str], optional): Request labels. Batch prediction copies the
+            request, labels included, into each result line.
+
+    Returns:
+        Dict[str, Any]: The JSON-serializable request, as {'request': {...}}.
+    """
+    sdk = load_generative_models()
+    parts = []
+    for part in GeminiMultimodalContentBuilder().build_contents(prompt_config.user):
+        if isinstance(part, str):
+            parts.append({'text': part})
+        elif isinstance(part, sdk.Image):
+            parts.append(sdk.Part.from_image(part).to_dict())
+        else:
+            parts.append(part.to_dict())
+    request = {'contents': [{'role': 'user', 'parts': parts}]}
+    if prompt_config.system_instruction:
+        request['system_instruction'] = {'parts': [{'text': prompt_config.system_instruction}]}
+    if prompt_config.generation_config:
+        request['generation_config'] = build_generation_config(prompt_config.generation_config).to_dict()
+    if prompt_config.safety_settings:
+        request['safety_settings'] = [setting.to_dict() for setting in build_safety_settings(prompt_config.safety_settings)]
+    if labels:
+        request['labels'] = labels
+    return {'request': request}
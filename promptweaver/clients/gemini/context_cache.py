@@ -0,0 +1,287 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import datetime
+import time
+from promptweaver.core.rate_limiter import is_retryable_error
+from promptweaver.utils.lru_cache import LRUCache
+
+
+class ContextCacheAPI(ABC):
+    """The server-side context caching operations used by ContextCache."""
+
+    @abstractmethod
+    def create(self, model_name: str, system_instruction: str, contents: List[Any], ttl: float) -> Any:
+        """
+        Creates a cached content holding a prompt prefix.
+
+        Args:
+            model_name (str): The model the cache is created for.
+            system_instruction (str): The system instruction to cache.
+            contents (List[Any]): The leading content parts to cache, possibly empty.
+            ttl (float): Time to live, in seconds.
+
+        Returns:
+            Any: The cached content handle.
+        """
+        pass
+
+    @abstractmethod
+    def refresh(self, handle: Any, ttl: float) -> None:
+        """Extends the expiry of a cached content to ttl seconds from now."""
+        pass
+
+    @abstractmethod
+    def model_from_cache(self, handle: Any, generation_config: Any, safety_settings: Any) -> Any:
+        """Returns a model whose requests are prefixed by the cached content."""
+        pass
+
+    @abstractmethod
+    def delete(self, handle: Any) -> None:
+        """Deletes a cached content."""
+        pass
+
+
+class VertexContextCacheAPI(ContextCacheAPI):
+    """Context caching with `vertexai.preview.caching.CachedContent`."""
+
+    def __init__(self) -> None:
+        from vertexai.preview import caching
+        from vertexai.preview import generative_models
+        self._caching = caching
+        self._generative_models = generative_models
+
+    def create(self, model_name: str, system_instruction: str, contents: List[Any], ttl: float) -> Any:
+        return self._caching.CachedContent.create(
+            model_name=model_name,
+            system_instruction=system_instruction or None,
+            contents=contents or None,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+
+    def refresh(self, handle: Any, ttl: float) -> None:
+        handle.update(ttl=datetime.timedelta(seconds=ttl))
+
+    def model_from_cache(self, handle: Any, generation_config: Any, safety_settings: Any) -> Any:
+        return self._generative_models.GenerativeModel.from_cached_content(
+            handle, generation_config=generation_config, safety_settings=safety_settings)
+
+    def delete(self, handle: Any) -> None:
+        handle.delete()
+
+
+class _CacheEntry:
+    def __init__(self, handle: Any, expires_at: float) -> None:
+        self.handle = handle
+        self.expires_at = expires_at
+
+
+class ContextCache:
+    """
+    Reuses server-side cached contents for the static prefix of prompts.
+
+    The prefix of a prompt is its system instruction followed by its static user parts
+    (the leading 'user' entries without template variables). Prefixes are identified by
+    the model name, the system instruction and a key of the static user parts computed
+    once per template, so every render of a template shares the same cached content, and
+    the static parts are only built when the cached content is created. A cached content
+    is created on first use, refreshed when it is used less than `refresh_margin` seconds
+    before it expires, and recreated once expired.
+
+    Creations and refreshes run outside of the cache lock, so that lookups of other
+    prefixes are not held up by them; concurrent misses on the same prefix wait for a
+    single creation.
+
+    At most `max_entries` cached contents are kept; the least recently used one is
+    deleted on the server when a new one is created beyond that bound.
+
+    Prefixes that are too small to be cached, or whose creation is rejected (for example
+    because the model does not support context caching), are remembered and sent inline,
+    without retrying. Prefixes whose creation fails with a transient error (quota, server
+    error or timeout) are sent inline for `retry_delay` seconds, doubled after each
+    consecutive failure up to `max_retry_delay`, and then tried again.
+
+    Attributes:
+        created (int): Number of cached contents created.
+        refreshed (int): Number of expiry extensions.
+        hits (int): Lookups served by an existing cached content.
+        errors (LRUCache): The rejection message of each prefix sent inline, by
+            (model name, system instruction, prefix key).
+    """
+
+    def __init__(self, api: Optional[ContextCacheAPI] = None, ttl: float = 3600, refresh_margin: float = 300,
+                 min_tokens: int = 32768, chars_per_token: float = 4, max_errors: int = 1024,
+                 retry_delay: float = 30, max_retry_delay: float = 900, max_entries: int = 256) -> None:
+        """
+        Initializes the context cache.
+
+        Args:
+            api (ContextCacheAPI, optional): The caching API. Defaults to Vertex AI.
+            ttl (float): Time to live of the cached contents, in seconds.
+            refresh_margin (float): Cached contents used within this many seconds of their
+                expiry are refreshed.
+            min_tokens (int): Prefixes estimated below this many tokens are not cached. The
+                Gemini API rejects cached contents below a model-specific minimum.
+            chars_per_token (float): Characters per token, to estimate prefix sizes.
+            max_errors (int): Maximum number of rejected and failing prefixes remembered.
+            retry_delay (float): Seconds before retrying a prefix whose creation failed with
+                a transient error.
+            max_retry_delay (float): Upper bound of the retry delay, in seconds.
+            max_entries (int): Maximum number of cached contents kept. Evicted ones are
+                deleted on the server.
+        """
+        self.api = api if api is not None else VertexContextCacheAPI()
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.chars_per_token = chars_per_token
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.created = 0
+        self.refreshed = 0
+        self.hits = 0
+        self.errors = LRUCache(max_errors)
+        # (retry time, consecutive failures) of the prefixes that failed transiently.
+        self._failures = LRUCache(max_errors)
+        self._entries = LRUCache(max_entries)
+        # Creations and refreshes in progress, by prefix, resolved with the handle or None.
+        self._in_flight: Dict[Tuple[str, str, Optional[str]], Future] = {}
+        self._lock = Lock()
+
+    def get(self, model_name: str, system_instruction: str, prefix_key: Optional[str],
+            build_contents: Callable[[], List[Any]]) -> Optional[Any]:
+        """
+        Returns a live cached content for a prompt prefix, creating or refreshing it if needed.
+
+        Args:
+            model_name (str): The model name.
+            system_instruction (str): The system instruction.
+            prefix_key (Optional[str]): Identifies the static user parts of the prefix, for
+                example `PromptConfig.static_prefix_key`, or None if there are none.
+            build_contents (Callable[[], List[Any]]): Builds the static content parts. It is
+                only called to create the cached content.
+
+        Returns:
+            Optional[Any]: The cached content handle, or None if the prefix must be sent inline.
+        """
+        key = (model_name, system_instruction, prefix_key)
+        with self._lock:
+            now = time.time()
+            if key in self.errors:
+                return None
+            failure = self._failures.get(key)
+            if failure is not None and failure[0] > now:
+                return None
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at - now > self.refresh_margin:
+                self.hits += 1
+                return entry.handle
+            future = self._in_flight.get(key)
+            if future is not None and entry is not None and entry.expires_at > now:
+                # Another request is refreshing the entry, which is still live meanwhile.
+                self.hits += 1
+                return entry.handle
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            return future.result()
+
+        handle = None
+        try:
+            handle = self._acquire(key, entry, now, model_name, system_instruction, build_contents)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_result(handle)
+        return handle
+
+    def _acquire(self, key: Tuple[str, str, Optional[str]], entry: Optional[_CacheEntry], now: float, model_name: str,
+                 system_instruction: str, build_contents: Callable[[], List[Any]]) -> Optional[Any]:
+        """Refreshes or creates the cached content of a prefix, without holding the lock."""
+        if entry is not None and entry.expires_at > now:
+            try:
+                self.api.refresh(entry.handle, self.ttl)
+            except Exception:
+                with self._lock:
+                    self._entries.pop(key, None)
+            else:
+                with self._lock:
+                    entry.expires_at = now + self.ttl
+                    self.refreshed += 1
+                    self.hits += 1
+                return entry.handle
+
+        contents = build_contents()
+        size = len(system_instruction) + sum(len(part) for part in contents if isinstance(part, str))
+        if size / self.chars_per_token < self.min_tokens and not any(not isinstance(part, str) for part in contents):
+            self.errors.put(key, f"Prefix of about {int(size / self.chars_per_token)} tokens is below min_tokens.")
+            return None
+        try:
+            handle = self.api.create(model_name, system_instruction, contents, self.ttl)
+        except Exception as e:
+            if is_retryable_error(e):
+                failures = self._failures.get(key, (0, 0))[1] + 1
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (failures - 1))
+                self._failures.put(key, (time.time() + delay, failures))
+            else:
+                self.errors.put(key, f"{type(e).__name__}: {e}")
+            return None
+        self._failures.pop(key)
+        with self._lock:
+            evicted = self._entries.put(key, _CacheEntry(handle, now + self.ttl))
+            self.created += 1
+        self._delete(entry for _, entry in evicted)
+        return handle
+
+    def _delete(self, entries: Iterable[_CacheEntry]) -> None:
+        """Deletes cached contents on the server, ignoring failures: they expire after their ttl anyway."""
+        for entry in entries:
+            try:
+                self.api.delete(entry.handle)
+            except Exception:
+                pass
+
+    def info(self) -> Dict[str, int]:
+        """
+        Returns the cache statistics.
+
+        Returns:
+            Dict[str, int]: The number of live cached contents, creations, refreshes, hits,
+                prefixes sent inline and prefixes waiting to be retried.
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'created': self.created, 'refreshed': self.refreshed,
+                    'hits': self.hits, 'inline': len(self.errors), 'retrying': len(self._failures)}
+
+    def clear(self, delete: bool = True) -> None:
+        """
+        Forgets every cached content and fallback decision.
+
+        Args:
+            delete (bool): Whether to delete the cached contents on the server.
+        """
+        with self._lock:
+            entries = self._entries.items()
+            self._entries.clear()
+            self.errors.clear()
+            self._failures.clear()
+        if delete:
+            self._delete(entry for _, entry in entries)
@@ -14,29 +14,52 @@
  limitations under the License.
  """
 
-from promptweaver.core.base_llm_client import BaseLLMClient
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+import asyncio
+import hashlib
+import json
+from promptweaver.core.base_llm_client import BaseLLMClient, StreamChunk
+from promptweaver.core.instrumentation import stage
+from promptweaver.core.media_cache import MediaCache
 from promptweaver.core.prompt_template import PromptConfig
+from promptweaver.clients.gemini.batch_request import build_generation_config, build_safety_settings
+from promptweaver.clients.gemini.context_cache import ContextCache
 from promptweaver.clients.gemini.multimodal_content_builder import GeminiMultimodalContentBuilder
-from vertexai.generative_models import (
-    GenerativeModel, GenerationConfig, SafetySetting,
-    HarmCategory, HarmBlockThreshold, GenerationResponse
-)
+from promptweaver.clients.gemini.sdk import load_generative_models, load_vertexai
+from promptweaver.utils.lru_cache import LRUCache
 
-import vertexai 
+if TYPE_CHECKING:
+    from vertexai.generative_models import GenerationResponse, GenerativeModel
 
 
 class GeminiClient(BaseLLMClient):
-    def __init__(self, project: str, location: str):
+    def __init__(self, project: str, location: str, model_cache_size: int = 32, media_cache: MediaCache = None,
+                 context_cache: ContextCache = None, allow_local_files: bool = False):
         """
         Initializes the Gemini client with the given project and location.
 
         Args:
             project (str): The project ID for Gemini.
             location (str): The location for the Gemini deployment.
+            model_cache_size (int): Maximum number of model handles kept for reuse. Each
+                handle is bound to a model name, system instruction, generation config and
+                safety settings combination.
+            media_cache (MediaCache, optional): Cache of the parts built from local media
+                files, reused across prompts.
+            context_cache (ContextCache, optional): Caches the system instruction and static
+                user parts of prompts server-side, so they are not resent with every call.
+            allow_local_files (bool): Whether file:// references in multimodal text rendered
+                from variables are read and sent. By default only those written in the
+                template are, since variable values may come from untrusted data.
         """
-        vertexai.init(project=project, location=location)
+        load_vertexai().init(project=project, location=location)
+        self._sdk = load_generative_models()
+        self._models = LRUCache(model_cache_size)
+        self.media_cache = media_cache
+        self.context_cache = context_cache
+        self.allow_local_files = allow_local_files
     
-    def generate_content(self, prompt_config: PromptConfig, verbose: bool = False) -> GenerationResponse:
+    def generate_content(self, prompt_config: PromptConfig, verbose: bool = False) -> 'GenerationResponse':
         """
         Generates content using Gemini API based on the provided PromptConfig.
 
@@ -47,23 +70,91 @@ class GeminiClient(BaseLLMClient):
         Returns:
             str: The generated content from Gemini.
         """
-        model = GenerativeModel(
-            model_name=prompt_config.model_name,
-            system_instruction=[prompt_config.system_instruction] if prompt_config.system_instruction else [],
-        )
+        with stage('generate', template=prompt_config.name, model=prompt_config.model_name) as record:
+            model, prompt = self._prepare_request(prompt_config)
+            if verbose:
+                print(f"Prompt: {prompt}")
 
-        prompt = self._build_prompt(prompt_config.user)
-        if verbose:
-            print(f"Prompt: {prompt}")
+            response = model.generate_content(contents=prompt)
+            record.record_usage(response)
 
-        response = model.generate_content(
-            contents=prompt,
-            generation_config=GenerationConfig(**prompt_config.generation_config),
-            safety_settings=self._get_safety_settings(prompt_config.safety_settings),
-        )
+        return response
+
+    async def agenerate_content(self, prompt_config: PromptConfig, verbose: bool = False) -> 'GenerationResponse':
+        """
+        Asynchronously generates content using Gemini API based on the provided PromptConfig.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+            verbose (bool): Whether to print verbose information.
+
+        Returns:
+            GenerationResponse: The generated content from Gemini.
+        """
+        with stage('generate', template=prompt_config.name, model=prompt_config.model_name) as record:
+            model, prompt = await self._aprepare_request(prompt_config)
+            if verbose:
+                print(f"Prompt: {prompt}")
+
+            response = await model.generate_content_async(contents=prompt)
+            record.record_usage(response)
 
         return response
 
+    def stream_content(self, prompt_config: PromptConfig, verbose: bool = False) -> Iterator[StreamChunk]:
+        """
+        Generates content using Gemini API and yields the text as it is produced.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+            verbose (bool): Whether to print verbose information.
+
+        Yields:
+            StreamChunk: Text deltas as they arrive, then a final chunk with the full text,
+                the last GenerationResponse and its usage metadata.
+        """
+        with stage('generate', current=False, template=prompt_config.name, model=prompt_config.model_name) as record:
+            model, prompt = self._prepare_request(prompt_config)
+            if verbose:
+                print(f"Prompt: {prompt}")
+
+            deltas = []
+            response = None
+            for response in model.generate_content(contents=prompt, stream=True):
+                delta = self._get_text(response)
+                if delta:
+                    deltas.append(delta)
+                    yield StreamChunk(delta)
+            record.record_usage(response)
+            yield self._final_chunk(deltas, response)
+
+    async def astream_content(self, prompt_config: PromptConfig, verbose: bool = False) -> AsyncIterator[StreamChunk]:
+        """
+        Asynchronously generates content using Gemini API and yields the text as it is produced.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+            verbose (bool): Whether to print verbose information.
+
+        Yields:
+            StreamChunk: Text deltas as they arrive, then a final chunk with the full text,
+                the last GenerationResponse and its usage metadata.
+        """
+        with stage('generate', current=False, template=prompt_config.name, model=prompt_config.model_name) as record:
+            model, prompt = await self._aprepare_request(prompt_config)
+            if verbose:
+                print(f"Prompt: {prompt}")
+
+            deltas = []
+            response = None
+            async for response in await model.generate_content_async(contents=prompt, stream=True):
+                delta = self._get_text(response)
+                if delta:
+                    deltas.append(delta)
+                    yield StreamChunk(delta)
+            record.record_usage(response)
+            yield self._final_chunk(deltas, response)
+
     def validate_prompt(self, prompt_config: PromptConfig) -> bool:
         """
         Validates the prompt configuration for Gemini.
@@ -80,6 +171,177 @@ class GeminiClient(BaseLLMClient):
                 return False
         return True
 
+    def get_cache_key_contents(self, prompt_config: PromptConfig) -> Any:
+        """
+        Describes the content of the prompt for response cache keys, without building it:
+        the user entries, and the path, modification time and size of the local files
+        they reference.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Any: The description of the content.
+        """
+        return GeminiMultimodalContentBuilder.describe_contents(prompt_config.user, self.allow_local_files)
+
+    def serialize_response(self, response: 'GenerationResponse') -> bytes:
+        """
+        Serializes a GenerationResponse as JSON.
+
+        Args:
+            response (GenerationResponse): The response to serialize.
+
+        Returns:
+            bytes: The JSON representation of the response.
+        """
+        return json.dumps(response.to_dict()).encode('utf-8')
+
+    def deserialize_response(self, data: bytes) -> 'GenerationResponse':
+        """
+        Restores a GenerationResponse serialized with `serialize_response`.
+
+        Args:
+            data (bytes): The JSON representation of the response.
+
+        Returns:
+            GenerationResponse: The response.
+        """
+        return self._sdk.GenerationResponse.from_dict(json.loads(data))
+
+    def cache_info(self) -> Dict[str, int]:
+        """
+        Returns the statistics of the model handle cache.
+
+        Returns:
+            Dict[str, int]: The hits, misses, current size and maxsize of the cache.
+        """
+        return self._models.info()
+
+    def _get_model(self, prompt_config: PromptConfig) -> 'GenerativeModel':
+        """
+        Returns the Gemini model for the given PromptConfig, reusing a cached handle when the
+        same model name, system instruction, generation config and safety settings were
+        already used.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            GenerativeModel: The model bound to the prompt's system instruction, generation
+                config and safety settings.
+        """
+        key = (
+            prompt_config.model_name,
+            prompt_config.system_instruction,
+            json.dumps(prompt_config.generation_config, sort_keys=True, default=str),
+            json.dumps(prompt_config.safety_settings, sort_keys=True, default=str),
+        )
+        model = self._models.get(key)
+        if model is None:
+            model = self._sdk.GenerativeModel(
+                model_name=prompt_config.model_name,
+                system_instruction=[prompt_config.system_instruction] if prompt_config.system_instruction else [],
+                generation_config=build_generation_config(prompt_config.generation_config),
+                safety_settings=self._get_safety_settings(prompt_config.safety_settings),
+            )
+            self._models.put(key, model)
+        return model
+
+    def _prepare_request(self, prompt_config: PromptConfig) -> Tuple['GenerativeModel', list]:
+        """
+        Returns the model and the contents to send for a prompt.
+
+        With a context cache, the system instruction and the static user parts are served
+        from a cached content when possible, and only the remaining parts are sent. Prompts
+        whose system instruction is rendered from variables are always sent inline, since
+        each distinct instruction would need a cached content of its own.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Tuple[GenerativeModel, list]: The model and the content parts of the request.
+        """
+        if self.context_cache is not None and (prompt_config.static_system_instruction
+                                               or not prompt_config.system_instruction):
+            # Keep at least one user entry in the request itself.
+            static_count = max(0, min(prompt_config.static_user_parts, len(prompt_config.user) - 1))
+            if prompt_config.system_instruction or static_count:
+                static_entries = prompt_config.user[:static_count]
+                handle = self.context_cache.get(
+                    prompt_config.model_name, prompt_config.system_instruction,
+                    self._get_static_prefix_key(prompt_config, static_count),
+                    lambda: self._build_prompt(static_entries) if static_entries else [],
+                )
+                if handle is not None:
+                    return self._get_cached_model(handle, prompt_config), self._build_prompt(prompt_config.user[static_count:])
+        return self._get_model(prompt_config), self._build_prompt(prompt_config.user)
+
+    @staticmethod
+    def _get_static_prefix_key(prompt_config: PromptConfig, static_count: int) -> Optional[str]:
+        """
+        Returns the context cache key of the first `static_count` user entries: the key
+        computed once for the template, or a hash of the entries for configurations built
+        without one.
+        """
+        if not static_count:
+            return None
+        if prompt_config.static_prefix_key is not None and static_count == prompt_config.static_user_parts:
+            return prompt_config.static_prefix_key
+        payload = json.dumps([prompt_config.static_prefix_key, prompt_config.user[:static_count]], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    async def _aprepare_request(self, prompt_config: PromptConfig) -> Tuple['GenerativeModel', list]:
+        """
+        Runs `_prepare_request` in a worker thread, so that reading local media and creating
+        context caches do not block the event loop. The current context is propagated, so
+        its stages are nested under the 'generate' stage of the caller.
+        """
+        return await asyncio.to_thread(self._prepare_request, prompt_config)
+
+    def _get_cached_model(self, handle: Any, prompt_config: PromptConfig) -> 'GenerativeModel':
+        """
+        Returns a model prefixed by a cached content, reusing a handle already built for the
+        same cached content, generation config and safety settings.
+        """
+        key = (
+            'cached_content',
+            getattr(handle, 'name', None) or id(handle),
+            json.dumps(prompt_config.generation_config, sort_keys=True, default=str),
+            json.dumps(prompt_config.safety_settings, sort_keys=True, default=str),
+        )
+        model = self._models.get(key)
+        if model is None:
+            model = self.context_cache.api.model_from_cache(
+                handle,
+                generation_config=build_generation_config(prompt_config.generation_config),
+                safety_settings=self._get_safety_settings(prompt_config.safety_settings),
+            )
+            self._models.put(key, model)
+        return model
+
+    @staticmethod
+    def _get_text(response: 'GenerationResponse') -> str:
+        """
+        Returns the text of a streamed response chunk, or an empty string if it has none
+        (for example, a chunk only carrying usage metadata or a safety block).
+        """
+        try:
+            return response.text
+        except (ValueError, IndexError, AttributeError):
+            return ''
+
+    @staticmethod
+    def _final_chunk(deltas: list, response: 'GenerationResponse') -> StreamChunk:
+        """Builds the final StreamChunk of a stream from its text deltas and last response."""
+        return StreamChunk(
+            ''.join(deltas),
+            is_final=True,
+            response=response,
+            usage_metadata=getattr(response, 'usage_metadata', None),
+        )
+
     def _build_prompt(self, user_data: list) -> list:
         """
         Helper function to build the prompt string from user data.
@@ -91,7 +353,7 @@ class GeminiClient(BaseLLMClient):
             list: Constructed prompt.
         """
         # Initialize the multimodal content builder
-        builder = GeminiMultimodalContentBuilder()
+        builder = GeminiMultimodalContentBuilder(media_cache=self.media_cache, allow_local_files=self.allow_local_files)
         return builder.build_contents(user_data)
 
     def _get_safety_settings(self, safety_settings_config: list) -> list:
@@ -104,13 +366,4 @@ class GeminiClient(BaseLLMClient):
         Returns:
             list: List of SafetySetting objects for Gemini.
         """
-        safety_settings = []
-        for setting in safety_settings_config:
-            safety_settings.append(
-                SafetySetting(
-                    category=getattr(HarmCategory, setting['category']),
-                    method=getattr(SafetySetting.HarmBlockMethod, setting['method']),
-                    threshold=getattr(HarmBlockThreshold, setting['threshold'])
-                )
-            )
-        return safety_settings
+        return build_safety_settings(safety_settings_config)
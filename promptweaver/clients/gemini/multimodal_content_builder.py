@@ -14,82 +14,202 @@
  limitations under the License.
  """
 
+from concurrent.futures import ThreadPoolExecutor
 from promptweaver.core.content_builder import ContentBuilder
-from vertexai.generative_models import Part, Image
+from promptweaver.core.instrumentation import stage
+from promptweaver.core.media_cache import MediaCache
+from promptweaver.clients.gemini.sdk import load_generative_models
+from promptweaver.utils.file_utils import ByteBudget, read_file_bytes
 from promptweaver.utils.mime_utils import get_mime_type
 from promptweaver.utils.string_utils import remove_blank_spaces
-import re
+from promptweaver.utils.tree_utils import FrozenDict
+from promptweaver.utils.uri_utils import (MediaSegment, classify_media_uri, tokenize_multimodal_text,
+                                          tokenize_static_multimodal_text)
+import base64
+import os
 
 class GeminiMultimodalContentBuilder(ContentBuilder):
-    def __init__(self):
+    def __init__(self, max_workers: int = 8, max_inflight_bytes: int = 64 * 1024 * 1024,
+                 media_cache: MediaCache = None, allow_local_files: bool = False):
+        """
+        Initializes the content builder.
+
+        Args:
+            max_workers (int): Maximum number of local files read concurrently.
+            max_inflight_bytes (int): Maximum total size of the local files being read at
+                the same time. A file larger than this is read on its own.
+            media_cache (MediaCache, optional): Cache of the parts built from local files,
+                shared across builds.
+            allow_local_files (bool): Whether file:// references in multimodal text holding
+                rendered variables are read. By default only the file:// references written
+                in the template itself are read, and those in variable values, which may
+                come from untrusted data, are kept as text.
+        """
         self.contents = []
+        self._sdk = load_generative_models()
+        self.max_workers = max_workers
+        self.max_inflight_bytes = max_inflight_bytes
+        self.media_cache = media_cache
+        self.allow_local_files = allow_local_files
+        self._local_files = []
 
     def build_contents(self, user_data: list) -> list:
         """
         Builds multimodal content specific to Gemini's SDK, ensuring the order of fields is preserved.
 
+        Local image files are read concurrently on a thread pool once every other part is
+        built, and placed back at their position in the content. Cloud Storage HTTPS links
+        are sent as gs:// URIs.
+
         Args:
           user_data (list): Ordered list of user-provided data (as dictionaries).
 
         Returns:
           list: A list of `Part` objects compatible with Gemini's SDK.
         """
+        with stage('build') as record:
+            for entry in user_data:
+                # Loop through each dictionary in the user section, ensuring order
+                for modality, uri in entry.items():
+                    if entry.get(modality) == "None":
+                        continue
+                    if modality == 'image':
+                        self._add_image(uri)
+                    elif modality == 'video':
+                        self._add_video(uri)
+                    elif modality == 'audio':
+                        self._add_audio(uri)
+                    elif modality == 'document':
+                        self._add_document(uri)
+                    elif modality == 'text':
+                        self.contents.append(remove_blank_spaces(uri))
+                    elif modality == 'multimodal':
+                        # Entries of the template without variables are shared by every
+                        # render, so their segments are computed once.
+                        self._add_multimodal(uri, static=isinstance(entry, FrozenDict))
+                    else:
+                        raise ValueError(f"Unsupported modality: {modality}")
+            self._load_local_files()
+            record.set('part_count', len(self.contents))
+
+        return self.contents
+
+    @staticmethod
+    def describe_contents(user_data: list, allow_local_files: bool = False) -> list:
+        """
+        Describes the contents `build_contents` would build, without reading any file, for
+        response cache keys. Local files read by the build (image paths and file://
+        references of multimodal text) are identified by their path, modification time and
+        size, so that editing a file changes the description.
+
+        Args:
+          user_data (list): Ordered list of user-provided data (as dictionaries).
+          allow_local_files (bool): Whether the build reads file:// references of multimodal
+            text holding rendered variables, as the builder option of the same name.
+
+        Returns:
+          list: The user entries, followed by the fingerprints of the local files.
+        """
+        local_files = []
         for entry in user_data:
-            # Loop through each dictionary in the user section, ensuring order
             for modality, uri in entry.items():
-                if entry.get(modality) == "None":
-                    continue
-                if uri.startswith("https://storage.googleapis.com/"):
-                    uri = uri.replace("https://storage.googleapis.com/", "gs://")
-                if modality == 'image':
-                    self._add_image(uri)
-                elif modality == 'video':
-                    self._add_video(uri)
-                elif modality == 'audio':
-                    self._add_audio(uri)
-                elif modality == 'document':
-                    self._add_document(uri)
-                elif modality == 'text':
-                    self.contents.append(remove_blank_spaces(uri))
-                elif modality == 'multimodal':
-                    self._add_multimodal(uri)
+                if modality == 'image' and isinstance(uri, str):
+                    segments = [classify_media_uri(uri)]
+                elif modality == 'multimodal' and isinstance(uri, str) and isinstance(entry, FrozenDict):
+                    segments = tokenize_static_multimodal_text(uri)
+                elif modality == 'multimodal' and isinstance(uri, str) and allow_local_files:
+                    segments = tokenize_multimodal_text(uri)
                 else:
-                    raise ValueError(f"Unsupported modality: {modality}")
-        
-        return self.contents
+                    continue
+                for segment in segments:
+                    if segment.kind == 'file':
+                        try:
+                            stat = os.stat(segment.value)
+                            local_files.append([segment.value, stat.st_mtime_ns, stat.st_size])
+                        except OSError:
+                            local_files.append([segment.value, None, None])
+        return [user_data, local_files]
 
     def _add_image(self, image_uri: str) -> None:
-        if image_uri.startswith("gs://"):  # Check if it's a GCS URI
-            mime_type = get_mime_type(image_uri)
-            image_part = Part.from_uri(image_uri, mime_type=mime_type)
-        else:  # Assume it's a local file path
-            image_part = Image.load_from_file(image_uri)
-        self.contents.append(image_part)
+        # Local files (paths and file:// URIs) are read later by _load_local_files
+        self._add_media_segment(classify_media_uri(image_uri))
+
+    def _add_media_segment(self, segment: MediaSegment) -> None:
+        if segment.kind == 'file':
+            self._local_files.append((len(self.contents), segment.value))
+            self.contents.append(None)
+        elif segment.kind == 'data':
+            self.contents.append(self._sdk.Part.from_data(base64.b64decode(segment.value), mime_type=segment.mime_type))
+        else:
+            self.contents.append(self._sdk.Part.from_uri(segment.value, mime_type=segment.mime_type))
+
+    def _load_local_files(self) -> None:
+        """Reads the pending local files, concurrently when there are several, into their content slots."""
+        local_files, self._local_files = self._local_files, []
+        if len(local_files) == 1:
+            index, file_path = local_files[0]
+            self.contents[index] = self._load_local_image(file_path)
+        elif local_files:
+            budget = ByteBudget(self.max_inflight_bytes)
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(local_files))) as executor:
+                futures = [(index, executor.submit(self._load_local_image, file_path, budget))
+                           for index, file_path in local_files]
+                for index, future in futures:
+                    self.contents[index] = future.result()
+
+    def _load_local_image(self, file_path: str, budget: ByteBudget = None):
+        mime_type = get_mime_type(file_path)
+        size = os.path.getsize(file_path)
+        if budget is not None:
+            budget.acquire(size)
+        try:
+            if mime_type is None:
+                # Let the SDK detect the format of files with an unknown extension.
+                return self._sdk.Image.from_bytes(read_file_bytes(file_path))
+            if self.media_cache is not None:
+                return self.media_cache.get_part(
+                    file_path,
+                    mime_type,
+                    build_inline=lambda data: self._sdk.Part.from_data(data, mime_type=mime_type),
+                    build_uri=lambda uri: self._sdk.Part.from_uri(uri, mime_type=mime_type),
+                )
+            return self._sdk.Part.from_data(read_file_bytes(file_path), mime_type=mime_type)
+        finally:
+            if budget is not None:
+                budget.release(size)
+
+    def _add_uri_media(self, uri: str) -> None:
+        segment = classify_media_uri(uri)
+        if segment.kind == 'data':
+            self._add_media_segment(segment)
+        else:
+            # Other media are referenced by URI, local paths included.
+            uri = segment.value if segment.kind == 'gcs' else uri
+            self.contents.append(self._sdk.Part.from_uri(uri, mime_type=get_mime_type(uri)))
 
     def _add_video(self, video_uri: str) -> None:
-        mime_type = get_mime_type(video_uri)
-        video_part = Part.from_uri(video_uri, mime_type=mime_type)
-        self.contents.append(video_part)
+        self._add_uri_media(video_uri)
 
     def _add_audio(self, audio_uri: str) -> None:
-        mime_type = get_mime_type(audio_uri)
-        audio_part = Part.from_uri(audio_uri, mime_type=mime_type)
-        self.contents.append(audio_part)
+        self._add_uri_media(audio_uri)
 
     def _add_document(self, document_uri: str) -> None:
-        mime_type = get_mime_type(document_uri)
-        document_part = Part.from_uri(document_uri, mime_type=mime_type)
-        self.contents.append(document_part)
-
-    def _add_multimodal(self, multimodal_text: str) -> None:
-        multimodal_text = multimodal_text.replace("gs://", "https://storage.googleapis.com/")
-        pattern = r"(https://storage\.googleapis\.com/[^\s]+)"
-        parts = re.split(pattern, multimodal_text)
-        for part in parts:
-            if part.strip():
-                if re.match(pattern, part):
-                    mime_type = get_mime_type(part)
-                    seg = Part.from_uri(part, mime_type=mime_type)
-                else:
-                    seg = remove_blank_spaces(part)
-                self.contents.append(seg)
+        self._add_uri_media(document_uri)
+
+    def _add_multimodal(self, multimodal_text: str, static: bool = False) -> None:
+        tokenize = tokenize_static_multimodal_text if static else tokenize_multimodal_text
+        read_local_files = static or self.allow_local_files
+        text = []
+        for segment in tokenize(multimodal_text):
+            if segment.kind == 'text':
+                text.append(segment.value)
+            elif segment.kind == 'file' and not (read_local_files and os.path.isfile(segment.value)):
+                # file:// references to missing files, or rendered from variables, are kept as text.
+                text.append(segment.reference)
+            else:
+                if text:
+                    self.contents.append(' '.join(text))
+                    text = []
+                self._add_media_segment(segment)
+        if text:
+            self.contents.append(' '.join(text))
@@ -0,0 +1,33 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+# The Vertex AI SDK takes seconds to import. It is only loaded when a Gemini client or
+# content builder is created, so that importing promptweaver stays cheap for code that
+# only works with templates.
+
+from types import ModuleType
+
+
+def load_vertexai() -> ModuleType:
+    """Imports and returns the `vertexai` module."""
+    import vertexai
+    return vertexai
+
+
+def load_generative_models() -> ModuleType:
+    """Imports and returns the `vertexai.generative_models` module."""
+    from vertexai import generative_models
+    return generative_models
@@ -15,8 +15,90 @@
  """
 
 from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+import asyncio
+import json
 from promptweaver.core.prompt_template import PromptConfig
 
+
+@dataclass
+class BatchResult:
+    """
+    Outcome of one prompt of a batch.
+
+    Attributes:
+        index (int): Position of the prompt in the input batch.
+        prompt_config (PromptConfig): The prompt configuration.
+        response (Any): The generated content, or None if the generation failed.
+        error (Optional[BaseException]): The exception raised by the generation, if any.
+    """
+    index: int
+    prompt_config: PromptConfig
+    response: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the generation succeeded."""
+        return self.error is None
+
+
+@dataclass
+class StreamChunk:
+    """
+    Piece of a streamed generation.
+
+    Every chunk but the last carries a text delta. The last chunk has `is_final` set,
+    the full generated text, the final response and its usage metadata.
+
+    Attributes:
+        text (str): The text delta, or the full text for the final chunk.
+        is_final (bool): Whether this is the aggregated final chunk.
+        response (Any): The final response of the LLM SDK (final chunk only).
+        usage_metadata (Any): The token usage reported for the generation (final chunk only).
+    """
+    text: str
+    is_final: bool = False
+    response: Any = None
+    usage_metadata: Any = None
+
+
+# Maximum number of prompts started ahead of the oldest unyielded one, per concurrent
+# generation, in an ordered batch. Results completed ahead of a slow prompt are buffered.
+ORDERED_BATCH_WINDOW = 4
+
+
+class _BatchWindow:
+    """Tracks the results of a batch, and how many more prompts can be started."""
+
+    def __init__(self, max_concurrency: int, ordered: bool) -> None:
+        self.max_concurrency = max_concurrency
+        self.ordered = ordered
+        self.limit = max_concurrency * ORDERED_BATCH_WINDOW if ordered else max_concurrency
+        self.next_index = 0
+        self.buffered: Dict[int, BatchResult] = {}
+
+    def complete(self, results: Iterable[BatchResult]) -> List[BatchResult]:
+        """Records completed results, and returns those that can be yielded, in order."""
+        results = sorted(results, key=lambda result: result.index)
+        if not self.ordered:
+            return results
+        for result in results:
+            self.buffered[result.index] = result
+        ready = []
+        while self.next_index in self.buffered:
+            ready.append(self.buffered.pop(self.next_index))
+            self.next_index += 1
+        return ready
+
+    def free(self, in_flight: int) -> int:
+        """Returns how many prompts can be started while `in_flight` are running."""
+        return max(0, min(self.max_concurrency - in_flight, self.limit - in_flight - len(self.buffered)))
+
+
 class BaseLLMClient(ABC):
     @abstractmethod
     def generate_content(self, prompt_config: PromptConfig) -> str:
@@ -43,3 +125,198 @@ class BaseLLMClient(ABC):
             bool: True if valid, False otherwise.
         """
         pass
+
+    async def agenerate_content(self, prompt_config: PromptConfig) -> Any:
+        """
+        Asynchronously generates content based on the provided PromptConfig.
+
+        Clients backed by an SDK with native async support should override this method.
+        The default implementation runs `generate_content` in the event loop's executor.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Any: The generated content from the LLM.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.generate_content, prompt_config)
+
+    def get_cache_key_contents(self, prompt_config: PromptConfig) -> Any:
+        """
+        Returns a JSON-serializable representation of the content sent for a prompt,
+        used to build response cache keys.
+
+        Clients should override this method when the content they send depends on more
+        than the user section, for example on local files. It is called before every
+        cached generation, so it should describe the content without building it. The
+        default implementation returns the user section.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Any: The content of the request.
+        """
+        return prompt_config.user
+
+    def serialize_response(self, response: Any) -> bytes:
+        """
+        Serializes a response so that it can be stored by a persistent response cache.
+
+        The default implementation stores JSON values (strings, numbers, lists and
+        dictionaries). Clients returning other objects must override this method and
+        `deserialize_response` with a format that does not run code when it is loaded,
+        since persistent caches can be shared by several processes.
+
+        Args:
+            response (Any): A response returned by `generate_content`.
+
+        Returns:
+            bytes: The serialized response.
+
+        Raises:
+            TypeError: If the response is not a JSON value.
+        """
+        try:
+            return json.dumps(response).encode('utf-8')
+        except (TypeError, ValueError) as e:
+            raise TypeError(
+                f"{type(self).__name__} cannot serialize {type(response).__name__} responses for a persistent "
+                "response cache: override serialize_response and deserialize_response."
+            ) from e
+
+    def deserialize_response(self, data: bytes) -> Any:
+        """
+        Restores a response serialized with `serialize_response`.
+
+        Args:
+            data (bytes): The serialized response.
+
+        Returns:
+            Any: The response.
+
+        Raises:
+            ValueError: If the data is not valid JSON.
+        """
+        return json.loads(data)
+
+    def stream_content(self, prompt_config: PromptConfig) -> Iterator[StreamChunk]:
+        """
+        Generates content and yields it as it is produced.
+
+        Clients whose SDK supports streaming should override this method. The default
+        implementation yields the whole response of `generate_content` as a single delta.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Yields:
+            StreamChunk: Text deltas, then a final aggregated chunk.
+        """
+        response = self.generate_content(prompt_config)
+        text = getattr(response, 'text', response)
+        yield StreamChunk(text)
+        yield StreamChunk(text, is_final=True, response=response, usage_metadata=getattr(response, 'usage_metadata', None))
+
+    async def astream_content(self, prompt_config: PromptConfig) -> AsyncIterator[StreamChunk]:
+        """
+        Asynchronously generates content and yields it as it is produced.
+
+        Clients whose SDK supports streaming should override this method. The default
+        implementation yields the whole response of `agenerate_content` as a single delta.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Yields:
+            StreamChunk: Text deltas, then a final aggregated chunk.
+        """
+        response = await self.agenerate_content(prompt_config)
+        text = getattr(response, 'text', response)
+        yield StreamChunk(text)
+        yield StreamChunk(text, is_final=True, response=response, usage_metadata=getattr(response, 'usage_metadata', None))
+
+    def generate_batch(self, prompt_configs: Iterable[PromptConfig], max_concurrency: int = 8,
+                       ordered: bool = True) -> Iterator[BatchResult]:
+        """
+        Generates content for many prompts on a pool of threads.
+
+        At most `max_concurrency` prompts are in flight at any time and the input is consumed
+        lazily, so arbitrarily long iterables can be processed with bounded memory. A failing
+        prompt does not abort the batch: its exception is captured in the BatchResult.
+
+        Args:
+            prompt_configs (Iterable[PromptConfig]): The prompt configurations.
+            max_concurrency (int): Maximum number of concurrent generations.
+            ordered (bool): Whether to yield results in input order. When False, results are
+                yielded as soon as they complete. When True, a new prompt is still started
+                whenever any generation completes: results completed ahead of a slower one
+                are buffered, up to ORDERED_BATCH_WINDOW times max_concurrency prompts.
+
+        Yields:
+            BatchResult: The outcome of each prompt.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+
+        def run(index: int, prompt_config: PromptConfig) -> BatchResult:
+            try:
+                return BatchResult(index, prompt_config, response=self.generate_content(prompt_config))
+            except Exception as e:
+                return BatchResult(index, prompt_config, error=e)
+
+        prompts = enumerate(prompt_configs)
+        window = _BatchWindow(max_concurrency, ordered)
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            pending = {executor.submit(run, index, config) for index, config in islice(prompts, window.free(0))}
+            try:
+                while pending:
+                    completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    ready = window.complete(future.result() for future in completed)
+                    pending.update(executor.submit(run, index, config) for index, config in islice(prompts, window.free(len(pending))))
+                    yield from ready
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    async def agenerate_batch(self, prompt_configs: Iterable[PromptConfig], max_concurrency: int = 8,
+                              ordered: bool = True) -> AsyncIterator[BatchResult]:
+        """
+        Asynchronously generates content for many prompts with `agenerate_content`.
+
+        At most `max_concurrency` prompts are in flight at any time and the input is consumed
+        lazily. A failing prompt does not abort the batch: its exception is captured in the
+        BatchResult.
+
+        Args:
+            prompt_configs (Iterable[PromptConfig]): The prompt configurations.
+            max_concurrency (int): Maximum number of concurrent generations.
+            ordered (bool): Whether to yield results in input order, as in `generate_batch`.
+                When False, results are yielded as soon as they complete.
+
+        Yields:
+            BatchResult: The outcome of each prompt.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+
+        async def run(index: int, prompt_config: PromptConfig) -> BatchResult:
+            try:
+                return BatchResult(index, prompt_config, response=await self.agenerate_content(prompt_config))
+            except Exception as e:
+                return BatchResult(index, prompt_config, error=e)
+
+        prompts = enumerate(prompt_configs)
+        window = _BatchWindow(max_concurrency, ordered)
+        pending = {asyncio.ensure_future(run(index, config)) for index, config in islice(prompts, window.free(0))}
+        try:
+            while pending:
+                completed, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                ready = window.complete(task.result() for task in completed)
+                pending.update(asyncio.ensure_future(run(index, config)) for index, config in islice(prompts, window.free(len(pending))))
+                for result in ready:
+                    yield result
+        finally:
+            for task in pending:
+                task.cancel()
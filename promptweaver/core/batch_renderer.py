@@ -0,0 +1,339 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+import csv
+import json
+import os
+from promptweaver.core.out_of_band import OutOfBandVariables
+from promptweaver.core.param_validator import ParamValidationError
+from promptweaver.core.prompt_template import PromptConfig, PromptTemplate
+
+# A row source: an iterable of parameter dictionaries, a path to a .csv, .jsonl or
+# .parquet file, a mapping of column names to equal-length sequences, a pandas DataFrame
+# or a pyarrow Table or ParquetFile.
+RowSource = Union[str, Iterable[Mapping[str, Any]], Mapping[str, Iterable[Any]], Any]
+
+# Converts a rendered PromptConfig into the object emitted by the batch renderer.
+PayloadBuilder = Callable[[PromptConfig], Any]
+
+
+def iter_row_chunks(source: RowSource, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Reads parameter rows from a source in chunks, holding a single chunk in memory.
+
+    Args:
+        source (RowSource): The rows. Files are recognized by their extension: '.csv'
+            (header row required, values are strings), '.jsonl' or '.ndjson' (one JSON
+            object per line) and '.parquet' (requires pyarrow).
+        chunk_size (int): Maximum number of rows per chunk.
+
+    Yields:
+        List[Dict[str, Any]]: The rows of each chunk, in source order.
+
+    Raises:
+        ValueError: If the source type or file extension is not supported.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}.")
+    if isinstance(source, (str, os.PathLike)):
+        yield from _iter_file_chunks(os.fspath(source), chunk_size)
+    elif hasattr(source, 'iter_batches'):  # pyarrow.parquet.ParquetFile
+        for batch in source.iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+    elif hasattr(source, 'to_batches'):  # pyarrow.Table
+        for batch in source.to_batches(max_chunksize=chunk_size):
+            yield batch.to_pylist()
+    elif hasattr(source, 'iloc') and hasattr(source, 'to_dict'):  # pandas.DataFrame
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[start:start + chunk_size].to_dict('records')
+    elif isinstance(source, Mapping):
+        columns = list(source)
+        yield from _chunk((dict(zip(columns, values)) for values in zip(*source.values())), chunk_size)
+    elif isinstance(source, Iterable):
+        yield from _chunk(source, chunk_size)
+    else:
+        raise ValueError(f"Unsupported row source: {type(source).__name__}.")
+
+
+def _iter_file_chunks(file_path: str, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.csv':
+        with open(file_path, newline='', encoding='utf-8') as file:
+            yield from _chunk(csv.DictReader(file), chunk_size)
+    elif extension in ('.jsonl', '.ndjson'):
+        with open(file_path, encoding='utf-8') as file:
+            yield from _chunk((json.loads(line) for line in file if line.strip()), chunk_size)
+    elif extension == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading Parquet files requires the pyarrow package: pip install pyarrow") from e
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+    else:
+        raise ValueError(f"Unsupported row file extension '{extension}'. Use .csv, .jsonl, .ndjson or .parquet.")
+
+
+def _chunk(rows: Iterable[Mapping[str, Any]], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(rows)
+    while True:
+        chunk = [dict(row) for row in islice(iterator, chunk_size)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_jsonl(records: Iterable[Any], output_path: str) -> int:
+    """
+    Writes records as JSON lines, streaming them to the file.
+
+    Args:
+        records (Iterable[Any]): JSON-serializable records.
+        output_path (str): The output file path.
+
+    Returns:
+        int: The number of lines written.
+    """
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False, default=str))
+            file.write('\n')
+            count += 1
+    return count
+
+
+def write_jsonl_shards(records: Iterable[Any], output_dir: str, prefix: str = 'part', shard_size: int = 100000) -> List[str]:
+    """
+    Writes records as JSON lines, starting a new file every `shard_size` records.
+
+    Shards are named '<prefix>-00000.jsonl', '<prefix>-00001.jsonl', and so on. Records
+    are streamed, so a single record is held in memory at a time.
+
+    Args:
+        records (Iterable[Any]): JSON-serializable records.
+        output_dir (str): The directory the shards are written to. It is created if needed.
+        prefix (str): Prefix of the shard file names.
+        shard_size (int): Maximum number of records per shard.
+
+    Returns:
+        List[str]: The paths of the written shards, in order.
+    """
+    if shard_size < 1:
+        raise ValueError(f"shard_size must be at least 1, got {shard_size}.")
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    file = None
+    count = 0
+    try:
+        for record in records:
+            if count % shard_size == 0:
+                if file is not None:
+                    file.close()
+                paths.append(os.path.join(output_dir, f'{prefix}-{len(paths):05d}.jsonl'))
+                file = open(paths[-1], 'w', encoding='utf-8')
+            file.write(json.dumps(record, ensure_ascii=False, default=str))
+            file.write('\n')
+            count += 1
+    finally:
+        if file is not None:
+            file.close()
+    return paths
+
+
+# Per-process state of the worker processes, set by _init_worker.
+_worker_template: Optional[PromptTemplate] = None
+_worker_payload_builder: Optional[PayloadBuilder] = None
+
+
+def _init_worker(file_path: str, structural: bool, payload_builder: Optional[PayloadBuilder],
+                 out_of_band: Optional[OutOfBandVariables] = None) -> None:
+    global _worker_template, _worker_payload_builder
+    _worker_template = PromptTemplate.from_file(file_path, structural=structural)
+    _worker_template.out_of_band = out_of_band
+    _worker_payload_builder = payload_builder
+
+
+def _render_chunk_in_worker(start: int, rows: List[Dict[str, Any]], skip_errors: bool, validate: bool) -> Tuple[list, list]:
+    return _render_chunk(_worker_template, _worker_payload_builder, start, rows, skip_errors, validate)
+
+
+def _render_chunk(template: PromptTemplate, payload_builder: Optional[PayloadBuilder], start: int,
+                  rows: List[Dict[str, Any]], skip_errors: bool, validate: bool = False) -> Tuple[list, list]:
+    """Renders a chunk of rows, returning the (row index, output) and the (row index, error) of failed rows."""
+    outputs, errors = [], []
+    validate = validate and not template.validator.is_trivial
+    for index, row in enumerate(rows, start):
+        try:
+            if validate:
+                invalid = template.check_params(row)
+                if invalid:
+                    raise ParamValidationError(invalid)
+            prompt_config = template.render(row)
+            outputs.append((index, payload_builder(prompt_config) if payload_builder is not None else prompt_config))
+        except Exception as e:
+            if not skip_errors:
+                raise ValueError(f"Row {index}: {e}") from e
+            errors.append((index, f"{type(e).__name__}: {e}"))
+    return outputs, errors
+
+
+class BatchRenderer:
+    """
+    Renders one template for every row of a tabular source.
+
+    The template is compiled once. Rows are read and rendered chunk by chunk, so memory
+    stays bounded by `chunk_size` rows (times the number of chunks in flight when
+    rendering on a process pool), whatever the size of the source. Outputs are yielded
+    in row order.
+
+    With `processes`, chunks are rendered on a pool of worker processes, each compiling
+    the template once from its file. This pays off for CPU-bound templates (heavy loops,
+    filters or large renders); the rows and the outputs are pickled between processes.
+
+    Attributes:
+        template (PromptTemplate): The template rendered for every row.
+        errors (List[Tuple[int, str]]): The index and error of the rows skipped by the
+            last run, when `skip_errors` is enabled.
+        rendered (int): Number of rows rendered by the last run.
+    """
+
+    def __init__(self, template: Union[str, PromptTemplate], chunk_size: int = 1000, processes: Optional[int] = None,
+                 skip_errors: bool = False, structural: bool = True, validate: bool = False) -> None:
+        """
+        Initializes the batch renderer.
+
+        Args:
+            template (Union[str, PromptTemplate]): The template, or the path to its .yml.j2 file.
+            chunk_size (int): Number of rows read and rendered at a time.
+            processes (int, optional): Number of worker processes. Rows are rendered in the
+                calling process when None or 0.
+            skip_errors (bool): Whether rows that fail to render are skipped and recorded in
+                `errors`, instead of stopping the run.
+            structural (bool): Whether to use structural rendering when the template allows it.
+            validate (bool): Whether every row is checked against the 'variables' section of
+                the template before it is rendered. Invalid rows fail, or are skipped with
+                `skip_errors`, without being rendered.
+
+        Raises:
+            ValueError: If processes are requested for a template that has no file.
+        """
+        if isinstance(template, str):
+            template = PromptTemplate.from_file(template, structural=structural)
+        if processes and not os.path.isfile(template.file_path):
+            raise ValueError(f"Rendering on a process pool requires a template file, got '{template.file_path}'.")
+        self.template = template
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.skip_errors = skip_errors
+        self.validate = validate
+        self.errors: List[Tuple[int, str]] = []
+        self.rendered = 0
+
+    def render(self, source: RowSource) -> Iterator[PromptConfig]:
+        """
+        Renders the template for every row of a source.
+
+        Args:
+            source (RowSource): The parameter rows.
+
+        Yields:
+            PromptConfig: The rendered prompt configurations, in row order.
+
+        Raises:
+            ValueError: If a row fails to render and `skip_errors` is disabled.
+        """
+        return (output for _, output in self._run(source, None))
+
+    def iter_payloads(self, source: RowSource, payload_builder: PayloadBuilder) -> Iterator[Any]:
+        """
+        Renders every row and converts each PromptConfig into a request payload.
+
+        Args:
+            source (RowSource): The parameter rows.
+            payload_builder (PayloadBuilder): Converts a PromptConfig into a payload, for
+                example `promptweaver.clients.gemini.batch_request.build_batch_request`. It
+                must be a module-level function when rendering on a process pool.
+
+        Yields:
+            Any: The payloads, in row order.
+        """
+        return (output for _, output in self._run(source, payload_builder))
+
+    def iter_indexed_payloads(self, source: RowSource, payload_builder: Optional[PayloadBuilder] = None) -> Iterator[Tuple[int, Any]]:
+        """
+        Like `iter_payloads`, but also yields the index of the row of each payload, so that
+        outputs can be matched with their rows when `skip_errors` drops some of them.
+
+        Args:
+            source (RowSource): The parameter rows.
+            payload_builder (PayloadBuilder, optional): Converts a PromptConfig into a
+                payload. PromptConfig objects are yielded when None.
+
+        Yields:
+            Tuple[int, Any]: The zero-based row index and the payload, in row order.
+        """
+        return self._run(source, payload_builder)
+
+    def write_jsonl(self, source: RowSource, output_path: str, payload_builder: PayloadBuilder) -> int:
+        """
+        Renders every row and writes the payloads to a JSON lines file.
+
+        Args:
+            source (RowSource): The parameter rows.
+            output_path (str): The output file path.
+            payload_builder (PayloadBuilder): Converts a PromptConfig into a JSON-serializable payload.
+
+        Returns:
+            int: The number of lines written.
+        """
+        return write_jsonl(self.iter_payloads(source, payload_builder), output_path)
+
+    def _run(self, source: RowSource, payload_builder: Optional[PayloadBuilder]) -> Iterator[Tuple[int, Any]]:
+        self.errors = []
+        self.rendered = 0
+        results = self._render_chunks(iter_row_chunks(source, self.chunk_size), payload_builder)
+        for outputs, errors in results:
+            self.rendered += len(outputs)
+            self.errors.extend(errors)
+            yield from outputs
+
+    def _render_chunks(self, chunks: Iterator[List[Dict[str, Any]]],
+                       payload_builder: Optional[PayloadBuilder]) -> Iterator[Tuple[list, list]]:
+        if not self.processes:
+            start = 0
+            for rows in chunks:
+                yield _render_chunk(self.template, payload_builder, start, rows, self.skip_errors, self.validate)
+                start += len(rows)
+            return
+
+        with ProcessPoolExecutor(self.processes, initializer=_init_worker,
+                                 initargs=(self.template.file_path, self.template.structural, payload_builder,
+                                           self.template.out_of_band)) as executor:
+            # Keep two chunks per worker in flight, so memory stays bounded on large sources.
+            pending = deque()
+            start = 0
+            for rows in chunks:
+                pending.append(executor.submit(_render_chunk_in_worker, start, rows, self.skip_errors, self.validate))
+                start += len(rows)
+                if len(pending) >= 2 * self.processes:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
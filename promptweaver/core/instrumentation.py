@@ -0,0 +1,338 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+# Pipeline stages reported by PromptWeaver:
+#   load      reading and compiling a .yml.j2 file (or fetching it from the template cache)
+#   render    evaluating the Jinja2 template
+#   parse     parsing rendered YAML
+#   validate  validating the user section of a PromptConfig
+#   build     converting the user section to model content parts
+#   generate  calling the model
+
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+import time
+
+
+class StageRecord:
+    """
+    A single execution of a pipeline stage. It is the context manager returned by
+    `Instrumentation.stage`.
+
+    Attributes:
+        name (str): The stage name ('load', 'render', 'parse', 'validate', 'build' or 'generate').
+        attributes (Dict[str, Any]): Details of the execution, such as 'template',
+            'rendered_bytes', 'part_count', 'model' or the token counts.
+        start (float): `time.perf_counter()` when the stage started.
+        duration (float): Duration of the stage, in seconds.
+        error (Optional[BaseException]): The exception raised by the stage, if any.
+        state (Dict[Any, Any]): Per-instrumentation state, such as an OpenTelemetry span.
+        current (bool): Whether the stage is made the current context (for example, the
+            parent of the spans started while it runs). Stages spanning the `yield` of a
+            generator are not, since they may end in another context.
+    """
+
+    __slots__ = ('instrumentation', 'name', 'attributes', 'start', 'duration', 'error', 'state', 'current')
+
+    # Lets callers skip computing costly attributes when instrumentation is disabled.
+    recording = True
+
+    def __init__(self, instrumentation: 'Instrumentation', name: str, attributes: Dict[str, Any],
+                 current: bool = True) -> None:
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+        self.duration = 0.0
+        self.error = None
+        self.state = {}
+        self.current = current
+
+    def set(self, key: str, value: Any) -> None:
+        """Records an attribute of the stage."""
+        self.attributes[key] = value
+
+    def record_usage(self, response: Any) -> None:
+        """
+        Records the token counts of a model response.
+
+        Args:
+            response (Any): A response exposing `usage_metadata` with `prompt_token_count`,
+                `candidates_token_count` and `total_token_count`, such as Gemini's
+                GenerationResponse.
+        """
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        for field, key in (('prompt_token_count', 'prompt_tokens'),
+                           ('candidates_token_count', 'candidates_tokens'),
+                           ('cached_content_token_count', 'cached_tokens'),
+                           ('total_token_count', 'total_tokens')):
+            value = getattr(usage, field, None)
+            if value is not None:
+                self.attributes[key] = value
+
+    def __enter__(self) -> 'StageRecord':
+        self.start = time.perf_counter()
+        self.instrumentation.on_stage_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.duration = time.perf_counter() - self.start
+        if isinstance(exc_value, GeneratorExit):
+            # A consumer stopped iterating a generator stage early, which is not an error.
+            self.attributes['stopped_early'] = True
+            exc_value = None
+        self.error = exc_value
+        self.instrumentation.on_stage_end(self)
+        return False
+
+
+class _NullStageRecord:
+    """The shared, stateless stage returned when instrumentation is disabled."""
+
+    __slots__ = ()
+    recording = False
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def record_usage(self, response: Any) -> None:
+        pass
+
+    def __enter__(self) -> '_NullStageRecord':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+_NULL_STAGE = _NullStageRecord()
+
+
+class Instrumentation:
+    """
+    Base class of the instrumentation backends.
+
+    Subclasses override `on_stage_start` and `on_stage_end`, which are called around
+    every instrumented stage of the pipeline with its StageRecord.
+    """
+
+    def stage(self, name: str, current: bool = True, **attributes: Any) -> StageRecord:
+        """
+        Returns a context manager measuring one execution of a pipeline stage.
+
+        Args:
+            name (str): The stage name.
+            current (bool): Whether the stage is made the current context while it runs.
+                Must be False for stages spanning the `yield` of a generator.
+            **attributes: Attributes known when the stage starts.
+
+        Returns:
+            StageRecord: The stage record, to use in a `with` statement.
+        """
+        return StageRecord(self, name, attributes, current)
+
+    def on_stage_start(self, record: StageRecord) -> None:
+        """Called when a stage starts."""
+
+    def on_stage_end(self, record: StageRecord) -> None:
+        """Called when a stage ends, with its duration, attributes and error set."""
+
+
+class NullInstrumentation(Instrumentation):
+    """Instrumentation that records nothing. This is the default."""
+
+    def stage(self, name: str, current: bool = True, **attributes: Any) -> _NullStageRecord:
+        return _NULL_STAGE
+
+
+class CallbackInstrumentation(Instrumentation):
+    """Calls a function with the StageRecord of every completed stage."""
+
+    def __init__(self, callback: Callable[[StageRecord], None]) -> None:
+        """
+        Args:
+            callback (Callable[[StageRecord], None]): Called when each stage ends.
+        """
+        self.callback = callback
+
+    def on_stage_end(self, record: StageRecord) -> None:
+        self.callback(record)
+
+
+class TimingCollector(Instrumentation):
+    """
+    Keeps the most recent stage records in memory and summarizes their durations.
+
+    Attributes:
+        records (deque): The most recent StageRecords, oldest first.
+    """
+
+    def __init__(self, max_records: int = 10000) -> None:
+        """
+        Args:
+            max_records (int): Maximum number of stage records kept.
+        """
+        self.records = deque(maxlen=max_records)
+        self._lock = Lock()
+
+    def on_stage_end(self, record: StageRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def get_records(self, name: Optional[str] = None) -> List[StageRecord]:
+        """
+        Returns the collected records, optionally only those of one stage.
+
+        Args:
+            name (str, optional): The stage name.
+
+        Returns:
+            List[StageRecord]: The records, oldest first.
+        """
+        with self._lock:
+            return [record for record in self.records if name is None or record.name == name]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarizes the durations of the collected records per stage.
+
+        Returns:
+            Dict[str, Dict[str, float]]: For each stage, the number of executions, the
+                number of errors, and the total, mean and maximum durations in milliseconds.
+        """
+        summary = {}
+        for record in self.get_records():
+            stats = summary.setdefault(record.name, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            duration_ms = record.duration * 1000
+            stats['count'] += 1
+            stats['errors'] += record.error is not None
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+        for stats in summary.values():
+            stats['mean_ms'] = stats['total_ms'] / stats['count']
+        return summary
+
+    def reset(self) -> None:
+        """Discards the collected records."""
+        with self._lock:
+            self.records.clear()
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """
+    Emits an OpenTelemetry span named 'promptweaver.<stage>' for every stage.
+
+    Requires the `opentelemetry-api` package. Stage attributes are set on the spans as
+    'promptweaver.<attribute>', and stages raising an exception get an error status.
+    Spans of the stages created with `current=False`, such as streamed generations, are
+    children of the current span but never become the current span themselves.
+    """
+
+    def __init__(self, tracer: Any = None) -> None:
+        """
+        Args:
+            tracer (opentelemetry.trace.Tracer, optional): The tracer to use. Defaults to
+                the 'promptweaver' tracer of the global tracer provider.
+
+        Raises:
+            ImportError: If OpenTelemetry is not installed.
+        """
+        try:
+            from opentelemetry import context, trace
+        except ImportError as e:
+            raise ImportError(
+                "OpenTelemetry instrumentation requires the opentelemetry-api package: "
+                "pip install opentelemetry-api"
+            ) from e
+        self._context = context
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer('promptweaver')
+
+    @staticmethod
+    def _span_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            f'promptweaver.{key}': value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in attributes.items() if value is not None
+        }
+
+    def on_stage_start(self, record: StageRecord) -> None:
+        span = self.tracer.start_span(f'promptweaver.{record.name}', attributes=self._span_attributes(record.attributes))
+        token = self._context.attach(self._trace.set_span_in_context(span)) if record.current else None
+        record.state[self] = (span, token)
+
+    def on_stage_end(self, record: StageRecord) -> None:
+        span, token = record.state.pop(self)
+        span.set_attributes(self._span_attributes(record.attributes))
+        if record.error is not None:
+            span.record_exception(record.error)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(record.error)))
+        if token is not None:
+            self._context.detach(token)
+        span.end()
+
+
+class MultiInstrumentation(Instrumentation):
+    """Forwards every stage to several instrumentations, for example timing and tracing."""
+
+    def __init__(self, *instrumentations: Instrumentation) -> None:
+        self.instrumentations = instrumentations
+
+    def on_stage_start(self, record: StageRecord) -> None:
+        for instrumentation in self.instrumentations:
+            instrumentation.on_stage_start(record)
+
+    def on_stage_end(self, record: StageRecord) -> None:
+        for instrumentation in reversed(self.instrumentations):
+            instrumentation.on_stage_end(record)
+
+
+_instrumentation: Instrumentation = NullInstrumentation()
+
+
+def set_instrumentation(instrumentation: Optional[Instrumentation] = None) -> None:
+    """
+    Sets the process-wide instrumentation.
+
+    Args:
+        instrumentation (Instrumentation, optional): The instrumentation to use, or None to
+            disable instrumentation.
+    """
+    global _instrumentation
+    _instrumentation = instrumentation or NullInstrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    """Returns the process-wide instrumentation."""
+    return _instrumentation
+
+
+def stage(name: str, current: bool = True, **attributes: Any) -> StageRecord:
+    """
+    Returns a context manager measuring a pipeline stage with the process-wide instrumentation.
+
+    Args:
+        name (str): The stage name.
+        current (bool): Whether the stage is made the current context while it runs. Must
+            be False for stages spanning the `yield` of a generator.
+        **attributes: Attributes known when the stage starts.
+
+    Returns:
+        StageRecord: The stage record, to use in a `with` statement.
+    """
+    return _instrumentation.stage(name, current, **attributes)
@@ -0,0 +1,222 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+import hashlib
+import mimetypes
+import os
+from promptweaver.utils.file_utils import read_file_bytes
+from promptweaver.utils.lru_cache import ByteSizedLRUCache, LRUCache
+
+
+class ObjectStore(ABC):
+    """Storage that local media can be uploaded to once and then referenced by URI."""
+
+    @abstractmethod
+    def upload(self, data: bytes, name: str, mime_type: str) -> str:
+        """
+        Stores data under name unless an object with that name already exists.
+
+        Args:
+            data (bytes): The media content.
+            name (str): The object name, derived from the content hash.
+            mime_type (str): The MIME type of the media.
+
+        Returns:
+            str: The URI of the stored object.
+        """
+        pass
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    Stand-in object store writing objects to a local directory, for tests and offline runs.
+
+    The returned URIs are built from `uri_prefix`, so they look like the URIs of the real
+    store (for example 'gs://my-bucket/media/<hash>.png'), but nothing is uploaded.
+    """
+
+    def __init__(self, root_dir: str, uri_prefix: str = 'gs://promptweaver-media') -> None:
+        """
+        Args:
+            root_dir (str): The directory the objects are written to.
+            uri_prefix (str): Prefix of the returned URIs.
+        """
+        self.root_dir = root_dir
+        self.uri_prefix = uri_prefix.rstrip('/')
+        self.uploads = 0
+        os.makedirs(root_dir, exist_ok=True)
+
+    def upload(self, data: bytes, name: str, mime_type: str) -> str:
+        path = os.path.join(self.root_dir, name)
+        if not os.path.exists(path):
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+            self.uploads += 1
+        return f'{self.uri_prefix}/{name}'
+
+
+class GCSObjectStore(ObjectStore):
+    """Uploads media to a Google Cloud Storage bucket. Requires the google-cloud-storage package."""
+
+    def __init__(self, bucket_name: str, prefix: str = 'promptweaver-media/', client: Any = None) -> None:
+        """
+        Args:
+            bucket_name (str): The bucket name.
+            prefix (str): Prefix of the object names.
+            client (google.cloud.storage.Client, optional): The storage client. Defaults to
+                a client using the default credentials.
+        """
+        if client is None:
+            from google.cloud import storage
+            client = storage.Client()
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._bucket = client.bucket(bucket_name)
+
+    def upload(self, data: bytes, name: str, mime_type: str) -> str:
+        blob = self._bucket.blob(self.prefix + name)
+        if not blob.exists():
+            blob.upload_from_string(data, content_type=mime_type)
+        return f'gs://{self.bucket_name}/{self.prefix}{name}'
+
+
+class MediaCache:
+    """
+    Content-addressed cache of the parts built from local media files.
+
+    A file is first looked up by (path, modification time, size), which costs a single
+    stat. When that misses (a new path, or a file touched or rewritten), the file is read
+    and hashed, and the part built for the same content and MIME type is reused if there
+    is one. Parts are kept in an LRU bounded by the total size of the media they hold.
+
+    With an object store, files of at least `upload_threshold` bytes are uploaded once and
+    their parts reference the uploaded URI instead of embedding the bytes, which keeps
+    request payloads small. Such parts only count the length of their URI in the budget.
+
+    Attributes:
+        hits (int): Lookups served from the cache.
+        misses (int): Lookups that built a new part.
+        uploads (int): Files sent to the object store.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, object_store: Optional[ObjectStore] = None,
+                 upload_threshold: int = 1024 * 1024, max_paths: int = 4096) -> None:
+        """
+        Initializes the media cache.
+
+        Args:
+            max_bytes (int): Maximum total size of the cached media, in bytes.
+            object_store (ObjectStore, optional): Where to upload large media. Without one,
+                every part embeds its bytes.
+            upload_threshold (int): Minimum size, in bytes, of the files uploaded to the
+                object store.
+            max_paths (int): Maximum number of (path, mtime, size) entries remembered.
+        """
+        self.object_store = object_store
+        self.upload_threshold = upload_threshold
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self._paths = LRUCache(max_paths)
+        self._parts = ByteSizedLRUCache(max_bytes)
+        self._uris: Dict[str, str] = {}
+        self._build_locks: Dict[Tuple[str, str], Lock] = {}
+        self._lock = Lock()
+
+    def get_part(self, file_path: str, mime_type: str, build_inline: Callable[[bytes], Any],
+                 build_uri: Callable[[str], Any]) -> Any:
+        """
+        Returns the part for a local file, building it on a miss.
+
+        Args:
+            file_path (str): The path of the media file.
+            mime_type (str): The MIME type of the media.
+            build_inline (Callable[[bytes], Any]): Builds a part embedding the file content.
+            build_uri (Callable[[str], Any]): Builds a part referencing an uploaded URI.
+
+        Returns:
+            Any: The part.
+        """
+        stat = os.stat(file_path)
+        path_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        content_hash = self._paths.get(path_key)
+        if content_hash is not None:
+            part = self._parts.get((content_hash, mime_type))
+            if part is not None:
+                self._count('hits')
+                return part
+
+        data = read_file_bytes(file_path)
+        content_hash = hashlib.sha256(data).hexdigest()
+        self._paths.put(path_key, content_hash)
+        part_key = (content_hash, mime_type)
+        with self._lock:
+            build_lock = self._build_locks.setdefault(part_key, Lock())
+        # Concurrent lookups of the same new content wait for a single build.
+        with build_lock:
+            part = self._parts.get(part_key)
+            if part is not None:
+                self._count('hits')
+                return part
+
+            self._count('misses')
+            if self.object_store is not None and len(data) >= self.upload_threshold:
+                uri = self._upload(data, content_hash, mime_type)
+                part, size = build_uri(uri), len(uri)
+            else:
+                part, size = build_inline(data), len(data)
+            self._parts.put(part_key, part, size)
+        with self._lock:
+            self._build_locks.pop(part_key, None)
+        return part
+
+    def info(self) -> Dict[str, int]:
+        """
+        Returns the cache statistics.
+
+        Returns:
+            Dict[str, int]: The hits, misses and uploads, and the number of cached parts and
+                their total size against the byte budget.
+        """
+        parts = self._parts.info()
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'uploads': self.uploads,
+                    'size': parts['size'], 'bytes': parts['bytes'], 'max_bytes': parts['max_bytes']}
+
+    def clear(self) -> None:
+        """Drops every cached part. Uploaded URIs are kept, as the objects still exist."""
+        self._paths.clear()
+        self._parts.clear()
+
+    def _upload(self, data: bytes, content_hash: str, mime_type: str) -> str:
+        with self._lock:
+            uri = self._uris.get(content_hash)
+        if uri is None:
+            name = content_hash + (mimetypes.guess_extension(mime_type) or '')
+            uri = self.object_store.upload(data, name, mime_type)
+            with self._lock:
+                self._uris[content_hash] = uri
+                self.uploads += 1
+        return uri
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
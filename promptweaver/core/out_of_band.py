@@ -0,0 +1,203 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+# Large parameter values (transcriptions, documents) are rendered as short placeholders,
+# and only substituted into the configuration tree after it is rendered and parsed. Their
+# content is never indented by `add_indent_filters`, copied by Jinja2 or scanned by the
+# YAML parser, and characters that are special in YAML cannot break the template.
+
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple, Union
+import re
+from jinja2 import nodes
+from promptweaver.utils.tree_utils import FrozenDict, FrozenList
+
+# Minimum length of the string values substituted out of band, when variables are not named.
+DEFAULT_OUT_OF_BAND_MIN_SIZE = 64 * 1024
+
+_PAYLOAD_PLACEHOLDER = '__pw_payload_{}__'
+_PAYLOAD_PLACEHOLDER_PATTERN = re.compile(r'__pw_payload_(\d+)__')
+
+
+def find_bare_variables(template_ast: nodes.Template) -> FrozenSet[str]:
+    """
+    Returns the variables a template only ever prints as they are.
+
+    A variable is bare when every use of it is an output of the form `{{ name }}`, or
+    `{{ name | indent(n) }}` as added by `add_indent_filters`, and the template never
+    assigns it. Such variables can be replaced by any other string without changing the
+    rest of the render.
+
+    Args:
+        template_ast (nodes.Template): The parsed template.
+
+    Returns:
+        FrozenSet[str]: The names of the bare variables.
+    """
+    uses: Dict[str, int] = {}
+    bare_uses: Dict[str, int] = {}
+    assigned = set()
+    for name in template_ast.find_all(nodes.Name):
+        if name.ctx == 'load':
+            uses[name.name] = uses.get(name.name, 0) + 1
+        else:
+            assigned.add(name.name)
+    for output in template_ast.find_all(nodes.Output):
+        for node in output.nodes:
+            if isinstance(node, nodes.Filter) and node.name == 'indent' and not node.kwargs:
+                node = node.node
+            if isinstance(node, nodes.Name) and node.ctx == 'load':
+                bare_uses[node.name] = bare_uses.get(node.name, 0) + 1
+    return frozenset(name for name, count in uses.items() if bare_uses.get(name) == count and name not in assigned)
+
+
+class OutOfBandVariables:
+    """
+    Substitutes large parameter values into a configuration tree after it is parsed.
+
+    `extract` replaces the values by placeholders before rendering, and `inject` puts the
+    values back into the rendered tree, in place of their placeholders. Values are inserted
+    verbatim: they are neither re-indented nor resolved as YAML scalars.
+    """
+
+    def __init__(self, variables: Union[bool, Iterable[str]], bare_variables: FrozenSet[str],
+                 min_size: int = DEFAULT_OUT_OF_BAND_MIN_SIZE, split_text_parts: bool = False,
+                 template: str = '') -> None:
+        """
+        Initializes the substitution.
+
+        Args:
+            variables (Union[bool, Iterable[str]]): The names of the variables always
+                substituted out of band, or True to substitute every bare variable whose
+                value is a string of at least `min_size` characters.
+            bare_variables (FrozenSet[str]): The bare variables of the template, as returned
+                by `find_bare_variables`.
+            min_size (int): Minimum length of the values substituted when `variables` is True.
+            split_text_parts (bool): Whether a 'user' text entry holding a value is split
+                into separate text entries, so that the value is passed on as it is instead
+                of being concatenated with the surrounding text. Surrounding text that is
+                only whitespace is dropped.
+            template (str): The template name used in error messages.
+
+        Raises:
+            ValueError: If a named variable is not bare in the template.
+        """
+        self.explicit = variables is not True
+        if variables is True:
+            self.names = bare_variables
+            self.min_size = min_size
+        else:
+            self.names = frozenset(variables or ())
+            self.min_size = 0
+            not_bare = sorted(self.names - bare_variables)
+            if not_bare:
+                raise ValueError(
+                    f"Variables {', '.join(not_bare)} of {template or 'the template'} cannot be substituted out of band: "
+                    "they must only be used as '{{ name }}', outside of statements and filters."
+                )
+        self.split_text_parts = split_text_parts
+        self.template = template
+
+    def extract(self, params: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+        """
+        Replaces the out-of-band values of the parameters with placeholders.
+
+        Args:
+            params (Dict[str, Any]): The rendering parameters.
+
+        Returns:
+            Tuple[Dict[str, Any], List[str]]: The parameters to render the template with, and
+                the extracted values, indexed by placeholder number. The parameters are
+                returned unchanged when no value is extracted.
+
+        Raises:
+            ValueError: If the value of a variable named explicitly is not a string. Values
+                are inserted verbatim, and would not get the YAML type they would have if
+                they were rendered.
+        """
+        payloads = []
+        replaced = None
+        for name in self.names:
+            value = params.get(name)
+            if self.explicit and value is not None and not isinstance(value, str):
+                raise ValueError(
+                    f"Variable {name} of {self.template or 'the template'} is substituted out of band and must be "
+                    f"a string, got {type(value).__name__}."
+                )
+            if isinstance(value, str) and len(value) >= self.min_size:
+                if replaced is None:
+                    replaced = dict(params)
+                replaced[name] = _PAYLOAD_PLACEHOLDER.format(len(payloads))
+                payloads.append(value)
+        return (replaced if replaced is not None else params), payloads
+
+    def inject(self, config_data: Dict[str, Any], payloads: List[str]) -> Dict[str, Any]:
+        """
+        Replaces the placeholders of a rendered configuration tree with their values.
+
+        Args:
+            config_data (Dict[str, Any]): The rendered and parsed configuration. It is
+                updated in place; its frozen subtrees never hold placeholders.
+            payloads (List[str]): The values returned by `extract`.
+
+        Returns:
+            Dict[str, Any]: The configuration tree.
+        """
+        if not payloads:
+            return config_data
+        for key, value in config_data.items():
+            if key == 'user' and self.split_text_parts and isinstance(value, list) and not isinstance(value, FrozenList):
+                config_data[key] = self._split_user_entries(value, payloads)
+            else:
+                config_data[key] = self._inject_value(value, payloads)
+        return config_data
+
+    def _inject_value(self, value: Any, payloads: List[str]) -> Any:
+        if isinstance(value, str):
+            if '__pw_payload_' not in value:
+                return value
+            match = _PAYLOAD_PLACEHOLDER_PATTERN.fullmatch(value)
+            if match:
+                # The whole value is the payload: pass it on without copying it.
+                return payloads[int(match.group(1))]
+            return _PAYLOAD_PLACEHOLDER_PATTERN.sub(lambda m: payloads[int(m.group(1))], value)
+        if isinstance(value, (FrozenDict, FrozenList)):
+            return value
+        if isinstance(value, dict):
+            for key, item in value.items():
+                value[key] = self._inject_value(item, payloads)
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                value[index] = self._inject_value(item, payloads)
+        return value
+
+    def _split_user_entries(self, entries: List[Any], payloads: List[str]) -> List[Any]:
+        result = []
+        for entry in entries:
+            text = entry.get('text') if isinstance(entry, dict) and len(entry) == 1 else None
+            if not isinstance(text, str) or '__pw_payload_' not in text:
+                result.append(self._inject_value(entry, payloads))
+                continue
+            position = 0
+            for match in _PAYLOAD_PLACEHOLDER_PATTERN.finditer(text):
+                # Text around the values is dropped when it is only whitespace, on every
+                # side, as text parts are stripped when the contents are built.
+                if text[position:match.start()].strip():
+                    result.append({'text': text[position:match.start()]})
+                result.append({'text': payloads[int(match.group(1))]})
+                position = match.end()
+            if text[position:].strip():
+                result.append({'text': text[position:]})
+        return result
@@ -0,0 +1,228 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Python types accepted for each type name of the 'variables' section.
+VARIABLE_TYPES: Dict[str, Tuple[type, ...]] = {
+    'string': (str,),
+    'str': (str,),
+    'integer': (int,),
+    'int': (int,),
+    'number': (int, float),
+    'float': (int, float),
+    'boolean': (bool,),
+    'bool': (bool,),
+    'list': (list, tuple),
+    'array': (list, tuple),
+    'object': (Mapping,),
+    'dict': (Mapping,),
+}
+
+# Checks a parameter value, returning an error message or None.
+Check = Callable[[Any], Optional[str]]
+
+
+class ParamValidationError(ValueError):
+    """
+    Raised when rendering parameters do not match the 'variables' section of a template.
+
+    Attributes:
+        errors (List[str]): One message per invalid or missing parameter.
+    """
+
+    def __init__(self, errors: List[str], template: str = '') -> None:
+        self.errors = errors
+        location = f" for {template}" if template else ""
+        super().__init__(f"Invalid parameters{location}:\n" + "\n".join(f"- {error}" for error in errors))
+
+
+def _type_check(name: str, type_name: str) -> Check:
+    expected = VARIABLE_TYPES[type_name]
+    # bool is a subclass of int, but True is not a valid integer or number parameter.
+    reject_bool = bool not in expected
+
+    def check(value: Any) -> Optional[str]:
+        if not isinstance(value, expected) or (reject_bool and isinstance(value, bool)):
+            return f"Parameter '{name}' must be of type {type_name}, got {type(value).__name__}."
+        return None
+    return check
+
+
+def _max_length_check(name: str, max_length: int) -> Check:
+    def check(value: Any) -> Optional[str]:
+        if hasattr(value, '__len__') and len(value) > max_length:
+            return f"Parameter '{name}' is longer than {max_length} ({len(value)})."
+        return None
+    return check
+
+
+def _enum_check(name: str, allowed: List[Any]) -> Check:
+    try:
+        allowed_set = frozenset(allowed)
+    except TypeError:
+        allowed_set = None
+
+    def check(value: Any) -> Optional[str]:
+        try:
+            valid = value in allowed_set if allowed_set is not None else value in allowed
+        except TypeError:
+            valid = False
+        if not valid:
+            return f"Parameter '{name}' must be one of {allowed}, got {value!r}."
+        return None
+    return check
+
+
+class ParamValidator:
+    """
+    Validates rendering parameters against the 'variables' section of a template.
+
+    Each declared variable may set, next to its `default` and `sample`:
+
+    - `type`: one of the names of VARIABLE_TYPES (string, integer, number, boolean, list
+      or object).
+    - `required`: whether the parameter must be provided and not null. Variables used by
+      the template without a default value are required unless `required: false` is set,
+      since rendering them would fail or silently produce an empty value.
+    - `max_length`: maximum length of a string or list value.
+    - `enum`: the list of allowed values.
+
+    The checks of every variable are built once, when the validator is created, and
+    validating a parameter dictionary runs them without reading the section again.
+
+    Attributes:
+        required (FrozenSet[str]): The names of the required parameters.
+        undeclared (FrozenSet[str]): Variables used by the template but missing from the
+            'variables' section.
+    """
+
+    def __init__(self, variables: Dict[str, Any], required_variables: Iterable[str] = (), template: str = '') -> None:
+        """
+        Builds the validator.
+
+        Args:
+            variables (Dict[str, Any]): The parsed 'variables' section.
+            required_variables (Iterable[str]): The variables used by the template, as
+                returned by `YAMLParser.extract_required_variables`.
+            template (str): The template name used in error messages.
+
+        Raises:
+            ValueError: If a variable declares an unknown type or an invalid constraint.
+        """
+        self.template = template
+        used = frozenset(required_variables)
+        required = set()
+        self._checks: List[Tuple[str, List[Check]]] = []
+        for name, details in variables.items():
+            details = details if isinstance(details, Mapping) else {}
+            checks = []
+            type_name = details.get('type')
+            if type_name is not None:
+                if type_name not in VARIABLE_TYPES:
+                    raise ValueError(f"Variable '{name}' of {template or 'the template'} has an unknown type "
+                                     f"'{type_name}'. Supported types: {', '.join(VARIABLE_TYPES)}.")
+                checks.append(_type_check(name, type_name))
+            if details.get('max_length') is not None:
+                max_length = details['max_length']
+                if not isinstance(max_length, int) or isinstance(max_length, bool) or max_length < 0:
+                    raise ValueError(f"Variable '{name}' has an invalid max_length: {max_length!r}.")
+                checks.append(_max_length_check(name, max_length))
+            if details.get('enum') is not None:
+                if not isinstance(details['enum'], list):
+                    raise ValueError(f"Variable '{name}' has an invalid enum, expected a list: {details['enum']!r}.")
+                checks.append(_enum_check(name, details['enum']))
+            if checks:
+                self._checks.append((name, checks))
+            if details.get('required', name in used and 'default' not in details):
+                required.add(name)
+        undeclared = used - frozenset(variables)
+        self.required: FrozenSet[str] = frozenset(required | undeclared)
+        self.undeclared: FrozenSet[str] = undeclared
+        # Missing required parameters, by set of provided keys. Rows of a batch usually
+        # share the same keys, so the difference is computed once per batch.
+        self._missing_by_keys: Dict[FrozenSet[str], List[str]] = {}
+
+    @property
+    def is_trivial(self) -> bool:
+        """True if the validator accepts every parameter dictionary."""
+        return not self._checks and not self.required
+
+    def check(self, params: Dict[str, Any]) -> List[str]:
+        """
+        Checks a parameter dictionary.
+
+        Args:
+            params (Dict[str, Any]): The parameters, merged with the default values.
+
+        Returns:
+            List[str]: The error messages, empty if the parameters are valid.
+        """
+        errors = []
+        if self.required:
+            keys = frozenset(params)
+            missing = self._missing_by_keys.get(keys)
+            if missing is None:
+                missing = sorted(self.required - keys)
+                if len(self._missing_by_keys) < 64:
+                    self._missing_by_keys[keys] = missing
+            errors.extend(f"Missing required parameter '{name}'." for name in missing)
+            errors.extend(f"Required parameter '{name}' is null." for name in self.required
+                          if name in keys and params[name] is None)
+        for name, checks in self._checks:
+            value = params.get(name)
+            if value is None:
+                continue
+            for check in checks:
+                error = check(value)
+                if error is not None:
+                    errors.append(error)
+        return errors
+
+    def validate(self, params: Dict[str, Any]) -> None:
+        """
+        Validates a parameter dictionary.
+
+        Args:
+            params (Dict[str, Any]): The parameters, merged with the default values.
+
+        Raises:
+            ParamValidationError: If a parameter is missing or invalid.
+        """
+        errors = self.check(params)
+        if errors:
+            raise ParamValidationError(errors, self.template)
+
+    def validate_many(self, params_iterable: Iterable[Dict[str, Any]],
+                      defaults: Optional[Dict[str, Any]] = None, start: int = 0) -> List[Tuple[int, List[str]]]:
+        """
+        Checks a batch of parameter dictionaries.
+
+        Args:
+            params_iterable (Iterable[Dict[str, Any]]): The parameters of each row.
+            defaults (Dict[str, Any], optional): Default values merged under each row.
+            start (int): The index of the first row.
+
+        Returns:
+            List[Tuple[int, List[str]]]: The index and errors of every invalid row.
+        """
+        invalid = []
+        for index, params in enumerate(params_iterable, start):
+            errors = self.check({**defaults, **params} if defaults else params)
+            if errors:
+                invalid.append((index, errors))
+        return invalid
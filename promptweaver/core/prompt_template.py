@@ -14,11 +14,24 @@
  limitations under the License.
  """
 
-from typing import Dict, Any, Set, Tuple
-import re
+from typing import TYPE_CHECKING, Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple, Union
+import copy
+import os
 import yaml
-from jinja2 import Template, UndefinedError, Environment, meta
-from promptweaver.utils.string_utils import remove_blank_spaces, add_indent_filters
+from jinja2 import TemplateSyntaxError, UndefinedError, Environment, meta
+from promptweaver.core.instrumentation import stage
+from promptweaver.core.out_of_band import OutOfBandVariables
+from promptweaver.core.param_validator import ParamValidator
+from promptweaver.core.structural_template import StructuralFallback, StructuralTemplate
+from promptweaver.core.template_cache import TEMPLATE_ENVIRONMENT, CompiledTemplate, TemplateCache
+from promptweaver.core.template_environment import locate_template
+from promptweaver.utils.jinja_utils import compile_template_source
+from promptweaver.utils.string_utils import remove_blank_spaces, contains_jinja, scan_template, split_top_level_sections, uses_extends
+from promptweaver.utils.tree_utils import FrozenDict, FrozenList, copy_tree, freeze_tree
+from promptweaver.utils.yaml_utils import load_yaml, set_yaml_backend
+
+if TYPE_CHECKING:
+    from promptweaver.core.template_bundle import TemplateBundle
 
 
 def format_schema(schema, indent=4, level=0):
@@ -58,13 +71,83 @@ class YAMLParser:
         Returns:
             str: The rendered YAML content as a string.
         """
-        with open(file_path, 'r') as file:
-            template_str = add_indent_filters(file.readlines())
-        template = Template(template_str)
-        try:
-            return template.render(**params)
-        except UndefinedError as e:
-            raise ValueError(f"Missing parameters for rendering: {e}")
+        return YAMLParser.render_compiled_template(YAMLParser.get_compiled_template(file_path), params)
+
+    @staticmethod
+    def render_compiled_template(compiled: CompiledTemplate, params: Dict[str, str]) -> str:
+        """
+        Renders an already compiled template using the provided parameters.
+
+        Args:
+            compiled (CompiledTemplate): The compiled template.
+            params (Dict[str, str]): Parameters to use for rendering the template.
+
+        Returns:
+            str: The rendered YAML content as a string.
+        """
+        with stage('render', template=compiled.file_path, mode='text') as record:
+            try:
+                rendered_yaml = compiled.render(params)
+            except UndefinedError as e:
+                raise ValueError(f"Missing parameters for rendering: {e}")
+            if record.recording:
+                record.set('rendered_bytes', len(rendered_yaml.encode('utf-8')))
+            return rendered_yaml
+
+    @staticmethod
+    def get_compiled_template(file_path: str) -> CompiledTemplate:
+        """
+        Returns the compiled template for a .yml.j2 file from the process-wide template cache.
+
+        The file is only read, preprocessed and compiled again when it changes on disk.
+
+        Args:
+            file_path (str): The path to the .yml.j2 file.
+
+        Returns:
+            CompiledTemplate: The compiled template.
+        """
+        with stage('load') as record:
+            compiled = template_cache.get(file_path)
+            record.set('template', compiled.file_path)
+            record.set('template_bytes', compiled.size)
+            return compiled
+
+    @staticmethod
+    def compile_template(file_path: str, raw_template: str, stat: os.stat_result, content_hash: str) -> CompiledTemplate:
+        """
+        Preprocesses and compiles a .yml.j2 template and parses its 'variables' section.
+
+        The raw content is scanned once to add indent filters and locate the 'variables'
+        section, and the preprocessed source is parsed and compiled by Jinja2 once, which
+        also finds the variables it requires.
+
+        Args:
+            file_path (str): The path to the .yml.j2 file.
+            raw_template (str): The raw content of the file.
+            stat (os.stat_result): The file stat at read time.
+            content_hash (str): The hash of the raw content.
+
+        Returns:
+            CompiledTemplate: The compiled template.
+        """
+        raw_template = raw_template.replace('\r\n', '\n').replace('\r', '\n')
+        template_str, variables_section = scan_template(raw_template)
+        variables = YAMLParser._parse_variables_section(variables_section)
+        environment, name, template_root = locate_template(file_path)
+        template, required_variables = compile_template_source(environment, template_str, name, file_path)
+        return CompiledTemplate(
+            file_path=file_path,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            content_hash=content_hash,
+            source=template_str,
+            template=template,
+            variables=variables,
+            structural=StructuralTemplate.compile(raw_template),
+            required_variables=required_variables,
+            template_root=template_root,
+        )
 
     @staticmethod
     def get_variables(file_path: str) -> Dict[str, str]:
@@ -74,14 +157,24 @@ class YAMLParser:
         Args:
             file_path (str): The path to the .yml.j2 file.
         """
-        with open(file_path, 'r') as file:
-            raw_yaml = file.read()
-        match = re.search(r"variables:\s*(\n(?:[ \t]+.*\n?)*)", raw_yaml)
-        if match:
-            variables_section = match.group(1)
-        else:
+        return copy.deepcopy(YAMLParser.get_compiled_template(file_path).variables)
+
+    @staticmethod
+    def _parse_variables_section(variables_section: Optional[str]) -> Dict[str, Any]:
+        """
+        Parses the 'variables' section extracted by `scan_template`.
+
+        Args:
+            variables_section (Optional[str]): The raw text of the section, starting with its
+                `variables:` line, or None if the template has none.
+
+        Returns:
+            Dict[str, Any]: The parsed variables section, empty if it is not present.
+        """
+        if variables_section is None:
             print("Variables section not found.")
-        return YAMLParser.parse_rendered_yaml(variables_section)
+            return {}
+        return (YAMLParser.parse_rendered_yaml(variables_section) or {}).get('variables') or {}
 
     @staticmethod
     def get_sample_values(file_path: str) -> Dict[str, str]:
@@ -94,8 +187,7 @@ class YAMLParser:
         Returns:
             Dict[str, str]: A dictionary of variable names and their sample values.
         """        
-        variables_section = YAMLParser.get_variables(file_path)
-        return {var: details['sample'] for var, details in variables_section.items() if 'sample' in details}
+        return dict(YAMLParser.get_compiled_template(file_path).sample_values)
 
     @staticmethod
     def get_default_values(file_path: str) -> Dict[str, str]:
@@ -108,18 +200,60 @@ class YAMLParser:
         Returns:
             Dict[str, str]: A dictionary of variable names and their default values.
         """
-        variables_section = YAMLParser.get_variables(file_path)
-        return {var: details.get('default') for var, details in variables_section.items() if 'default' in details}
+        return dict(YAMLParser.get_compiled_template(file_path).default_values)
+
+    @staticmethod
+    def get_required_variables(file_path: str) -> Set[str]:
+        """
+        Returns the variables used in a .yml.j2 template, computed once when it is compiled.
+
+        Args:
+            file_path (str): The path to the .yml.j2 file.
+
+        Returns:
+            Set[str]: The names of the undeclared variables the template uses.
+        """
+        return set(YAMLParser.get_compiled_template(file_path).required_variables)
+
+    @staticmethod
+    def validate_params(file_path: str, params: Dict[str, Any]) -> None:
+        """
+        Validates rendering parameters against the 'variables' section of a .yml.j2 template.
+
+        Args:
+            file_path (str): The path to the .yml.j2 file.
+            params (Dict[str, Any]): Parameters to use for rendering the template. They are
+                merged with the default values before being checked.
+
+        Raises:
+            ParamValidationError: If a parameter is missing, has the wrong type, is too long
+                or is not one of the allowed values.
+        """
+        compiled = YAMLParser.get_compiled_template(file_path)
+        compiled.validator.validate({**compiled.default_values, **params})
 
     @staticmethod
     def extract_required_variables(template_str: str) -> Set[str]:
         """
         Extracts all the variables used in the Jinja2 template.
         """
-        env = Environment()
-        parsed_content = env.parse(template_str)
+        parsed_content = TEMPLATE_ENVIRONMENT.parse(template_str)
         return meta.find_undeclared_variables(parsed_content)
 
+    @staticmethod
+    def set_yaml_backend(backend: Union[str, type] = 'auto') -> None:
+        """
+        Selects the YAML loader backend used to parse templates.
+
+        Args:
+            backend (Union[str, type]): 'auto' (libyaml's CSafeLoader when available, with a fallback to
+                the pure-Python SafeLoader), 'libyaml', 'python', or a custom yaml Loader class.
+
+        Raises:
+            ValueError: If the backend is unknown or not available in this environment.
+        """
+        set_yaml_backend(backend)
+
     @staticmethod
     def parse_rendered_yaml(rendered_yaml: str) -> Dict[str, Any]:
         """
@@ -135,7 +269,10 @@ class YAMLParser:
             ValueError: If the YAML content cannot be parsed.
         """
         try:
-            return yaml.safe_load(rendered_yaml)
+            with stage('parse') as record:
+                if record.recording:
+                    record.set('rendered_bytes', len(rendered_yaml.encode('utf-8')))
+                return load_yaml(rendered_yaml)
         except yaml.YAMLError as e:
             # Extract error details
             error_context = ""
@@ -164,27 +301,92 @@ class YAMLParser:
             raise ValueError(error_message) from e
 
     @staticmethod
-    def load_config(file_path: str, params: Dict[str, str]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    def render_structural(compiled: CompiledTemplate, params: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Renders a compiled template into its configuration tree without parsing YAML.
+
+        Only the scalars holding Jinja2 markup are rendered; they are spliced into a copy
+        of the YAML skeleton parsed when the template was compiled.
+
+        Args:
+            compiled (CompiledTemplate): The compiled template.
+            params (Dict[str, str]): Parameters to use for rendering the template.
+
+        Returns:
+            Dict[str, Any]: Parsed YAML data after rendering.
+
+        Raises:
+            StructuralFallback: If the template, or one of the rendered values, requires
+                rendering the whole document as text and parsing it.
+        """
+        if compiled.structural is None:
+            raise StructuralFallback(f"{compiled.file_path} is not eligible for structural rendering.")
+        with stage('render', template=compiled.file_path, mode='structural'):
+            try:
+                return compiled.structural.render(params)
+            except UndefinedError as e:
+                raise ValueError(f"Missing parameters for rendering: {e}")
+
+    @staticmethod
+    def load_config(file_path: str, params: Dict[str, str], structural: bool = True,
+                    out_of_band: Union[bool, Iterable[str]] = False) -> Tuple[Dict[str, Any], Dict[str, str]]:
         """
         Loads, renders, and parses the YAML configuration from a .yml.j2 file.
 
         Args:
             file_path (str): The path to the .yml.j2 file.
             params (Dict[str, str]): Parameters to use for rendering the template.
+            structural (bool): Whether to render only the scalars holding Jinja2 markup into
+                the cached YAML skeleton when the template allows it, instead of rendering the
+                whole document as text and parsing it.
+            out_of_band (Union[bool, Iterable[str]]): Variables whose values are substituted
+                into the parsed configuration instead of going through Jinja2 and YAML: the
+                names of variables printed as `{{ name }}`, or True for every such variable
+                holding a string of at least DEFAULT_OUT_OF_BAND_MIN_SIZE characters.
 
         Returns:
             Dict[str, Any]: Parsed YAML data after rendering.
             Dict[str, str]: The parameters used for rendering the template.
         """
-        # Get the default values for variables
-        default_values = YAMLParser.get_default_values(file_path)
+        return YAMLParser.load_compiled_config(YAMLParser.get_compiled_template(file_path), params, structural, out_of_band)
 
-        # Merge provided params with default values (params override defaults)
-        merged_params = {**default_values, **params}
+    @staticmethod
+    def load_compiled_config(compiled: CompiledTemplate, params: Dict[str, str], structural: bool = True,
+                             out_of_band: Union[bool, Iterable[str]] = False) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """
+        Renders and parses the YAML configuration of an already compiled template.
+
+        Args:
+            compiled (CompiledTemplate): The compiled template.
+            params (Dict[str, str]): Parameters to use for rendering the template.
+            structural (bool): Whether to use structural rendering when the template allows it.
+            out_of_band (Union[bool, Iterable[str]]): Variables substituted after parsing, as
+                in `load_config`.
 
-        # Render the template with merged params
-        rendered_yaml = YAMLParser.load_and_render_template(file_path, merged_params)
-        parsed_yaml = YAMLParser.parse_rendered_yaml(rendered_yaml)
+        Returns:
+            Dict[str, Any]: Parsed YAML data after rendering.
+            Dict[str, str]: The parameters used for rendering the template.
+        """
+        # Merge provided params with default values (params override defaults)
+        merged_params = {**compiled.default_values, **params}
+        render_params, payloads, substitution = merged_params, None, None
+        if out_of_band:
+            substitution = OutOfBandVariables(out_of_band, compiled.bare_variables, template=compiled.file_path)
+            render_params, payloads = substitution.extract(merged_params)
+
+        parsed_yaml = None
+        if structural and compiled.structural is not None:
+            try:
+                parsed_yaml = YAMLParser.render_structural(compiled, render_params)
+            except StructuralFallback:
+                pass
+
+        if parsed_yaml is None:
+            # Render the template with merged params
+            rendered_yaml = YAMLParser.render_compiled_template(compiled, render_params)
+            parsed_yaml = YAMLParser.parse_rendered_yaml(rendered_yaml)
+        if payloads:
+            parsed_yaml = substitution.inject(parsed_yaml, payloads)
         return (parsed_yaml, merged_params)
 
     @staticmethod
@@ -200,7 +402,7 @@ class YAMLParser:
             Dict[str, Any]: Parsed YAML data after rendering with sample values.
             Dict[str, str]: The parameters used for rendering the template.
         """
-        sample_config = YAMLParser.get_sample_values(file_path)
+        sample_config = dict(YAMLParser.get_compiled_template(file_path).sample_values)
         parsed_yaml, merged_params = YAMLParser.load_config(file_path, sample_config)
         return (parsed_yaml, merged_params)
     
@@ -230,20 +432,55 @@ class YAMLParser:
         return snippet
 
 
+# Process-wide registry of compiled templates shared by every YAMLParser call.
+template_cache = TemplateCache(compile_fn=YAMLParser.compile_template)
+
+
 class PromptConfig:
     """
     Represents the configuration for the LLM prompt, loaded from a .yml.j2 file.
 
+    PromptConfig objects are immutable. The template-level fields that hold no template
+    variables are read-only (FrozenDict and FrozenList) and shared by reference between
+    all the renders of a PromptTemplate, so a rendered configuration only owns its
+    `user` parts and its parameters. Use `replace` to derive a modified configuration.
+
     Attributes:
         name (str): Name of the prompt.
         description (str): Description of the prompt.
         model_name (str): Name of the model to use.
         generation_config (Dict[str, Any]): Configuration options for the model generation.
+        safety_settings (List[Dict[str, str]]): Safety settings of the model.
         system_instruction (str): Instruction for the LLM's system behavior.
-        sample (Dict[str, Any]): Sample values for rendering the template.
+        variables (Dict[str, Any]): The 'variables' section of the template.
+        provided_variables (Dict[str, Any]): The parameters used for rendering the template.
+        user (List[Dict[str, Any]]): The entries of the 'user' section.
+        static_user_parts (int): Number of leading 'user' entries that hold no template
+            variables, and are identical in every render of the template.
+        static_prefix_key (Optional[str]): Identifies the static 'user' entries of the
+            template, as `CompiledTemplate.static_prefix_key`.
+        static_system_instruction (bool): Whether the system instruction holds no template
+            variables, and is identical in every render of the template.
     """
 
-    def __init__(self, config_data: Dict[str, Any], provided_variables: Dict[str, str], verbose: bool = False) -> None:
+    __slots__ = ('name', 'description', 'model_name', 'generation_config', 'safety_settings', 'system_instruction',
+                 'variables', 'provided_variables', 'user', 'static_user_parts', 'static_prefix_key',
+                 'static_system_instruction')
+
+    # Template-level fields, with their path in the configuration tree and their default value.
+    TEMPLATE_FIELDS: Dict[str, Tuple[Tuple[str, ...], Any]] = {
+        'name': (('name',), ''),
+        'description': (('description',), ''),
+        'model_name': (('model', 'model_name'), ''),
+        'generation_config': (('model', 'generation_config'), FrozenDict()),
+        'safety_settings': (('model', 'safety_settings'), FrozenList()),
+        'system_instruction': (('model', 'system_instruction'), ''),
+        'variables': (('variables',), FrozenDict()),
+    }
+
+    def __init__(self, config_data: Dict[str, Any], provided_variables: Dict[str, str], verbose: bool = False,
+                 static_user_parts: int = 0, shared_fields: Optional[Dict[str, Any]] = None,
+                 static_prefix_key: Optional[str] = None, static_system_instruction: bool = False) -> None:
         """
         Initializes the PromptConfig.
 
@@ -251,26 +488,98 @@ class PromptConfig:
             config_data (Dict[str, Any]): The parsed YAML configuration.
             provided_params (Dict[str, str]): The dictionary of provided parameters.
             verbose (bool): Whether to print verbose information.
+            static_user_parts (int): Number of leading 'user' entries that are the same in
+                every render of the template.
+            shared_fields (Dict[str, Any], optional): Template-level fields resolved once
+                for every render of a PromptTemplate. They are used instead of the values
+                of `config_data`.
+            static_prefix_key (str, optional): Identifies the static 'user' entries of the
+                template, as `CompiledTemplate.static_prefix_key`.
+            static_system_instruction (bool): Whether the system instruction is the same in
+                every render of the template.
 
         Raises:
             ValueError: If any required parameter is missing.
         """
-        self.name = config_data.get('name', '')
-        self.description = config_data.get('description', '')
-        self.model_name = config_data.get('model', {}).get('model_name', '')
-        self.generation_config = config_data.get('model', {}).get('generation_config', {})
-        self.safety_settings = config_data.get('model', {}).get('safety_settings', [])
-        self.system_instruction = remove_blank_spaces(config_data.get('model', {}).get('system_instruction', ''))
-        self.variables = config_data.get('variables', {})
-        self.provided_variables = provided_variables
-        self.user = config_data.get('user', [])
+        set_field = object.__setattr__
+        for field in self.TEMPLATE_FIELDS:
+            if shared_fields is not None and field in shared_fields:
+                set_field(self, field, shared_fields[field])
+            else:
+                set_field(self, field, self.get_template_field(config_data, field))
+        set_field(self, 'provided_variables', provided_variables)
+        set_field(self, 'user', config_data.get('user', []))
+        set_field(self, 'static_user_parts', static_user_parts)
+        set_field(self, 'static_prefix_key', static_prefix_key)
+        set_field(self, 'static_system_instruction', static_system_instruction)
 
         # Validate user section
-        self.validate_user_section()
+        with stage('validate', template=self.name, part_count=len(self.user)):
+            self.validate_user_section()
 
         if verbose:
             print(self)
 
+    @classmethod
+    def get_template_field(cls, config_data: Dict[str, Any], field: str) -> Any:
+        """
+        Reads a template-level field from a configuration tree.
+
+        Args:
+            config_data (Dict[str, Any]): The parsed YAML configuration.
+            field (str): A key of TEMPLATE_FIELDS.
+
+        Returns:
+            Any: The value of the field, or its default value.
+        """
+        path, default = cls.TEMPLATE_FIELDS[field]
+        value = config_data
+        for key in path[:-1]:
+            value = value.get(key, {})
+        value = value.get(path[-1], default)
+        return remove_blank_spaces(value) if field == 'system_instruction' else value
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"PromptConfig is immutable, cannot set '{name}'. Use replace() instead.")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"PromptConfig is immutable, cannot delete '{name}'.")
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for field, value in state.items():
+            object.__setattr__(self, field, value)
+
+    def replace(self, **changes: Any) -> 'PromptConfig':
+        """
+        Returns a copy of the configuration with some fields replaced.
+
+        Replacing `user` resets `static_user_parts` and `static_prefix_key`, and replacing
+        `system_instruction` resets `static_system_instruction`, since the new values are no
+        longer those of the template, unless they are passed as well.
+
+        Args:
+            **changes: New values of fields, for example `generation_config={...}`.
+
+        Returns:
+            PromptConfig: The modified configuration. Unchanged fields are shared.
+
+        Raises:
+            AttributeError: If a field does not exist.
+        """
+        unknown = set(changes) - set(self.__slots__)
+        if unknown:
+            raise AttributeError(f"PromptConfig has no field {', '.join(sorted(unknown))}.")
+        if 'user' in changes:
+            changes.setdefault('static_user_parts', 0)
+            changes.setdefault('static_prefix_key', None)
+        if 'system_instruction' in changes:
+            changes.setdefault('static_system_instruction', False)
+        copy = PromptConfig.__new__(PromptConfig)
+        copy.__setstate__({**self.__getstate__(), **changes})
+        return copy
 
     def validate_user_section(self) -> None:
         """
@@ -295,7 +604,8 @@ class PromptConfig:
             raise ValueError("At least one input modality (text, image, audio, or video) must be provided in the user section.")
 
     @classmethod
-    def from_file(cls, file_path: str, params: Dict[str, str], verbose: bool = False) -> 'PromptConfig':
+    def from_file(cls, file_path: str, params: Dict[str, str], verbose: bool = False,
+                  out_of_band: Union[bool, Iterable[str]] = False) -> 'PromptConfig':
         """
         Creates a PromptConfig instance from a .yml.j2 file using provided params.
 
@@ -303,12 +613,37 @@ class PromptConfig:
             file_path (str): The path to the .yml.j2 file.
             params (Dict[str, str]): Parameters to use for rendering the template.
             verbose (bool): Whether to print verbose information.
+            out_of_band (Union[bool, Iterable[str]]): Variables substituted after parsing,
+                as in `YAMLParser.load_config`.
+
+        Returns:
+            PromptConfig: An instance of the PromptConfig class.
+        """
+        compiled = YAMLParser.get_compiled_template(file_path)
+        config_data, merged_params = YAMLParser.load_compiled_config(compiled, params, out_of_band=out_of_band)
+        return cls(config_data, merged_params, verbose, compiled.static_user_parts,
+                   static_prefix_key=compiled.static_prefix_key,
+                   static_system_instruction=compiled.static_system_instruction)
+
+    @classmethod
+    def from_bundle(cls, bundle: 'TemplateBundle', template_name: str, params: Dict[str, str], verbose: bool = False) -> 'PromptConfig':
+        """
+        Creates a PromptConfig instance from a template of a precompiled bundle.
+
+        Args:
+            bundle (TemplateBundle): The loaded template bundle.
+            template_name (str): The template path relative to the bundled directory.
+            params (Dict[str, str]): Parameters to use for rendering the template.
+            verbose (bool): Whether to print verbose information.
 
         Returns:
             PromptConfig: An instance of the PromptConfig class.
         """
-        config_data, merged_params = YAMLParser.load_config(file_path, params)
-        return cls(config_data, merged_params, verbose)
+        compiled = bundle.get(template_name)
+        config_data, merged_params = YAMLParser.load_compiled_config(compiled, params)
+        return cls(config_data, merged_params, verbose, compiled.static_user_parts,
+                   static_prefix_key=compiled.static_prefix_key,
+                   static_system_instruction=compiled.static_system_instruction)
 
     @classmethod
     def from_file_with_sample_values(cls, file_path: str, verbose: bool = False) -> 'PromptConfig':
@@ -323,7 +658,10 @@ class PromptConfig:
             PromptConfig: An instance of the PromptConfig class.
         """
         config_data, merged_params = YAMLParser.load_config_with_sample_values(file_path)
-        return cls(config_data, merged_params, verbose)
+        compiled = YAMLParser.get_compiled_template(file_path)
+        return cls(config_data, merged_params, verbose, compiled.static_user_parts,
+                   static_prefix_key=compiled.static_prefix_key,
+                   static_system_instruction=compiled.static_system_instruction)
     
     def __str__(self) -> str:
         """Returns a string representation of the PromptConfig object."""
@@ -340,3 +678,269 @@ class PromptConfig:
         f"  user={format_schema(self.user, 2, 2)}\n"
         ")\n"
     )
+
+
+class PromptTemplate:
+    """
+    A .yml.j2 template bound once and rendered many times into PromptConfig objects.
+
+    Everything that does not depend on the rendering parameters is resolved when the
+    PromptTemplate is built: the compiled Jinja2 template, the default and sample values,
+    and the YAML skeleton of the template. When the template is eligible for structural
+    rendering, each render only evaluates the scalars holding Jinja2 markup and never
+    parses YAML. Otherwise every top-level section without Jinja2 markup (typically
+    `name`, `description` and `model`) is parsed once, and each render only evaluates
+    and parses the sections that reference variables.
+
+    Attributes:
+        file_path (str): The path to the .yml.j2 file.
+        name (str): The 'name' declared by the template, or an empty string if it has none
+            or if it holds Jinja2 markup.
+        default_values (Dict[str, Any]): Default values declared in the 'variables' section.
+        sample_values (Dict[str, Any]): Sample values declared in the 'variables' section.
+        validator (ParamValidator): The validator of the rendering parameters.
+        validate (bool): Whether parameters are validated before each render.
+        out_of_band (Optional[OutOfBandVariables]): The variables substituted after parsing,
+            or None.
+    """
+
+    def __init__(self, compiled: CompiledTemplate, verbose: bool = False, structural: bool = True,
+                 validate: bool = False, out_of_band: Union[bool, Iterable[str]] = False,
+                 split_text_parts: bool = False) -> None:
+        """
+        Initializes the PromptTemplate.
+
+        Args:
+            compiled (CompiledTemplate): The compiled template to bind.
+            verbose (bool): Whether to print verbose information on each render.
+            structural (bool): Whether to use structural rendering when the template allows it.
+            validate (bool): Whether to validate the parameters against the 'variables'
+                section before each render.
+            out_of_band (Union[bool, Iterable[str]]): Variables whose values are substituted
+                into the rendered configuration after parsing, instead of going through
+                Jinja2 and YAML: the names of variables, or True for every variable holding
+                a string of at least DEFAULT_OUT_OF_BAND_MIN_SIZE characters. Only variables
+                printed as `{{ name }}` can be substituted out of band.
+            split_text_parts (bool): Whether 'user' text entries holding out-of-band values
+                are split into separate text entries around them.
+
+        Raises:
+            ValueError: If a variable named in `out_of_band` is not printed as `{{ name }}`.
+        """
+        self.file_path = compiled.file_path
+        self.default_values = compiled.default_values
+        self.sample_values = compiled.sample_values
+        self.validate = validate and not compiled.validator.is_trivial
+        self.verbose = verbose
+        self.structural = structural and compiled.structural is not None
+        self.out_of_band = None
+        if out_of_band:
+            self.out_of_band = OutOfBandVariables(out_of_band, compiled.bare_variables,
+                                                  split_text_parts=split_text_parts, template=compiled.file_path)
+        self._compiled = compiled
+
+        static_sections, dynamic_sections = self._split_sections(compiled.source)
+        static_data = YAMLParser.parse_rendered_yaml(''.join(static_sections)) or {}
+        self._static_data = {key: freeze_tree(value) for key, value in static_data.items()}
+        self._dynamic_template = None
+        if dynamic_sections == [compiled.source]:
+            self._dynamic_template = compiled.template
+        elif dynamic_sections:
+            self._dynamic_template = compiled.environment.from_string(''.join(dynamic_sections))
+        self.name = str(self._static_data.get('name') or '')
+        self.static_user_parts = compiled.static_user_parts
+        self.static_prefix_key = compiled.static_prefix_key
+        self.static_system_instruction = compiled.static_system_instruction
+        self._shared_fields = self._get_shared_fields(compiled)
+
+    def _get_shared_fields(self, compiled: CompiledTemplate) -> Dict[str, Any]:
+        """
+        Resolves the template-level fields of PromptConfig that hold no template
+        variables. They are the same in every render, and shared by all of them.
+        """
+        if compiled.structural is not None:
+            tree = compiled.structural.skeleton
+            slot_paths = [slot.path for slot in compiled.structural.slots]
+
+            def is_static(path: Tuple[str, ...]) -> bool:
+                return not any(slot[:len(path)] == path or path[:len(slot)] == slot for slot in slot_paths)
+        else:
+            tree = self._static_data
+
+            def is_static(path: Tuple[str, ...]) -> bool:
+                return path[0] in tree or self._dynamic_template is None
+
+        return {
+            field: freeze_tree(PromptConfig.get_template_field(tree, field))
+            for field, (path, _) in PromptConfig.TEMPLATE_FIELDS.items()
+            if is_static(path)
+        }
+
+    @staticmethod
+    def _split_sections(template_str: str) -> Tuple[list, list]:
+        """
+        Separates the top-level sections that contain Jinja2 markup from the static ones.
+
+        If any section with markup cannot be compiled on its own (for example, a
+        statement opened in one section and closed in another), every section is
+        treated as dynamic.
+
+        Args:
+            template_str (str): The preprocessed template source.
+
+        Returns:
+            Tuple[list, list]: The static and the dynamic section texts.
+        """
+        if uses_extends(template_str):
+            # The parent template decides the layout of the whole document.
+            return [], [template_str]
+        env = Environment()
+        static_sections, dynamic_sections = [], []
+        for _, section in split_top_level_sections(template_str):
+            if not contains_jinja(section):
+                static_sections.append(section)
+                continue
+            try:
+                env.parse(section)
+            except TemplateSyntaxError:
+                return [], [template_str]
+            dynamic_sections.append(section)
+        return static_sections, dynamic_sections
+
+    @classmethod
+    def from_file(cls, file_path: str, verbose: bool = False, structural: bool = True,
+                  validate: bool = False, out_of_band: Union[bool, Iterable[str]] = False,
+                  split_text_parts: bool = False) -> 'PromptTemplate':
+        """
+        Creates a PromptTemplate from a .yml.j2 file.
+
+        Args:
+            file_path (str): The path to the .yml.j2 file.
+            verbose (bool): Whether to print verbose information on each render.
+            structural (bool): Whether to use structural rendering when the template allows it.
+            validate (bool): Whether to validate the parameters before each render.
+            out_of_band (Union[bool, Iterable[str]]): Variables substituted after parsing.
+            split_text_parts (bool): Whether text entries are split around out-of-band values.
+
+        Returns:
+            PromptTemplate: The bound template.
+        """
+        return cls(YAMLParser.get_compiled_template(file_path), verbose, structural, validate,
+                   out_of_band, split_text_parts)
+
+    @classmethod
+    def from_bundle(cls, bundle: 'TemplateBundle', template_name: str, verbose: bool = False, structural: bool = True,
+                    validate: bool = False, out_of_band: Union[bool, Iterable[str]] = False,
+                    split_text_parts: bool = False) -> 'PromptTemplate':
+        """
+        Creates a PromptTemplate from a template of a precompiled bundle.
+
+        Args:
+            bundle (TemplateBundle): The loaded template bundle.
+            template_name (str): The template path relative to the bundled directory.
+            verbose (bool): Whether to print verbose information on each render.
+            structural (bool): Whether to use structural rendering when the template allows it.
+            validate (bool): Whether to validate the parameters before each render.
+            out_of_band (Union[bool, Iterable[str]]): Variables substituted after parsing.
+            split_text_parts (bool): Whether text entries are split around out-of-band values.
+
+        Returns:
+            PromptTemplate: The bound template.
+        """
+        return cls(bundle.get(template_name), verbose, structural, validate, out_of_band, split_text_parts)
+
+    @property
+    def validator(self) -> ParamValidator:
+        """The validator of the rendering parameters, built on first use."""
+        return self._compiled.validator
+
+    def check_params(self, params: Dict[str, Any]) -> List[str]:
+        """
+        Checks rendering parameters against the 'variables' section, without rendering.
+
+        Args:
+            params (Dict[str, Any]): Parameters to use for rendering the template.
+
+        Returns:
+            List[str]: The error messages, empty if the parameters are valid.
+        """
+        return self.validator.check({**self.default_values, **params})
+
+    def check_many(self, params_iterable: Iterable[Dict[str, Any]]) -> List[Tuple[int, List[str]]]:
+        """
+        Checks a batch of rendering parameters, without rendering.
+
+        Args:
+            params_iterable (Iterable[Dict[str, Any]]): The parameters of each render.
+
+        Returns:
+            List[Tuple[int, List[str]]]: The zero-based index and the errors of every
+                invalid set of parameters.
+        """
+        return self.validator.validate_many(params_iterable, self.default_values)
+
+    def render(self, params: Dict[str, Any]) -> 'PromptConfig':
+        """
+        Renders the template with the provided parameters.
+
+        Args:
+            params (Dict[str, Any]): Parameters to use for rendering the template.
+                They override the default values of the 'variables' section.
+
+        Returns:
+            PromptConfig: The rendered prompt configuration.
+
+        Raises:
+            ParamValidationError: If validation is enabled and the parameters are invalid.
+        """
+        merged_params = {**self.default_values, **params}
+        if self.validate:
+            self.validator.validate(merged_params)
+        render_params, payloads = merged_params, None
+        if self.out_of_band is not None:
+            render_params, payloads = self.out_of_band.extract(merged_params)
+
+        config_data = None
+        if self.structural:
+            try:
+                config_data = YAMLParser.render_structural(self._compiled, render_params)
+            except StructuralFallback:
+                pass
+
+        if config_data is None:
+            config_data = copy_tree(self._static_data)
+            if self._dynamic_template is not None:
+                with stage('render', template=self.file_path, mode='sections') as record:
+                    try:
+                        rendered_yaml = self._dynamic_template.render(**render_params)
+                    except UndefinedError as e:
+                        raise ValueError(f"Missing parameters for rendering: {e}")
+                    if record.recording:
+                        record.set('rendered_bytes', len(rendered_yaml.encode('utf-8')))
+                config_data.update(YAMLParser.parse_rendered_yaml(rendered_yaml) or {})
+        if payloads:
+            config_data = self.out_of_band.inject(config_data, payloads)
+        return PromptConfig(config_data, merged_params, self.verbose, self.static_user_parts, self._shared_fields,
+                            self.static_prefix_key, self.static_system_instruction)
+
+    def render_many(self, params_iterable: Iterable[Dict[str, Any]]) -> Iterator['PromptConfig']:
+        """
+        Lazily renders the template once for each set of parameters.
+
+        Args:
+            params_iterable (Iterable[Dict[str, Any]]): The parameters of each render.
+
+        Yields:
+            PromptConfig: The rendered prompt configurations, in input order.
+        """
+        for params in params_iterable:
+            yield self.render(params)
+
+    def render_with_sample_values(self) -> 'PromptConfig':
+        """
+        Renders the template with the sample values of the 'variables' section.
+
+        Returns:
+            PromptConfig: The rendered prompt configuration.
+        """
+        return self.render(self.sample_values)
@@ -0,0 +1,499 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from dataclasses import dataclass
+from threading import Lock
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+import asyncio
+import random
+import time
+from promptweaver.core.base_llm_client import BaseLLMClient, StreamChunk
+from promptweaver.core.prompt_template import PromptConfig
+
+# Exception class names and HTTP status codes of the errors worth retrying: quota
+# exhaustion and transient server errors.
+RETRYABLE_ERROR_NAMES = frozenset({
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'Aborted',
+})
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Tokens counted for each non-text part (image, audio, video or document) when
+# estimating the cost of a request.
+MEDIA_PART_TOKENS = 258
+
+
+@dataclass
+class RateLimit:
+    """
+    Request and token budgets of a model.
+
+    Attributes:
+        requests_per_minute (float, optional): Maximum requests per minute, or None for no limit.
+        tokens_per_minute (float, optional): Maximum estimated tokens per minute, or None for no limit.
+        burst_seconds (float): How many seconds of budget can be spent at once after an
+            idle period. Lower values pace requests more evenly.
+    """
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    burst_seconds: float = 1.0
+
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously, on which callers reserve amounts ahead of time.
+
+    `reserve` never blocks: it takes the amount from the bucket, possibly going into
+    debt, and returns how long the caller must wait before proceeding. Later callers
+    queue up behind the debt, so concurrent callers are spaced out instead of all waking
+    up at once.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float) -> None:
+        """
+        Args:
+            rate_per_second (float): Refill rate of the bucket.
+            capacity (float): Maximum amount the bucket holds.
+        """
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes an amount from the bucket.
+
+        Args:
+            amount (float): The amount to take. It may exceed the capacity.
+
+        Returns:
+            float: Seconds to wait before the amount is available.
+        """
+        with self._lock:
+            self._refill()
+            self._level -= amount
+            return -self._level / self.rate_per_second if self._level < 0 else 0.0
+
+    def adjust(self, amount: float) -> None:
+        """Takes an additional amount, or gives one back when negative, without waiting."""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - amount)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+
+class _ModelBudget:
+    """The request and token buckets of one model."""
+
+    def __init__(self, limit: RateLimit) -> None:
+        self.requests = self._bucket(limit.requests_per_minute, limit.burst_seconds)
+        self.tokens = self._bucket(limit.tokens_per_minute, limit.burst_seconds)
+
+    @staticmethod
+    def _bucket(per_minute: Optional[float], burst_seconds: float) -> Optional[TokenBucket]:
+        if not per_minute:
+            return None
+        rate = per_minute / 60.0
+        return TokenBucket(rate, max(1.0, rate * burst_seconds))
+
+    def reserve(self, tokens: int) -> float:
+        wait = self.requests.reserve(1) if self.requests is not None else 0.0
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Retries of transient failures, with exponential backoff and full jitter.
+
+    The delay before retry n (starting at 0) is drawn uniformly between 0 and
+    min(max_delay, initial_delay * multiplier ** n). A `retry_after` attribute of the
+    error, in seconds, is used as a lower bound.
+
+    Attributes:
+        max_attempts (int): Maximum number of attempts, including the first one.
+        initial_delay (float): Upper bound of the first delay, in seconds.
+        max_delay (float): Upper bound of any delay, in seconds.
+        multiplier (float): Growth factor of the delay bound.
+        is_retryable (Callable[[BaseException], bool], optional): Decides which errors
+            are retried. Defaults to `is_retryable_error`.
+    """
+    max_attempts: int = 5
+    initial_delay: float = 1.0
+    max_delay: float = 60.0
+    multiplier: float = 2.0
+    is_retryable: Optional[Callable[[BaseException], bool]] = None
+
+    def should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Returns True if a failed attempt (starting at 0) should be retried."""
+        if attempt + 1 >= self.max_attempts:
+            return False
+        return (self.is_retryable or is_retryable_error)(error)
+
+    def delay(self, error: BaseException, attempt: int, rng: random.Random) -> float:
+        """Returns the jittered delay, in seconds, before retrying a failed attempt."""
+        bound = min(self.max_delay, self.initial_delay * self.multiplier ** attempt)
+        delay = rng.uniform(0, bound)
+        retry_after = getattr(error, 'retry_after', None)
+        if isinstance(retry_after, (int, float)):
+            delay = max(delay, min(float(retry_after), self.max_delay))
+        return delay
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Returns True for quota errors (HTTP 429) and transient server errors.
+
+    Errors are recognized by their class name (for example google.api_core's
+    ResourceExhausted or ServiceUnavailable) or by a `code` or `status_code` attribute.
+
+    Args:
+        error (BaseException): The error raised by a generation.
+    """
+    if any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    for attribute in ('code', 'status_code'):
+        code = getattr(error, attribute, None)
+        if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+            return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """Returns True if an error reports an exhausted quota (HTTP 429)."""
+    if any(cls.__name__ in ('ResourceExhausted', 'TooManyRequests') for cls in type(error).__mro__):
+        return True
+    return getattr(error, 'code', None) == 429 or getattr(error, 'status_code', None) == 429
+
+
+def estimate_tokens(prompt_config: PromptConfig, chars_per_token: float = 4) -> int:
+    """
+    Estimates the input tokens of a prompt from the size of its rendered content.
+
+    Args:
+        prompt_config (PromptConfig): The configuration for the prompt.
+        chars_per_token (float): Characters per token of text.
+
+    Returns:
+        int: The estimated token count: text characters divided by chars_per_token, plus
+            MEDIA_PART_TOKENS for each image, audio, video or document part.
+    """
+    chars = len(prompt_config.system_instruction or '')
+    media_parts = 0
+    for entry in prompt_config.user:
+        for modality, value in entry.items():
+            if modality in ('text', 'multimodal'):
+                chars += len(str(value))
+            elif value and value != 'None':
+                media_parts += 1
+    return max(1, int(chars / chars_per_token) + media_parts * MEDIA_PART_TOKENS)
+
+
+class RateLimitedLLMClient(BaseLLMClient):
+    """
+    Wraps an LLM client with per-model request and token budgets and retries.
+
+    Before each call, the tokens of the prompt are estimated from its rendered content
+    and reserved, with one request, on the budgets of its model. When a budget is spent,
+    the call waits (with `time.sleep` or `asyncio.sleep`) until it refills. Once the
+    response arrives, the token budget is corrected with the actual usage reported by
+    the model, when available. Transient failures such as 429s are retried with jittered
+    exponential backoff, each attempt going through the budgets again.
+
+    Streaming calls are retried only when they fail before yielding their first chunk.
+
+    Attributes:
+        limits (Dict[str, RateLimit]): The budgets of each model name.
+        default_limit (RateLimit, optional): The budgets of the models without an entry in
+            `limits`. Models without budget are not throttled.
+        retry_policy (RetryPolicy): The retry policy.
+    """
+
+    def __init__(self, client: BaseLLMClient, limits: Optional[Dict[str, RateLimit]] = None,
+                 default_limit: Optional[RateLimit] = None, retry_policy: Optional[RetryPolicy] = None,
+                 chars_per_token: float = 4, seed: Optional[int] = None) -> None:
+        """
+        Initializes the rate-limited client.
+
+        Args:
+            client (BaseLLMClient): The client whose calls are paced and retried.
+            limits (Dict[str, RateLimit], optional): The budgets of each model name.
+            default_limit (RateLimit, optional): The budgets of the other models, each
+                model getting its own buckets.
+            retry_policy (RetryPolicy, optional): The retry policy. Defaults to RetryPolicy().
+            chars_per_token (float): Characters per token, to estimate request sizes.
+            seed (int, optional): Seed of the backoff jitter, for reproducible runs.
+        """
+        self.client = client
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.chars_per_token = chars_per_token
+        self._budgets: Dict[str, Optional[_ModelBudget]] = {}
+        self._random = random.Random(seed)
+        self._lock = Lock()
+        self._metrics = {
+            'requests': 0, 'attempts': 0, 'retries': 0, 'failures': 0, 'quota_errors': 0,
+            'throttled': 0, 'throttle_seconds': 0.0, 'backoff_seconds': 0.0,
+            'queue_depth': 0, 'max_queue_depth': 0, 'in_flight': 0,
+        }
+
+    def generate_content(self, prompt_config: PromptConfig, *args, **kwargs) -> Any:
+        """
+        Generates content within the budgets of the prompt's model, retrying transient failures.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Any: The response of the wrapped client.
+
+        Raises:
+            Exception: The last error, once retries are exhausted or for errors that are
+                not retryable.
+        """
+        budget, tokens = self._start(prompt_config)
+        attempt = 0
+        while True:
+            self._wait(self._acquire(budget, tokens))
+            try:
+                response = self._call(lambda: self.client.generate_content(prompt_config, *args, **kwargs))
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._settle(budget, tokens, response)
+            return response
+
+    async def agenerate_content(self, prompt_config: PromptConfig, *args, **kwargs) -> Any:
+        """
+        Asynchronously generates content within the budgets of the prompt's model,
+        retrying transient failures.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Any: The response of the wrapped client.
+        """
+        budget, tokens = self._start(prompt_config)
+        attempt = 0
+        while True:
+            await self._async_wait(self._acquire(budget, tokens))
+            self._enter()
+            try:
+                response = await self.client.agenerate_content(prompt_config, *args, **kwargs)
+            except Exception as e:
+                self._exit()
+                await asyncio.sleep(self._on_error(e, attempt))
+                attempt += 1
+                continue
+            self._exit()
+            self._settle(budget, tokens, response)
+            return response
+
+    def stream_content(self, prompt_config: PromptConfig, *args, **kwargs) -> Iterator[StreamChunk]:
+        """
+        Streams content within the budgets of the prompt's model.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Yields:
+            StreamChunk: The chunks of the wrapped client.
+        """
+        budget, tokens = self._start(prompt_config)
+        attempt = 0
+        while True:
+            self._wait(self._acquire(budget, tokens))
+            chunks = self.client.stream_content(prompt_config, *args, **kwargs)
+            self._enter()
+            try:
+                first = next(chunks)
+            except StopIteration:
+                self._exit()
+                return
+            except Exception as e:
+                self._exit()
+                time.sleep(self._on_error(e, attempt))
+                attempt += 1
+                continue
+            try:
+                yield first
+                for chunk in chunks:
+                    if chunk.is_final:
+                        self._settle(budget, tokens, chunk)
+                    yield chunk
+            finally:
+                self._exit()
+            return
+
+    async def astream_content(self, prompt_config: PromptConfig, *args, **kwargs) -> AsyncIterator[StreamChunk]:
+        """
+        Asynchronously streams content within the budgets of the prompt's model.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Yields:
+            StreamChunk: The chunks of the wrapped client.
+        """
+        budget, tokens = self._start(prompt_config)
+        attempt = 0
+        while True:
+            await self._async_wait(self._acquire(budget, tokens))
+            chunks = self.client.astream_content(prompt_config, *args, **kwargs).__aiter__()
+            self._enter()
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                self._exit()
+                return
+            except Exception as e:
+                self._exit()
+                await asyncio.sleep(self._on_error(e, attempt))
+                attempt += 1
+                continue
+            try:
+                yield first
+                async for chunk in chunks:
+                    if chunk.is_final:
+                        self._settle(budget, tokens, chunk)
+                    yield chunk
+            finally:
+                self._exit()
+            return
+
+    def validate_prompt(self, prompt_config: PromptConfig) -> bool:
+        return self.client.validate_prompt(prompt_config)
+
+    def get_cache_key_contents(self, prompt_config: PromptConfig) -> Any:
+        return self.client.get_cache_key_contents(prompt_config)
+
+    def serialize_response(self, response: Any) -> bytes:
+        return self.client.serialize_response(response)
+
+    def deserialize_response(self, data: bytes) -> Any:
+        return self.client.deserialize_response(data)
+
+    def metrics(self) -> Dict[str, float]:
+        """
+        Returns the throttling and retry metrics.
+
+        Returns:
+            Dict[str, float]: The number of generations requested, attempts, retries,
+                failures (errors raised to the caller), quota errors received, attempts
+                that waited for budget and the total seconds they waited, the total backoff
+                seconds, the number of calls currently waiting for budget ('queue_depth')
+                and its maximum, and the number of calls in flight.
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+    def _budget(self, model_name: str) -> Optional[_ModelBudget]:
+        with self._lock:
+            if model_name not in self._budgets:
+                limit = self.limits.get(model_name, self.default_limit)
+                self._budgets[model_name] = _ModelBudget(limit) if limit is not None else None
+            return self._budgets[model_name]
+
+    def _start(self, prompt_config: PromptConfig):
+        self._count('requests')
+        return self._budget(prompt_config.model_name), estimate_tokens(prompt_config, self.chars_per_token)
+
+    def _acquire(self, budget: Optional[_ModelBudget], tokens: int) -> float:
+        """Reserves the budget of one attempt and returns how long to wait for it."""
+        wait = budget.reserve(tokens) if budget is not None else 0.0
+        with self._lock:
+            self._metrics['attempts'] += 1
+            if wait > 0:
+                self._metrics['throttled'] += 1
+                self._metrics['throttle_seconds'] += wait
+        return wait
+
+    def _wait(self, seconds: float) -> None:
+        if seconds > 0:
+            self._queue(1)
+            try:
+                time.sleep(seconds)
+            finally:
+                self._queue(-1)
+
+    async def _async_wait(self, seconds: float) -> None:
+        if seconds > 0:
+            self._queue(1)
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                self._queue(-1)
+
+    def _queue(self, delta: int) -> None:
+        with self._lock:
+            self._metrics['queue_depth'] += delta
+            self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], self._metrics['queue_depth'])
+
+    def _call(self, generate: Callable[[], Any]) -> Any:
+        self._enter()
+        try:
+            return generate()
+        finally:
+            self._exit()
+
+    def _enter(self) -> None:
+        with self._lock:
+            self._metrics['in_flight'] += 1
+
+    def _exit(self) -> None:
+        with self._lock:
+            self._metrics['in_flight'] -= 1
+
+    def _on_error(self, error: Exception, attempt: int) -> float:
+        """Records a failed attempt, raising the error unless it should be retried."""
+        quota_error = is_quota_error(error)
+        if not self.retry_policy.should_retry(error, attempt):
+            with self._lock:
+                self._metrics['failures'] += 1
+                self._metrics['quota_errors'] += quota_error
+            raise error
+        with self._lock:
+            delay = self.retry_policy.delay(error, attempt, self._random)
+            self._metrics['retries'] += 1
+            self._metrics['quota_errors'] += quota_error
+            self._metrics['backoff_seconds'] += delay
+        return delay
+
+    def _settle(self, budget: Optional[_ModelBudget], tokens: int, response: Any) -> None:
+        if budget is None:
+            return
+        usage = getattr(response, 'usage_metadata', None)
+        budget.settle(tokens, getattr(usage, 'total_token_count', None))
+
+    def _count(self, metric: str) -> None:
+        with self._lock:
+            self._metrics[metric] += 1
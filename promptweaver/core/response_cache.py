@@ -0,0 +1,330 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+import hashlib
+import json
+import sqlite3
+import time
+from promptweaver.core.base_llm_client import BaseLLMClient, StreamChunk
+from promptweaver.core.prompt_template import PromptConfig
+from promptweaver.utils.lru_cache import LRUCache
+
+
+class ResponseCacheBackend(ABC):
+    """
+    Storage of cached LLM responses.
+
+    Backends that keep responses in process memory store the response objects as they are.
+    Backends that persist them set `serializes` to True and receive bytes produced by the
+    client's `serialize_response`, which must be a safe format such as JSON: stored values
+    are loaded with `deserialize_response`, and values that fail to load are treated as
+    misses.
+    """
+
+    serializes = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+
+        Args:
+            key (str): The cache key.
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores value under key.
+
+        Args:
+            key (str): The cache key.
+            value (Any): The response, or its serialized bytes for serializing backends.
+            ttl (float, optional): Time to live in seconds. None means no expiry.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Removes every cached value."""
+        pass
+
+
+class InMemoryResponseCache(ResponseCacheBackend):
+    """In-process LRU cache of response objects with optional expiry."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        """
+        Initializes the in-memory cache.
+
+        Args:
+            maxsize (int): Maximum number of cached responses.
+        """
+        self._entries = LRUCache(maxsize)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.time():
+            self._entries.pop(key)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._entries.put(key, (time.time() + ttl if ttl is not None else None, value))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class SQLiteResponseCache(ResponseCacheBackend):
+    """
+    On-disk cache of serialized responses in a SQLite database.
+
+    The cache survives process restarts and can be shared by the processes of a host.
+    When it grows beyond `max_entries` or `max_bytes`, the least recently read entries
+    are evicted.
+    """
+
+    serializes = True
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> None:
+        """
+        Initializes the SQLite cache, creating the database if needed.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            max_entries (int, optional): Maximum number of cached responses.
+            max_bytes (int, optional): Maximum total size of the cached responses, in bytes.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl if ttl is not None else None, now),
+            )
+            self._evict(now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self, now: float) -> None:
+        """Removes expired entries, then the least recently read ones until the limits are met."""
+        self._connection.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        if self.max_entries is not None:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._connection.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+
+
+def is_deterministic(prompt_config: PromptConfig) -> bool:
+    """
+    Returns True if the generation config of the prompt asks for greedy decoding.
+
+    Args:
+        prompt_config (PromptConfig): The configuration for the prompt.
+    """
+    temperature = prompt_config.generation_config.get('temperature')
+    return temperature is not None and float(temperature) == 0.0
+
+
+class CachingLLMClient(BaseLLMClient):
+    """
+    Wraps an LLM client with a response cache.
+
+    Responses are cached under a canonical hash of the model name, system instruction,
+    generation config, safety settings and the content of the request, as described by
+    the wrapped client's `get_cache_key_contents`. By default only deterministic prompts
+    (temperature 0) are cached; other prompts always reach the wrapped client unless
+    `cache_nondeterministic` is set. Streaming calls are never cached.
+
+    Attributes:
+        hits (int): Number of generations served from the cache.
+        misses (int): Number of cacheable generations that reached the wrapped client.
+    """
+
+    def __init__(self, client: BaseLLMClient, backend: Optional[ResponseCacheBackend] = None,
+                 ttl: Optional[float] = None, cache_nondeterministic: bool = False) -> None:
+        """
+        Initializes the caching client.
+
+        Args:
+            client (BaseLLMClient): The client whose responses are cached.
+            backend (ResponseCacheBackend, optional): Where responses are stored.
+                Defaults to an InMemoryResponseCache.
+            ttl (float, optional): Time to live of cached responses, in seconds.
+            cache_nondeterministic (bool): Whether to also cache prompts sampled with a
+                non-zero temperature.
+        """
+        self.client = client
+        self.backend = backend if backend is not None else InMemoryResponseCache()
+        self.ttl = ttl
+        self.cache_nondeterministic = cache_nondeterministic
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+
+    def cache_key(self, prompt_config: PromptConfig) -> str:
+        """
+        Returns the canonical cache key of a prompt.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            str: The SHA-256 hex digest identifying the request.
+        """
+        payload = json.dumps(
+            [
+                prompt_config.model_name,
+                prompt_config.system_instruction,
+                prompt_config.generation_config,
+                prompt_config.safety_settings,
+                self.client.get_cache_key_contents(prompt_config),
+            ],
+            sort_keys=True,
+            separators=(',', ':'),
+            default=str,
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def generate_content(self, prompt_config: PromptConfig, *args, **kwargs) -> Any:
+        """
+        Returns the cached response of the prompt, generating and caching it on a miss.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Any: The response of the wrapped client.
+        """
+        return self._cached(prompt_config, lambda: self.client.generate_content(prompt_config, *args, **kwargs))
+
+    async def agenerate_content(self, prompt_config: PromptConfig, *args, **kwargs) -> Any:
+        """
+        Asynchronously returns the cached response of the prompt, generating and caching it on a miss.
+
+        Args:
+            prompt_config (PromptConfig): The configuration for the prompt.
+
+        Returns:
+            Any: The response of the wrapped client.
+        """
+        if not self._is_cacheable(prompt_config):
+            return await self.client.agenerate_content(prompt_config, *args, **kwargs)
+        key = self.cache_key(prompt_config)
+        response = self._lookup(key)
+        if response is None:
+            response = await self.client.agenerate_content(prompt_config, *args, **kwargs)
+            self._store(key, response)
+        return response
+
+    def stream_content(self, prompt_config: PromptConfig, *args, **kwargs) -> Iterator[StreamChunk]:
+        return self.client.stream_content(prompt_config, *args, **kwargs)
+
+    def astream_content(self, prompt_config: PromptConfig, *args, **kwargs) -> AsyncIterator[StreamChunk]:
+        return self.client.astream_content(prompt_config, *args, **kwargs)
+
+    def validate_prompt(self, prompt_config: PromptConfig) -> bool:
+        return self.client.validate_prompt(prompt_config)
+
+    def cache_info(self) -> Dict[str, int]:
+        """Returns the number of cache hits and misses."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def _is_cacheable(self, prompt_config: PromptConfig) -> bool:
+        return self.cache_nondeterministic or is_deterministic(prompt_config)
+
+    def _cached(self, prompt_config: PromptConfig, generate: Callable[[], Any]) -> Any:
+        if not self._is_cacheable(prompt_config):
+            return generate()
+        key = self.cache_key(prompt_config)
+        response = self._lookup(key)
+        if response is None:
+            response = generate()
+            self._store(key, response)
+        return response
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        value = self.backend.get(key)
+        if value is not None and self.backend.serializes:
+            try:
+                value = self.client.deserialize_response(value)
+            except ValueError:
+                # Stored in another format, for example by an older version: regenerate it.
+                value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return value
+
+    def _store(self, key: str, response: Any) -> None:
+        value = self.client.serialize_response(response) if self.backend.serializes else response
+        self.backend.set(key, value, self.ttl)
@@ -0,0 +1,341 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, Dict, List, Optional, Tuple
+import re
+import yaml
+from jinja2 import Environment, TemplateSyntaxError, Undefined
+from promptweaver.utils.jinja_utils import dump_template_code, load_template_code
+from promptweaver.utils.string_utils import uses_template_loader
+from promptweaver.utils.tree_utils import copy_tree, freeze_tree
+from promptweaver.utils.yaml_utils import get_yaml_loader, load_yaml
+
+
+# Jinja2 expressions, statements and comments, possibly spanning several lines.
+_JINJA_TAG_PATTERN = re.compile(r'{{.*?}}|{%.*?%}|{#.*?#}', re.DOTALL)
+
+# Line breaks YAML normalizes, and characters it rejects.
+_UNSAFE_CHARACTERS = '[\r\x85\u2028\u2029]|[^\x09\x0A\x20-\x7E\xA0-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]'
+
+# Rendered values that are not guaranteed to be read back by YAML as a single plain scalar.
+_UNSAFE_PLAIN_PATTERN = re.compile(r'^[\s\-?:,\[\]{}#&*!|>\'"%@`]|[\n\r\t,\[\]{}]|: |:$| #|\s$|' + _UNSAFE_CHARACTERS)
+
+# Rendered block scalar contents that YAML would not read back verbatim: unsafe characters,
+# lines holding only whitespace, and a first line starting with whitespace, which would
+# change the detected indentation.
+_UNSAFE_BLOCK_PATTERN = re.compile(_UNSAFE_CHARACTERS + r'|^[ \t]+$|\A\n*[ \t]', re.MULTILINE)
+
+_PLACEHOLDER = '__pw_{}__'
+_PLACEHOLDER_PATTERN = re.compile(r'__pw_(\d+)__')
+
+
+class StructuralFallback(Exception):
+    """Raised when a render cannot be resolved structurally and must go through text rendering."""
+
+
+class _PrintStrictUndefined(Undefined):
+    """Undefined that only fails when printed, like the `indent` filter added by `add_indent_filters`."""
+    __str__ = Undefined._fail_with_undefined_error
+
+
+def _single_line(value: Any) -> str:
+    """Filter rejecting multi-line values, which text rendering does not re-indent in `|-` and `|+` blocks."""
+    text = str(value)
+    if '\n' in text:
+        raise StructuralFallback(f"Rendered value {text[:40]!r} spans several lines.")
+    return text
+
+
+def _mid_line(value: Any) -> str:
+    """Filter rejecting values ending with a line break, after which text rendering would not re-indent the line."""
+    text = str(value)
+    if text.endswith('\n'):
+        raise StructuralFallback(f"Rendered value {text[:40]!r} ends a line in the middle of the template line.")
+    return text
+
+
+_SLOT_ENVIRONMENT = Environment(keep_trailing_newline=True)
+_SLOT_ENVIRONMENT.filters['single_line'] = _single_line
+_STRICT_SLOT_ENVIRONMENT = Environment(keep_trailing_newline=True, undefined=_PrintStrictUndefined)
+_STRICT_SLOT_ENVIRONMENT.filters['mid_line'] = _mid_line
+
+
+class _Slot:
+    """A scalar of the YAML skeleton whose value is produced by a Jinja2 template on each render."""
+
+    def __init__(self, path: Tuple[Any, ...], style: Optional[str], source: str,
+                 chomping: str = '', strict: bool = False) -> None:
+        self.path = path
+        self.style = style
+        self.source = source
+        self.chomping = chomping
+        self.strict = strict
+        self.template = self._environment().from_string(source)
+
+    def _environment(self) -> Environment:
+        return _STRICT_SLOT_ENVIRONMENT if self.strict else _SLOT_ENVIRONMENT
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state['template'] = dump_template_code(self._environment(), self.source)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.template = load_template_code(self._environment(), state['template'])
+
+    def render(self, params: Dict[str, Any]) -> Any:
+        rendered = self.template.render(**params)
+        if self.style == '|':
+            if _UNSAFE_BLOCK_PATTERN.search(rendered):
+                raise StructuralFallback(f"Rendered block {rendered[:40]!r} would not be read back verbatim.")
+            if self.chomping == '+':
+                return rendered
+            stripped = rendered.rstrip('\n')
+            if self.chomping == '-' or not stripped or not rendered.endswith('\n'):
+                return stripped
+            return stripped + '\n'
+        if self.style is None:
+            if _UNSAFE_PLAIN_PATTERN.search(rendered):
+                raise StructuralFallback(f"Rendered value {rendered[:40]!r} is not a plain YAML scalar.")
+            return _resolve_plain_scalar(rendered)
+        try:
+            return load_yaml(rendered)
+        except yaml.YAMLError as e:
+            raise StructuralFallback(str(e)) from e
+
+
+_SCALAR_LOADER = yaml.SafeLoader('')
+
+
+def _resolve_plain_scalar(value: str) -> Any:
+    """Converts a plain scalar string to the type YAML would implicitly resolve it to."""
+    tag = _SCALAR_LOADER.resolve(yaml.ScalarNode, value, (True, False))
+    if tag == 'tag:yaml.org,2002:str':
+        return value
+    return _SCALAR_LOADER.yaml_constructors[tag](_SCALAR_LOADER, yaml.ScalarNode(tag, value))
+
+
+class StructuralTemplate:
+    """
+    A .yml.j2 template whose YAML skeleton is parsed once.
+
+    The Jinja2 markup of the template is masked with placeholders and the result is
+    parsed as YAML a single time. Every scalar holding markup becomes a slot backed by
+    its own small Jinja2 template; the rest of the tree is static. Rendering evaluates
+    the slots and splices their values into a copy of the static tree, so the rendered
+    document is never parsed as YAML again, and variable values are inserted verbatim
+    instead of being re-indented with `add_indent_filters`.
+
+    Templates whose markup changes the YAML structure itself (for example a `{% if %}`
+    wrapping list items) cannot be represented this way; `compile` returns None for them.
+    """
+
+    def __init__(self, skeleton: Dict[str, Any], slots: List[_Slot]) -> None:
+        self.slots = slots
+        self.skeleton = self._freeze_static_subtrees(skeleton, {slot.path[:depth] for slot in slots
+                                                                for depth in range(len(slot.path))})
+
+    @classmethod
+    def _freeze_static_subtrees(cls, tree: Any, slot_prefixes: set, path: Tuple[Any, ...] = ()) -> Any:
+        """
+        Freezes the subtrees of the skeleton that hold no slot, so that every render
+        shares them by reference instead of copying them.
+        """
+        if path and path not in slot_prefixes:
+            return freeze_tree(tree)
+        if isinstance(tree, dict):
+            return {key: cls._freeze_static_subtrees(item, slot_prefixes, path + (key,)) for key, item in tree.items()}
+        if isinstance(tree, list):
+            return [cls._freeze_static_subtrees(item, slot_prefixes, path + (index,)) for index, item in enumerate(tree)]
+        return tree
+
+    @classmethod
+    def compile(cls, raw_template: str) -> Optional['StructuralTemplate']:
+        """
+        Builds a StructuralTemplate from the raw template content.
+
+        Args:
+            raw_template (str): The raw content of the .yml.j2 file.
+
+        Returns:
+            Optional[StructuralTemplate]: The structural template, or None if the template
+                is not eligible for structural rendering.
+        """
+        if _PLACEHOLDER_PATTERN.search(raw_template) or uses_template_loader(raw_template):
+            # Included and parent templates are rendered as text by the template environment.
+            return None
+        tags = []
+
+        def mask(match):
+            tag = match.group(0)
+            tags.append(tag)
+            return _PLACEHOLDER.format(len(tags) - 1)
+
+        masked = _JINJA_TAG_PATTERN.sub(mask, raw_template)
+        if masked.endswith('\n'):
+            # Text rendering drops the final newline of the template, as Jinja2 does by default.
+            masked = masked[:-1]
+        if any(tag[2] in '-+' or tag[-3] in '-+' for tag in tags):
+            # Whitespace control may strip text across scalar boundaries.
+            return None
+        try:
+            return _SkeletonBuilder(masked, tags).build()
+        except (yaml.YAMLError, TemplateSyntaxError, StructuralFallback):
+            return None
+
+    def render(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Renders the template with the provided parameters.
+
+        Args:
+            params (Dict[str, Any]): Parameters to use for rendering the template.
+
+        Returns:
+            Dict[str, Any]: The rendered configuration tree.
+
+        Raises:
+            StructuralFallback: If a rendered value cannot be spliced in without YAML parsing.
+        """
+        values = [slot.render(params) for slot in self.slots]
+        tree = copy_tree(self.skeleton)
+        for slot, value in zip(self.slots, values):
+            container = tree
+            for key in slot.path[:-1]:
+                container = container[key]
+            container[slot.path[-1]] = value
+        return tree
+
+    def static_prefix_length(self, section: str) -> int:
+        """
+        Returns the number of leading items of a top-level list section that hold no
+        Jinja2 markup, and are therefore identical in every render.
+
+        Args:
+            section (str): The top-level key, for example 'user'.
+
+        Returns:
+            int: The number of static leading items.
+        """
+        items = self.skeleton.get(section)
+        if not isinstance(items, list):
+            return 0
+        dynamic_items = [slot.path[1] if len(slot.path) > 1 else 0 for slot in self.slots if slot.path[0] == section]
+        return min(dynamic_items, default=len(items))
+
+
+class _SkeletonBuilder:
+    """Walks the composed YAML nodes of a masked template, collecting static values and slots."""
+
+    def __init__(self, masked: str, tags: List[str]) -> None:
+        self.masked = masked
+        self.tags = tags
+        self.loader = get_yaml_loader()(masked)
+        self.slots: List[_Slot] = []
+        self.seen = set()
+
+    def build(self) -> Optional[StructuralTemplate]:
+        try:
+            root = self.loader.get_single_node()
+            if root is None or not isinstance(root, yaml.MappingNode):
+                return None
+            skeleton = self._walk(root, ())
+        finally:
+            self.loader.dispose()
+        return StructuralTemplate(skeleton, self.slots)
+
+    def _walk(self, node: yaml.Node, path: Tuple[Any, ...]) -> Any:
+        if id(node) in self.seen:
+            # Aliased nodes would need the same slot spliced in several places.
+            raise StructuralFallback("Aliases are not supported.")
+        self.seen.add(id(node))
+
+        if isinstance(node, yaml.MappingNode):
+            result = {}
+            for key_node, value_node in node.value:
+                if key_node.tag == 'tag:yaml.org,2002:merge' or not isinstance(key_node, yaml.ScalarNode):
+                    raise StructuralFallback("Merge keys and complex keys are not supported.")
+                if _PLACEHOLDER_PATTERN.search(key_node.value):
+                    raise StructuralFallback("Jinja2 markup in mapping keys is not supported.")
+                key = self.loader.construct_object(key_node)
+                result[key] = self._walk(value_node, path + (key,))
+            return result
+        if isinstance(node, yaml.SequenceNode):
+            return [self._walk(item, path + (index,)) for index, item in enumerate(node.value)]
+        if _PLACEHOLDER_PATTERN.search(node.value):
+            self.slots.append(self._make_slot(node, path))
+            return None
+        return self.loader.construct_object(node, deep=True)
+
+    def _unmask(self, text: str) -> str:
+        return _PLACEHOLDER_PATTERN.sub(lambda m: self.tags[int(m.group(1))], text)
+
+    def _make_slot(self, node: yaml.ScalarNode, path: Tuple[Any, ...]) -> _Slot:
+        start, end = node.start_mark.index, node.end_mark.index
+        # libyaml reports plain scalars with an empty style, the pure-Python loader with None.
+        style = node.style or None
+        if style is None or style in ('"', "'"):
+            fragment = self.masked[start:end]
+            if '\n' in fragment:
+                raise StructuralFallback("Multi-line flow scalars are not supported.")
+            return _Slot(path, style, self._unmask(fragment))
+        if style != '|':
+            raise StructuralFallback("Folded block scalars are not supported.")
+
+        header_end = self.masked.find('\n', start)
+        header = self.masked[start:header_end]
+        indicators = header.split('#', 1)[0].strip()
+        if any(char.isdigit() for char in indicators):
+            raise StructuralFallback("Explicit block indentation indicators are not supported.")
+        chomping = '-' if '-' in indicators else '+' if '+' in indicators else ''
+
+        lines = self.masked[header_end + 1:end].splitlines(keepends=True)
+        content_lines = [line for line in lines if line.strip()]
+        if not content_lines:
+            raise StructuralFallback("Empty block scalar.")
+        block_indent = len(content_lines[0]) - len(content_lines[0].lstrip(' '))
+
+        # `add_indent_filters` only re-indents the values of blocks whose header ends with `|`,
+        # and its `indent` filter fails on undefined values.
+        strict = header.rstrip().endswith('|')
+        dedented = []
+        for line in lines:
+            line = line[block_indent:] if line.strip() else line.lstrip(' \t')
+            line_indent = len(line) - len(line.lstrip(' '))
+            dedented.append(_PLACEHOLDER_PATTERN.sub(
+                lambda m: self._block_expression(m, line, line_indent, strict), line))
+
+        return _Slot(path, '|', self._unmask(''.join(dedented)), chomping, strict)
+
+    def _block_expression(self, match: re.Match, line: str, line_indent: int, strict: bool) -> str:
+        """Adds the filters that make a value of a `|` block render as it does in text rendering."""
+        tag = self.tags[int(match.group(1))]
+        if not tag.startswith('{{'):
+            return match.group(0)
+        filters = []
+        if not strict:
+            filters.append('single_line')
+        else:
+            if line[match.end():].strip():
+                filters.append('mid_line')
+            if line_indent and '| indent(' not in tag:
+                # Keep multi-line values aligned with a more indented line, as the
+                # `indent` filter added by `add_indent_filters` does in text rendering.
+                filters.append(f'indent({line_indent})')
+        if not filters:
+            return match.group(0)
+        self.tags.append('{{ (' + tag[2:-2].strip() + ') | ' + ' | '.join(filters) + ' }}')
+        return _PLACEHOLDER.format(len(self.tags) - 1)
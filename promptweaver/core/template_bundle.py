@@ -0,0 +1,298 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Dict, List, Optional
+import argparse
+import glob
+import hashlib
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import jinja2
+from jinja2 import meta
+from promptweaver.core.prompt_template import YAMLParser
+from promptweaver.core.template_cache import CompiledTemplate
+from promptweaver.core.template_environment import add_embedded_sources, register_template_root
+from promptweaver.utils.string_utils import uses_template_loader
+
+BUNDLE_MAGIC = b'PWBUNDLE'
+BUNDLE_FORMAT_VERSION = 4
+_HEADER_LENGTH = struct.Struct('<Q')
+
+
+class StaleBundleError(ValueError):
+    """Raised when a template bundle is corrupted or was built by an incompatible version."""
+
+
+class TemplateBundle:
+    """
+    A directory of .yml.j2 templates precompiled into a single file.
+
+    For every template the bundle stores the preprocessed source, the Python code Jinja2
+    generates for it, the parsed 'variables' section with defaults and samples, and the
+    parsed YAML skeleton used by structural rendering. Loading a bundle is a single read
+    of the file: no template is read, parsed or compiled again.
+
+    The sources of the templates they include, import or extend (fragments) are embedded
+    as well, and served from memory when the bundled templates render, so a bundle keeps
+    working once the template directory is moved or removed.
+
+    The file starts with a magic string and a JSON header recording the format version,
+    the Jinja2 version, the SHA-256 of the payload and the content hash of every source
+    template and fragment, followed by the pickled fragments and compiled templates.
+
+    Attributes:
+        templates (Dict[str, CompiledTemplate]): Compiled templates by path relative to the
+            template directory (for example '01-hello-world-text.yml.j2').
+        content_hashes (Dict[str, str]): SHA-256 of each source template when it was bundled.
+        fragments (Dict[str, Dict[str, str]]): Raw sources of the fragments, by template
+            root and by name relative to the root.
+        fragment_hashes (Dict[str, str]): SHA-256 of each fragment when it was bundled, by
+            path relative to the template directory.
+        source_dir (Optional[str]): The directory the templates were bundled from.
+    """
+
+    def __init__(self, templates: Dict[str, CompiledTemplate], source_dir: Optional[str] = None,
+                 fragments: Optional[Dict[str, Dict[str, str]]] = None) -> None:
+        self.templates = templates
+        self.content_hashes = {name: compiled.content_hash for name, compiled in templates.items()}
+        self.fragments = fragments or {}
+        self.source_dir = source_dir
+        self.fragment_hashes = {}
+        for root, sources in self.fragments.items():
+            for name, source in sources.items():
+                path = os.path.join(root, name)
+                if source_dir is not None:
+                    path = os.path.relpath(path, source_dir).replace(os.sep, '/')
+                self.fragment_hashes[path] = hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def build(cls, template_dir: str, pattern: str = '**/*.yml.j2') -> 'TemplateBundle':
+        """
+        Compiles every template of a directory.
+
+        Args:
+            template_dir (str): The directory holding the .yml.j2 templates.
+            pattern (str): Glob pattern of the templates, relative to template_dir.
+
+        Returns:
+            TemplateBundle: The compiled templates.
+        """
+        template_dir = os.path.abspath(template_dir)
+        register_template_root(template_dir)
+        templates = {}
+        for file_path in sorted(glob.glob(os.path.join(template_dir, pattern), recursive=True)):
+            name = os.path.relpath(file_path, template_dir).replace(os.sep, '/')
+            templates[name] = YAMLParser.get_compiled_template(file_path)
+        return cls(templates, template_dir, cls._collect_fragments(templates.values()))
+
+    @staticmethod
+    def _collect_fragments(templates) -> Dict[str, Dict[str, str]]:
+        """
+        Reads the raw sources of every template reachable through the loader from the given
+        templates: those they include, import or extend, recursively. When a template name
+        is computed at render time, every file of the root is embedded.
+        """
+        fragments: Dict[str, Dict[str, str]] = {}
+        for compiled in templates:
+            if compiled.template_root is None or not uses_template_loader(compiled.source):
+                continue
+            root = compiled.template_root
+            environment = compiled.environment
+            sources = fragments.setdefault(root, {})
+            pending = [compiled.source]
+            while pending:
+                for name in meta.find_referenced_templates(environment.parse(pending.pop())):
+                    if name is None:
+                        for directory, _, file_names in os.walk(root):
+                            for file_name in file_names:
+                                path = os.path.join(directory, file_name)
+                                try:
+                                    with open(path, encoding='utf-8', newline='') as file:
+                                        source = file.read()
+                                except (OSError, UnicodeDecodeError):
+                                    continue
+                                sources.setdefault(os.path.relpath(path, root).replace(os.sep, '/'), source)
+                        continue
+                    if name in sources:
+                        continue
+                    with open(os.path.join(root, *name.split('/')), encoding='utf-8', newline='') as file:
+                        sources[name] = file.read()
+                    pending.append(environment.loader.get_source(environment, name)[0])
+        return {root: sources for root, sources in fragments.items() if sources}
+
+    def save(self, path: str) -> None:
+        """
+        Writes the bundle to a file.
+
+        Args:
+            path (str): The bundle file path.
+        """
+        # The fragments come first: their loaders are set up before the templates are unpickled.
+        payload = (pickle.dumps(self.fragments, protocol=pickle.HIGHEST_PROTOCOL)
+                   + pickle.dumps(self.templates, protocol=pickle.HIGHEST_PROTOCOL))
+        header = json.dumps({
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'jinja2_version': jinja2.__version__,
+            'payload_sha256': hashlib.sha256(payload).hexdigest(),
+            'source_dir': self.source_dir,
+            'templates': self.content_hashes,
+            'fragments': self.fragment_hashes,
+        }).encode('utf-8')
+        with open(path, 'wb') as file:
+            file.write(BUNDLE_MAGIC)
+            file.write(_HEADER_LENGTH.pack(len(header)))
+            file.write(header)
+            file.write(payload)
+
+    @classmethod
+    def load(cls, path: str, verify: bool = True) -> 'TemplateBundle':
+        """
+        Loads a bundle file with a single memory-mapped read.
+
+        Args:
+            path (str): The bundle file path.
+            verify (bool): Whether to check the payload against its SHA-256 before loading it.
+
+        Returns:
+            TemplateBundle: The compiled templates.
+
+        Raises:
+            StaleBundleError: If the file is not a bundle, is corrupted, or was built with an
+                incompatible bundle format or Jinja2 version.
+        """
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+                raise StaleBundleError(f"{path} is not a PromptWeaver template bundle.")
+            offset = len(BUNDLE_MAGIC)
+            (header_length,) = _HEADER_LENGTH.unpack_from(mapped, offset)
+            offset += _HEADER_LENGTH.size
+            header = json.loads(mapped[offset:offset + header_length])
+            offset += header_length
+
+            if header['format_version'] != BUNDLE_FORMAT_VERSION or header['jinja2_version'] != jinja2.__version__:
+                raise StaleBundleError(
+                    f"{path} was built with bundle format {header['format_version']} and Jinja2 "
+                    f"{header['jinja2_version']}; rebuild it for format {BUNDLE_FORMAT_VERSION} and "
+                    f"Jinja2 {jinja2.__version__}."
+                )
+            with memoryview(mapped) as view, view[offset:] as payload:
+                if verify and hashlib.sha256(payload).hexdigest() != header['payload_sha256']:
+                    raise StaleBundleError(f"{path} is corrupted: its payload hash does not match its header.")
+                stream = io.BytesIO(payload)
+                fragments = pickle.load(stream)
+                for root, sources in fragments.items():
+                    # Embedded sources take precedence; files of the root, if it still
+                    # exists, only serve templates that were not embedded.
+                    add_embedded_sources(root, sources)
+                templates = pickle.load(stream)
+        return cls(templates, header.get('source_dir'), fragments)
+
+    def names(self) -> List[str]:
+        """Returns the names of the bundled templates."""
+        return list(self.templates)
+
+    def get(self, name: str) -> CompiledTemplate:
+        """
+        Returns a bundled template.
+
+        Args:
+            name (str): The template path relative to the template directory.
+
+        Returns:
+            CompiledTemplate: The compiled template.
+
+        Raises:
+            KeyError: If the bundle has no such template.
+        """
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise KeyError(f"Template '{name}' is not in the bundle. Available templates: {self.names()}") from None
+
+    def stale_templates(self, template_dir: Optional[str] = None) -> List[str]:
+        """
+        Compares the bundle with the templates currently on disk.
+
+        Args:
+            template_dir (str, optional): The template directory. Defaults to the directory
+                the bundle was built from.
+
+        Returns:
+            List[str]: Names of the templates that changed, were removed or were added
+                since the bundle was built, and of the fragments that changed or were
+                removed.
+        """
+        template_dir = template_dir or self.source_dir
+        on_disk = {}
+        for file_path in glob.glob(os.path.join(template_dir, '**', '*.yml.j2'), recursive=True):
+            with open(file_path, 'rb') as file:
+                name = os.path.relpath(file_path, template_dir).replace(os.sep, '/')
+                on_disk[name] = hashlib.sha256(file.read()).hexdigest()
+        names = set(on_disk) | set(self.content_hashes)
+        stale = {name for name in names if on_disk.get(name) != self.content_hashes.get(name)}
+        for name, content_hash in self.fragment_hashes.items():
+            try:
+                with open(os.path.join(template_dir, *name.split('/')), 'rb') as file:
+                    if hashlib.sha256(file.read()).hexdigest() != content_hash:
+                        stale.add(name)
+            except OSError:
+                stale.add(name)
+        return sorted(stale)
+
+    def is_stale(self, template_dir: Optional[str] = None) -> bool:
+        """
+        Returns True if any template changed on disk since the bundle was built.
+
+        Args:
+            template_dir (str, optional): The template directory. Defaults to the directory
+                the bundle was built from.
+        """
+        return bool(self.stale_templates(template_dir))
+
+
+def compile_bundle(template_dir: str, output_path: str, pattern: str = '**/*.yml.j2') -> TemplateBundle:
+    """
+    Compiles a directory of templates into a bundle file.
+
+    Args:
+        template_dir (str): The directory holding the .yml.j2 templates.
+        output_path (str): The bundle file path.
+        pattern (str): Glob pattern of the templates, relative to template_dir.
+
+    Returns:
+        TemplateBundle: The compiled templates.
+    """
+    bundle = TemplateBundle.build(template_dir, pattern)
+    bundle.save(output_path)
+    return bundle
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile a directory of .yml.j2 templates into a bundle file.")
+    parser.add_argument('template_dir')
+    parser.add_argument('output_path')
+    parser.add_argument('--pattern', default='**/*.yml.j2')
+    args = parser.parse_args()
+    bundle = compile_bundle(args.template_dir, args.output_path, args.pattern)
+    print(f"Bundled {len(bundle.templates)} templates into {args.output_path}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, FrozenSet, Optional
+from jinja2 import Environment, Template
+from promptweaver.core.out_of_band import find_bare_variables
+from promptweaver.core.param_validator import ParamValidator
+from promptweaver.core.structural_template import StructuralTemplate
+from promptweaver.core.template_environment import get_environment
+from promptweaver.utils.jinja_utils import dump_template_code, load_template_code
+from promptweaver.utils.string_utils import uses_template_loader
+from promptweaver.utils.lru_cache import LRUCache
+
+
+# Environment of the templates rendered as a whole document that have no template root,
+# such as the dynamic sections of templates built from a string.
+TEMPLATE_ENVIRONMENT = Environment()
+
+
+class CompiledTemplate:
+    """
+    A .yml.j2 template preprocessed and compiled once, ready to be rendered many times.
+
+    Attributes:
+        file_path (str): Absolute path of the template file.
+        mtime_ns (int): Modification time of the file when it was compiled.
+        size (int): Size in bytes of the file when it was compiled.
+        content_hash (str): SHA-256 hex digest of the raw file content.
+        source (str): The template source after `add_indent_filters` preprocessing.
+        template (Template): The compiled Jinja2 template.
+        variables (Dict[str, Any]): The parsed 'variables' section.
+        required_variables (FrozenSet[str]): The undeclared variables the template uses, as
+            returned by `YAMLParser.extract_required_variables`.
+        structural (Optional[StructuralTemplate]): The parsed YAML skeleton of the template,
+            or None if the template is not eligible for structural rendering.
+        default_values (Dict[str, Any]): Default values declared in the 'variables' section.
+        sample_values (Dict[str, Any]): Sample values declared in the 'variables' section.
+        variable_types (Dict[str, str]): Types declared in the 'variables' section.
+        template_root (Optional[str]): The root directory whose environment resolves the
+            templates included or extended by this one.
+        validator (ParamValidator): The validator of the rendering parameters, built from
+            the 'variables' section and the required variables on first use.
+    """
+
+    def __init__(self, file_path: str, mtime_ns: int, size: int, content_hash: str,
+                 source: str, template: Template, variables: Dict[str, Any],
+                 structural: Optional[StructuralTemplate] = None,
+                 required_variables: FrozenSet[str] = frozenset(), template_root: Optional[str] = None) -> None:
+        self.file_path = file_path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.content_hash = content_hash
+        self.source = source
+        self.template = template
+        self.variables = variables
+        self.structural = structural
+        self.required_variables = required_variables
+        self.template_root = template_root
+        self.default_values = {var: details.get('default') for var, details in variables.items() if 'default' in details}
+        self.sample_values = {var: details['sample'] for var, details in variables.items() if 'sample' in details}
+        self.variable_types = {var: details['type'] for var, details in variables.items() if 'type' in details}
+
+    @property
+    def static_user_parts(self) -> int:
+        """The number of leading 'user' entries that are the same in every render."""
+        return self.structural.static_prefix_length('user') if self.structural is not None else 0
+
+    @property
+    def static_system_instruction(self) -> bool:
+        """Whether the system instruction holds no template variables, and is the same in every render."""
+        if self.structural is None:
+            return False
+        path = ('model', 'system_instruction')
+        return not any(slot.path[:len(path)] == path or path[:len(slot.path)] == slot.path
+                       for slot in self.structural.slots)
+
+    @property
+    def static_prefix_key(self) -> Optional[str]:
+        """
+        Identifies the static leading 'user' entries of the template: a hash of the template
+        content and of those entries, or None if the template has none. Computed on first use.
+        """
+        if not self.static_user_parts:
+            return None
+        static_prefix_key = self.__dict__.get('_static_prefix_key')
+        if static_prefix_key is None:
+            entries = self.structural.skeleton['user'][:self.static_user_parts]
+            payload = json.dumps([self.content_hash, entries], sort_keys=True, default=str)
+            static_prefix_key = self._static_prefix_key = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return static_prefix_key
+
+    def is_fresh(self, stat: os.stat_result) -> bool:
+        """Returns True if the file stat matches the one recorded at compile time."""
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+    def render(self, params: Dict[str, Any]) -> str:
+        """Renders the compiled template with the given parameters."""
+        return self.template.render(**params)
+
+    @property
+    def bare_variables(self) -> FrozenSet[str]:
+        """
+        The variables the template only prints as `{{ name }}`, which can be substituted out
+        of band. Computed on first use; empty for templates that include or extend others,
+        since the other templates may use the variables in any way.
+        """
+        bare_variables = self.__dict__.get('_bare_variables')
+        if bare_variables is None:
+            if uses_template_loader(self.source):
+                bare_variables = frozenset()
+            else:
+                bare_variables = find_bare_variables(self.environment.parse(self.source))
+            self._bare_variables = bare_variables
+        return bare_variables
+
+    @property
+    def validator(self) -> ParamValidator:
+        """
+        The validator of the rendering parameters. Built on first use, so that templates
+        using `type`, `max_length` or `enum` as free-form metadata load as long as their
+        parameters are not validated.
+        """
+        validator = self.__dict__.get('_validator')
+        if validator is None:
+            validator = self._validator = ParamValidator(self.variables, self.required_variables, self.file_path)
+        return validator
+
+    @property
+    def environment(self) -> Environment:
+        """The Jinja2 environment of the template."""
+        return get_environment(self.template_root) if self.template_root is not None else TEMPLATE_ENVIRONMENT
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state['template'] = dump_template_code(self.environment, self.source)
+        # The checks of the validator are closures; they are built again on first use.
+        state.pop('_validator', None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self.template = load_template_code(self.environment, state['template'])
+
+
+class TemplateCache:
+    """
+    Process-wide registry of compiled templates with LRU eviction.
+
+    Entries are keyed by absolute file path. On every lookup the file is stat'ed and,
+    depending on the validation mode, recompiled when it changed:
+
+    - 'mtime': the entry is reused while the file modification time and size are unchanged.
+      When they change, the content hash is compared before recompiling, so touching a file
+      does not trigger a recompilation.
+    - 'hash': the file content is read and hashed on every lookup. Use this on filesystems
+      with coarse or unreliable modification times.
+    """
+
+    VALIDATION_MODES = ('mtime', 'hash')
+
+    def __init__(self, compile_fn: Callable[[str, str, os.stat_result, str], CompiledTemplate],
+                 maxsize: int = 128, validation: str = 'mtime') -> None:
+        """
+        Initializes the TemplateCache.
+
+        Args:
+            compile_fn (Callable): Function building a CompiledTemplate from
+                (file_path, raw_template, stat, content_hash).
+            maxsize (int): Maximum number of compiled templates kept in memory.
+            validation (str): Either 'mtime' or 'hash'.
+
+        Raises:
+            ValueError: If the validation mode is unknown.
+        """
+        self._compile_fn = compile_fn
+        self._entries = LRUCache(maxsize)
+        self.validation = None
+        self.configure(validation=validation)
+
+    def configure(self, maxsize: Optional[int] = None, validation: Optional[str] = None) -> None:
+        """
+        Changes the cache size and/or validation mode. Changing the size clears the cache.
+
+        Args:
+            maxsize (int, optional): Maximum number of compiled templates kept in memory.
+            validation (str, optional): Either 'mtime' or 'hash'.
+
+        Raises:
+            ValueError: If the validation mode is unknown.
+        """
+        if validation is not None:
+            if validation not in self.VALIDATION_MODES:
+                raise ValueError(f"Unknown validation mode '{validation}', expected one of {self.VALIDATION_MODES}.")
+            self.validation = validation
+        if maxsize is not None:
+            self._entries = LRUCache(maxsize)
+
+    def get(self, file_path: str) -> CompiledTemplate:
+        """
+        Returns the compiled template for file_path, compiling it if needed.
+
+        Args:
+            file_path (str): The path to the .yml.j2 file.
+
+        Returns:
+            CompiledTemplate: The up to date compiled template.
+        """
+        key = os.path.abspath(file_path)
+        stat = os.stat(key)
+        entry = self._entries.get(key)
+        if entry is not None and self.validation == 'mtime' and entry.is_fresh(stat):
+            return entry
+
+        with open(key, 'rb') as file:
+            raw_bytes = file.read()
+        content_hash = hashlib.sha256(raw_bytes).hexdigest()
+        if entry is not None and entry.content_hash == content_hash:
+            entry.mtime_ns, entry.size = stat.st_mtime_ns, stat.st_size
+            return entry
+
+        entry = self._compile_fn(key, raw_bytes.decode('utf-8'), stat, content_hash)
+        self._entries.put(key, entry)
+        return entry
+
+    def invalidate(self, file_path: Optional[str] = None) -> None:
+        """
+        Drops a single compiled template, or every one of them when no path is given.
+
+        Args:
+            file_path (str, optional): The path to the .yml.j2 file.
+        """
+        if file_path is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(os.path.abspath(file_path))
+
+    def info(self) -> Dict[str, int]:
+        """Returns the hits, misses, current size and maxsize of the cache."""
+        return self._entries.info()
@@ -0,0 +1,225 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+# Templates are compiled in a Jinja2 Environment shared by every template of the same
+# root directory. Its loader resolves `{% include %}`, `{% import %}` and `{% extends %}`
+# relative to the root, so shared fragments (personas, safety rules, schemas) are
+# compiled once per process and reused by every template. The bytecode cache keeps the
+# compiled Python code of templates and fragments; with a directory-backed cache, a
+# restarted worker loads it instead of compiling the templates again.
+
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple, Union
+import os
+from jinja2 import (BaseLoader, BytecodeCache, ChoiceLoader, DictLoader, Environment, FileSystemBytecodeCache,
+                    FileSystemLoader)
+from jinja2.bccache import Bucket
+from promptweaver.utils.string_utils import add_indent_filters
+
+# Directory of the persistent bytecode cache, read when the module is imported.
+BYTECODE_CACHE_DIR_ENV = 'PROMPTWEAVER_JINJA_CACHE_DIR'
+
+
+def _preprocess(source: str) -> str:
+    source = source.replace('\r\n', '\n').replace('\r', '\n')
+    return add_indent_filters(source.splitlines(keepends=True))
+
+
+class IndentFilterLoader(FileSystemLoader):
+    """
+    FileSystemLoader that preprocesses templates with `add_indent_filters`, so included
+    and parent templates get the same YAML-aware indentation as the templates loaded by
+    YAMLParser.
+    """
+
+    def get_source(self, environment: Environment, template: str) -> Tuple[str, str, Any]:
+        source, filename, uptodate = super().get_source(environment, template)
+        return _preprocess(source), filename, uptodate
+
+
+class IndentFilterDictLoader(DictLoader):
+    """
+    DictLoader counterpart of IndentFilterLoader, serving raw template sources held in
+    memory, such as the fragments embedded in a template bundle.
+    """
+
+    def get_source(self, environment: Environment, template: str) -> Tuple[str, str, Any]:
+        source, filename, uptodate = super().get_source(environment, template)
+        return _preprocess(source), filename, uptodate
+
+
+class MemoryBytecodeCache(BytecodeCache):
+    """In-process bytecode cache, shared by the environments of every template root."""
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, bytes] = {}
+        self._lock = Lock()
+
+    def load_bytecode(self, bucket: Bucket) -> None:
+        with self._lock:
+            data = self._buckets.get(bucket.key)
+        if data is not None:
+            bucket.bytecode_from_string(data)
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        data = bucket.bytecode_to_string()
+        with self._lock:
+            self._buckets[bucket.key] = data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+def _default_bytecode_cache() -> BytecodeCache:
+    cache_dir = os.environ.get(BYTECODE_CACHE_DIR_ENV)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        return FileSystemBytecodeCache(cache_dir)
+    return MemoryBytecodeCache()
+
+
+_lock = Lock()
+_roots: List[str] = []
+_environments: Dict[str, Environment] = {}
+_bytecode_cache: BytecodeCache = _default_bytecode_cache()
+
+
+def set_bytecode_cache(cache: Union[None, str, BytecodeCache] = None) -> None:
+    """
+    Sets the bytecode cache of the template environments.
+
+    Args:
+        cache (Union[None, str, BytecodeCache]): A directory for a persistent
+            FileSystemBytecodeCache, a BytecodeCache instance, or None for an in-memory cache.
+    """
+    global _bytecode_cache
+    if isinstance(cache, str):
+        os.makedirs(cache, exist_ok=True)
+        cache = FileSystemBytecodeCache(cache)
+    with _lock:
+        _bytecode_cache = cache if cache is not None else MemoryBytecodeCache()
+        for environment in _environments.values():
+            environment.bytecode_cache = _bytecode_cache
+
+
+def get_bytecode_cache() -> BytecodeCache:
+    """Returns the bytecode cache of the template environments."""
+    return _bytecode_cache
+
+
+def register_template_root(root: str) -> None:
+    """
+    Declares a template root directory.
+
+    Templates under a registered root share its environment, and resolve includes and
+    parent templates relative to it (for example `{% include 'fragments/persona.j2' %}`).
+    Templates outside every registered root use their own directory as root.
+
+    Args:
+        root (str): The root directory.
+    """
+    root = os.path.abspath(root)
+    with _lock:
+        if root not in _roots:
+            _roots.append(root)
+            # The deepest root containing a template wins.
+            _roots.sort(key=len, reverse=True)
+
+
+def get_template_root(file_path: str) -> str:
+    """
+    Returns the root directory of a template file.
+
+    Args:
+        file_path (str): The path to the template file.
+
+    Returns:
+        str: The deepest registered root containing the file, or its directory.
+    """
+    file_path = os.path.abspath(file_path)
+    with _lock:
+        for root in _roots:
+            if file_path.startswith(root + os.sep):
+                return root
+    return os.path.dirname(file_path)
+
+
+def get_environment(root: str, loader: Optional[BaseLoader] = None) -> Environment:
+    """
+    Returns the shared environment of a template root, creating it on first use.
+
+    Args:
+        root (str): The root directory.
+        loader (BaseLoader, optional): The loader of a new environment. Defaults to an
+            IndentFilterLoader of the root.
+
+    Returns:
+        Environment: The environment of the root.
+    """
+    root = os.path.abspath(root)
+    with _lock:
+        environment = _environments.get(root)
+        if environment is None:
+            environment = Environment(
+                loader=loader if loader is not None else IndentFilterLoader(root),
+                bytecode_cache=_bytecode_cache,
+                auto_reload=True,
+            )
+            _environments[root] = environment
+        return environment
+
+
+def add_embedded_sources(root: str, sources: Dict[str, str]) -> Environment:
+    """
+    Serves raw template sources held in memory from the environment of a template root,
+    in precedence over its previous loader, which keeps serving the other templates. The
+    environment is created if needed, and templates it already loaded are loaded again.
+
+    Args:
+        root (str): The root directory.
+        sources (Dict[str, str]): The raw sources, by template name.
+
+    Returns:
+        Environment: The environment of the root.
+    """
+    environment = get_environment(root)
+    with _lock:
+        loader = environment.loader
+        if isinstance(loader, ChoiceLoader) and isinstance(loader.loaders[0], IndentFilterDictLoader):
+            # Sources embedded earlier, for example by another bundle of the same root.
+            sources = {**loader.loaders[0].mapping, **sources}
+            loader = ChoiceLoader(loader.loaders[1:])
+        environment.loader = ChoiceLoader([IndentFilterDictLoader(sources), loader])
+        if environment.cache is not None:
+            environment.cache.clear()
+    return environment
+
+
+def locate_template(file_path: str) -> Tuple[Environment, str, str]:
+    """
+    Returns the environment of a template file and its name in that environment.
+
+    Args:
+        file_path (str): The path to the template file.
+
+    Returns:
+        Tuple[Environment, str, str]: The environment, the template name ('/'-separated
+            path relative to the root) and the root directory.
+    """
+    root = get_template_root(file_path)
+    name = os.path.relpath(os.path.abspath(file_path), root).replace(os.sep, '/')
+    return get_environment(root), name, root
@@ -0,0 +1,274 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import fnmatch
+import glob
+import hashlib
+import os
+import threading
+import time
+from promptweaver.core.prompt_template import PromptConfig, PromptTemplate, YAMLParser
+from promptweaver.core.template_environment import register_template_root
+
+
+class _Snapshot:
+    """An immutable view of the registry. Reloads build a new snapshot and swap it in."""
+
+    def __init__(self, templates: Dict[str, PromptTemplate], states: Dict[str, Tuple[int, int, str]]) -> None:
+        self.templates = templates
+        self.states = states
+        self.by_name = {}
+        for path, template in sorted(templates.items(), reverse=True):
+            if template.name:
+                # The first template in path order wins when two declare the same name.
+                self.by_name[template.name] = template
+
+
+class TemplateRegistry:
+    """
+    The templates of a directory, kept up to date while the application runs.
+
+    Templates are looked up by their path relative to the directory (for example
+    '01-hello-world-text.yml.j2') or by the 'name' they declare. Once `start` is called,
+    a background thread picks up added, changed and removed files: with watchdog
+    (inotify on Linux) when it is installed, and by polling modification times otherwise.
+    Only files whose content changed are recompiled. The new templates are swapped in
+    with a single reference assignment, so a lookup always sees a complete set of
+    templates, and renders in progress keep the PromptTemplate they started with.
+
+    When a template fails to compile, the registry keeps serving its last good version
+    and records the error in `errors`.
+
+    Attributes:
+        template_dir (str): The absolute path of the template directory.
+        errors (Dict[str, str]): The last compilation error of each failing template, by
+            relative path.
+        reload_count (int): Number of reloads that changed the registry.
+    """
+
+    def __init__(self, template_dir: str, pattern: str = '**/*.yml.j2', poll_interval: float = 1.0,
+                 use_watchdog: bool = True, structural: bool = True,
+                 on_error: Optional[Callable[[str, Exception], None]] = None, verbose: bool = False) -> None:
+        """
+        Initializes the registry and compiles every template of the directory.
+
+        Args:
+            template_dir (str): The directory holding the .yml.j2 templates.
+            pattern (str): Glob pattern of the templates, relative to template_dir.
+            poll_interval (float): Seconds between two scans of the directory. With
+                watchdog, scans also happen as soon as a file event is received.
+            use_watchdog (bool): Whether to use watchdog file events when it is installed.
+            structural (bool): Whether templates use structural rendering when they allow it.
+            on_error (Callable[[str, Exception], None], optional): Called with the relative
+                path and the exception when a template fails to compile.
+            verbose (bool): Whether to print reloads and errors.
+        """
+        self.template_dir = os.path.abspath(template_dir)
+        # Templates of the directory include and extend each other relative to it.
+        register_template_root(self.template_dir)
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.use_watchdog = use_watchdog
+        self.structural = structural
+        self.on_error = on_error
+        self.verbose = verbose
+        self.errors: Dict[str, str] = {}
+        self.reload_count = 0
+        self._snapshot = _Snapshot({}, {})
+        self._reload_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._observer = None
+        self.reload()
+
+    def get(self, name: str) -> PromptTemplate:
+        """
+        Returns a template by relative path or declared name.
+
+        Args:
+            name (str): The template path relative to the directory, or its 'name'.
+
+        Returns:
+            PromptTemplate: The current version of the template.
+
+        Raises:
+            KeyError: If no template has this path or name.
+        """
+        snapshot = self._snapshot
+        template = snapshot.templates.get(name) or snapshot.by_name.get(name)
+        if template is None:
+            raise KeyError(f"Template '{name}' is not in {self.template_dir}. Available templates: {self.names()}")
+        return template
+
+    def render(self, name: str, params: Dict[str, Any]) -> PromptConfig:
+        """
+        Renders the current version of a template.
+
+        Args:
+            name (str): The template path relative to the directory, or its 'name'.
+            params (Dict[str, Any]): Parameters to use for rendering the template.
+
+        Returns:
+            PromptConfig: The rendered prompt configuration.
+        """
+        return self.get(name).render(params)
+
+    def names(self) -> List[str]:
+        """Returns the relative paths of the available templates."""
+        return sorted(self._snapshot.templates)
+
+    def __contains__(self, name: str) -> bool:
+        snapshot = self._snapshot
+        return name in snapshot.templates or name in snapshot.by_name
+
+    def __len__(self) -> int:
+        return len(self._snapshot.templates)
+
+    def reload(self) -> List[str]:
+        """
+        Scans the directory and recompiles the templates that changed since the last scan.
+
+        Returns:
+            List[str]: Relative paths of the templates that were added, updated or removed.
+        """
+        with self._reload_lock:
+            current = self._snapshot
+            templates = dict(current.templates)
+            states = dict(current.states)
+            changed = []
+
+            on_disk = {}
+            for file_path in glob.glob(os.path.join(self.template_dir, self.pattern), recursive=True):
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                on_disk[os.path.relpath(file_path, self.template_dir).replace(os.sep, '/')] = (file_path, stat)
+
+            for name in set(states) - set(on_disk):
+                templates.pop(name, None)
+                del states[name]
+                self.errors.pop(name, None)
+                changed.append(name)
+
+            for name, (file_path, stat) in on_disk.items():
+                state = states.get(name)
+                if state is not None and state[:2] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    with open(file_path, 'rb') as file:
+                        raw_bytes = file.read()
+                    content_hash = hashlib.sha256(raw_bytes).hexdigest()
+                    if state is None or state[2] != content_hash or name not in templates:
+                        compiled = YAMLParser.compile_template(file_path, raw_bytes.decode('utf-8'), stat, content_hash)
+                        templates[name] = PromptTemplate(compiled, structural=self.structural)
+                        changed.append(name)
+                    self.errors.pop(name, None)
+                except Exception as e:
+                    # Keep serving the last good version of the template.
+                    self.errors[name] = f"{type(e).__name__}: {e}"
+                    if self.verbose:
+                        print(f"Failed to reload template {name}: {self.errors[name]}")
+                    if self.on_error is not None:
+                        self.on_error(name, e)
+                    content_hash = None
+                states[name] = (stat.st_mtime_ns, stat.st_size, content_hash)
+
+            self._snapshot = _Snapshot(templates, states)
+            if changed:
+                self.reload_count += 1
+                if self.verbose:
+                    print(f"Reloaded templates: {sorted(changed)}")
+            return sorted(changed)
+
+    def start(self) -> 'TemplateRegistry':
+        """
+        Starts watching the directory in a background thread.
+
+        Returns:
+            TemplateRegistry: The registry itself.
+        """
+        if self._thread is not None:
+            return self
+        self._stopped.clear()
+        if self.use_watchdog:
+            self._observer = self._start_observer()
+        self._thread = threading.Thread(target=self._watch, name='promptweaver-template-registry', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops watching the directory."""
+        self._stopped.set()
+        self._changed.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def watching_events(self) -> bool:
+        """True if file events (rather than polling alone) trigger reloads."""
+        return self._observer is not None
+
+    def __enter__(self) -> 'TemplateRegistry':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.stop()
+
+    def _watch(self) -> None:
+        while not self._stopped.is_set():
+            self._changed.wait(self.poll_interval)
+            if self._stopped.is_set():
+                break
+            if self._changed.is_set():
+                # Let editors finish writing before reading the files.
+                time.sleep(0.05)
+                self._changed.clear()
+            try:
+                self.reload()
+            except Exception as e:
+                if self.verbose:
+                    print(f"Template directory scan failed: {e}")
+
+    def _start_observer(self) -> Any:
+        """Starts a watchdog observer on the directory, or returns None if watchdog is not installed."""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return None
+
+        registry = self
+        suffix = '*' + self.pattern.rsplit('/', 1)[-1]
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = [getattr(event, 'src_path', ''), getattr(event, 'dest_path', '')]
+                if event.is_directory or any(fnmatch.fnmatch(os.fsdecode(path), suffix) for path in paths if path):
+                    registry._changed.set()
+
+        observer = Observer()
+        observer.schedule(_Handler(), self.template_dir, recursive=True)
+        observer.daemon = True
+        observer.start()
+        return observer
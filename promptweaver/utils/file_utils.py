@@ -0,0 +1,75 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from threading import Condition
+import mmap
+import os
+
+# Files at least this large are read through a memory map.
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def read_file_bytes(file_path: str, mmap_threshold: int = MMAP_THRESHOLD) -> bytes:
+    """
+    Reads a whole file as bytes.
+
+    Large files are copied straight from a read-only memory map into the returned bytes,
+    without going through an intermediate read buffer.
+
+    Args:
+        file_path (str): The path of the file.
+        mmap_threshold (int): Minimum size, in bytes, of the files read through a memory map.
+
+    Returns:
+        bytes: The file content.
+    """
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size < mmap_threshold or size == 0:
+            return file.read()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[:]
+
+
+class ByteBudget:
+    """
+    Bounds the number of bytes held by concurrent operations, such as parallel file reads.
+
+    `acquire` blocks until the requested bytes fit in the budget. A request larger than the
+    whole budget is let through once nothing else holds bytes, so it cannot block forever.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Args:
+            max_bytes (int): The budget, in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self._condition = Condition()
+
+    def acquire(self, size: int) -> None:
+        """Waits until size bytes are available and reserves them."""
+        with self._condition:
+            while self.in_use and self.in_use + size > self.max_bytes:
+                self._condition.wait()
+            self.in_use += size
+
+    def release(self, size: int) -> None:
+        """Returns size bytes to the budget."""
+        with self._condition:
+            self.in_use -= size
+            self._condition.notify_all()
@@ -0,0 +1,209 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import sys
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded mapping that evicts the least recently used entry.
+
+    Attributes:
+        maxsize (int): Maximum number of entries kept in the cache.
+        hits (int): Number of lookups that found an entry.
+        misses (int): Number of lookups that did not find an entry.
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        """
+        Initializes the LRUCache.
+
+        Args:
+            maxsize (int): Maximum number of entries kept in the cache.
+
+        Raises:
+            ValueError: If maxsize is lower than 1.
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Returns the value stored for key and marks it as recently used.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any, optional): Value returned when the key is not cached.
+
+        Returns:
+            Any: The cached value, or default.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> List[Tuple[Hashable, Any]]:
+        """
+        Stores value under key, evicting the least recently used entries if needed.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to store.
+
+        Returns:
+            List[Tuple[Hashable, Any]]: The evicted entries.
+        """
+        evicted = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+        return evicted
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Removes key from the cache and returns its value.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any, optional): Value returned when the key is not cached.
+
+        Returns:
+            Any: The removed value, or default.
+        """
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Returns the entries, from the least to the most recently used."""
+        with self._lock:
+            return list(self._data.items())
+
+    def clear(self) -> None:
+        """Removes every entry and resets the hit and miss counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> Dict[str, int]:
+        """
+        Returns the cache statistics.
+
+        Returns:
+            Dict[str, int]: The hits, misses, current size and maxsize of the cache.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class ByteSizedLRUCache(LRUCache):
+    """
+    An LRUCache bounded by the total size of its values instead of their number.
+
+    The size of each value is given when it is stored. Values larger than the whole
+    budget are not cached.
+
+    Attributes:
+        max_bytes (int): Maximum total size of the cached values.
+        current_bytes (int): Total size of the cached values.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """
+        Initializes the ByteSizedLRUCache.
+
+        Args:
+            max_bytes (int): Maximum total size of the cached values.
+        """
+        super().__init__(maxsize=sys.maxsize)
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._sizes: Dict[Hashable, int] = {}
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> List[Tuple[Hashable, Any]]:
+        """
+        Stores value under key, evicting the least recently used entries if needed.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to store.
+            size (int): The size of the value, in bytes.
+
+        Returns:
+            List[Tuple[Hashable, Any]]: The evicted entries.
+        """
+        evicted = []
+        with self._lock:
+            self.current_bytes -= self._sizes.pop(key, 0)
+            self._data.pop(key, None)
+            if size > self.max_bytes:
+                return evicted
+            self._data[key] = value
+            self._sizes[key] = size
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                evicted.append(self._data.popitem(last=False))
+                self.current_bytes -= self._sizes.pop(evicted[-1][0])
+        return evicted
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            self.current_bytes -= self._sizes.pop(key, 0)
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        super().clear()
+        with self._lock:
+            self._sizes.clear()
+            self.current_bytes = 0
+
+    def info(self) -> Dict[str, int]:
+        """
+        Returns the cache statistics.
+
+        Returns:
+            Dict[str, int]: The hits, misses, current size (entries and bytes) and the byte
+                budget of the cache.
+        """
+        info = super().info()
+        with self._lock:
+            info.update(bytes=self.current_bytes, max_bytes=self.max_bytes)
+        del info['maxsize']
+        return info
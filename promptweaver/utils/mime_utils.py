@@ -16,6 +16,29 @@
 
 import os
 
+# MIME types of the supported media, by lowercase file extension.
+MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpeg': 'image/jpeg',
+    '.jpg': 'image/jpeg',
+    '.flv': 'video/x-flv',
+    '.mov': 'video/mov',
+    '.mpeg': 'video/mpeg',
+    '.mpg': 'video/mpg',
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.wmv': 'video/wmv',
+    '.3gpp': 'video/3gpp',
+    '.aac': 'audio/aac',
+    '.flac': 'audio/flac',
+    '.mp3': 'audio/mp3',
+    '.m4a': 'audio/m4a',
+    '.opus': 'audio/opus',
+    '.pcm': 'audio/pcm',
+    '.wav': 'audio/wav',
+    '.pdf': 'application/pdf'
+}
+
 
 def get_mime_type(file_uri: str) -> str:
     """
@@ -28,25 +51,4 @@ def get_mime_type(file_uri: str) -> str:
         str: The corresponding MIME type.
     """
     extension = os.path.splitext(file_uri)[1].lower()
-    mime_types = {
-        '.png': 'image/png',
-        '.jpeg': 'image/jpeg',
-        '.jpg': 'image/jpeg',
-        '.flv': 'video/x-flv',
-        '.mov': 'video/mov',
-        '.mpeg': 'video/mpeg',
-        '.mpg': 'video/mpg',
-        '.mp4': 'video/mp4',
-        '.webm': 'video/webm',
-        '.wmv': 'video/wmv',
-        '.3gpp': 'video/3gpp',
-        '.aac': 'audio/aac',
-        '.flac': 'audio/flac',
-        '.mp3': 'audio/mp3',
-        '.m4a': 'audio/m4a',
-        '.opus': 'audio/opus',
-        '.pcm': 'audio/pcm',
-        '.wav': 'audio/wav',
-        '.pdf': 'application/pdf'
-    }
-    return mime_types.get(extension)
+    return MIME_TYPES.get(extension)
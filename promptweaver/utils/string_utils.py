@@ -14,8 +14,19 @@
  limitations under the License.
  """
 
+from typing import Iterable, Iterator, Optional
 import re
 
+# Statements that load other templates through the environment's loader.
+_LOADER_STATEMENT_PATTERN = re.compile(r'{%[-+]?\s*(include|import|from|extends)\b')
+_EXTENDS_PATTERN = re.compile(r'{%[-+]?\s*extends\b')
+# Includes, and blocks a child template may override, opened and closed on one line.
+_INDENTED_STATEMENT_PATTERN = re.compile(
+    r'{%[-+]?\s*include\b.*?%}|{%[-+]?\s*block\b.*?%}.*?{%[-+]?\s*endblock\b.*?%}')
+
+# A mapping key at column zero, such as `model:` or `variables:`.
+_TOP_LEVEL_KEY_PATTERN = re.compile(r'^([A-Za-z_][\w-]*)\s*:')
+
 
 def remove_blank_spaces(text: str) -> str:
     """Removes leading and trailing whitespace characters from a string.
@@ -46,9 +57,20 @@ def add_indent_filters(template_lines: list[str]) -> str:
     Returns:
         str: The processed template as a single string with indent filters added to variables.
     """
+    return ''.join(iter_indent_filtered_lines(template_lines))
+
+def iter_indent_filtered_lines(template_lines: Iterable[str]) -> Iterator[str]:
+    """
+    Lazily applies `add_indent_filters` to a sequence of template lines.
+
+    Args:
+        template_lines (Iterable[str]): The lines of the Jinja2 template.
+
+    Yields:
+        str: Each line, with indent filters added to the variables inside block scalars.
+    """
     in_block_scalar = False
     block_scalar_indent = None
-    output_lines = []
     variable_pattern = re.compile(r'{{\s*(.*?)\s*}}')
 
     for _, line in enumerate(template_lines):
@@ -60,7 +82,7 @@ def add_indent_filters(template_lines: list[str]) -> str:
         if stripped_line.endswith('|') and not in_block_scalar:
             in_block_scalar = True
             block_scalar_indent = current_indent
-            output_lines.append(line)
+            yield line
             continue
 
         if in_block_scalar:
@@ -69,7 +91,7 @@ def add_indent_filters(template_lines: list[str]) -> str:
                 # Exited block scalar
                 in_block_scalar = False
                 block_scalar_indent = None
-                output_lines.append(line)
+                yield line
                 continue
             else:
                 # We are inside the block scalar
@@ -84,10 +106,93 @@ def add_indent_filters(template_lines: list[str]) -> str:
                         return m.group(0)
                 # Replace variables with indent filter
                 new_line = variable_pattern.sub(repl, line)
-                output_lines.append(new_line)
+                # Indent included templates and overridable blocks the same way
+                if '{%' in new_line and 'filter indent(' not in new_line:
+                    new_line = _INDENTED_STATEMENT_PATTERN.sub(
+                        lambda m: '{% filter indent(' + str(current_indent) + ') %}' + m.group(0) + '{% endfilter %}',
+                        new_line,
+                    )
+                yield new_line
                 continue
         else:
             # Not inside block scalar
-            output_lines.append(line)
+            yield line
+
+def scan_template(raw_template: str) -> tuple[str, Optional[str]]:
+    """
+    Preprocesses a .yml.j2 template and extracts its 'variables' section in a single pass.
+
+    The 'variables' section is the top-level `variables:` key (at column zero) and the
+    indented, blank and comment lines that follow it, up to the next top-level line.
+    Keys named `variables:` nested in other sections or inside block scalars are ignored.
 
-    return ''.join(output_lines)
+    Args:
+        raw_template (str): The raw content of the .yml.j2 file.
+
+    Returns:
+        tuple[str, Optional[str]]: The template with indent filters added (as returned by
+            `add_indent_filters`), and the raw text of the 'variables' section, starting
+            with its `variables:` line, or None if the template has none.
+    """
+    lines = raw_template.splitlines(keepends=True)
+    source_lines = []
+    variables_lines = None
+    in_variables = False
+
+    for raw_line, line in zip(lines, iter_indent_filtered_lines(lines)):
+        source_lines.append(line)
+        if raw_line[:1] not in ('', ' ', '\t', '\n', '#'):
+            # A top-level line ends the current section
+            match = _TOP_LEVEL_KEY_PATTERN.match(raw_line)
+            in_variables = variables_lines is None and match is not None and match.group(1) == 'variables'
+            if in_variables:
+                variables_lines = []
+        if in_variables:
+            variables_lines.append(raw_line)
+
+    variables_section = ''.join(variables_lines) if variables_lines is not None else None
+    return ''.join(source_lines), variables_section
+
+def contains_jinja(text: str) -> bool:
+    """Returns True if the text contains a Jinja2 expression, statement or comment."""
+    return '{{' in text or '{%' in text or '{#' in text
+
+def uses_template_loader(text: str) -> bool:
+    """Returns True if the text includes, imports or extends other templates."""
+    return _LOADER_STATEMENT_PATTERN.search(text) is not None
+
+def uses_extends(text: str) -> bool:
+    """Returns True if the text extends another template."""
+    return _EXTENDS_PATTERN.search(text) is not None
+
+def split_top_level_sections(template_str: str) -> list[tuple[str, str]]:
+    """
+    Splits a YAML template into its top-level sections, keeping every line.
+
+    A section starts at a line beginning at column zero with a mapping key
+    (for example `model:` or `user:`) and runs until the next one. Comment and
+    blank lines that precede the first key are attached to it.
+
+    Args:
+        template_str (str): The YAML (or Jinja2 + YAML) template.
+
+    Returns:
+        list[tuple[str, str]]: (key, section text) pairs in their original order.
+            The key is an empty string for trailing content that precedes no key.
+    """
+    sections = []
+    current_key = None
+    current_lines = []
+
+    for line in template_str.splitlines(keepends=True):
+        match = _TOP_LEVEL_KEY_PATTERN.match(line)
+        if match:
+            if current_key is not None:
+                sections.append((current_key, ''.join(current_lines)))
+                current_lines = []
+            current_key = match.group(1)
+        current_lines.append(line)
+
+    if current_lines:
+        sections.append((current_key or '', ''.join(current_lines)))
+    return sections
@@ -0,0 +1,123 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, NoReturn
+
+
+class FrozenDict(dict):
+    """
+    A read-only dict.
+
+    Parts of a configuration tree that are the same in every render of a template are
+    frozen once and shared by reference between the rendered configurations.
+    """
+
+    __slots__ = ()
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> NoReturn:
+        raise TypeError(f"{type(self).__name__} is read-only.")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self) -> 'FrozenDict':
+        return self
+
+    def __deepcopy__(self, memo: dict) -> 'FrozenDict':
+        return self
+
+    def __reduce__(self) -> tuple:
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """A read-only list, the sequence counterpart of FrozenDict."""
+
+    __slots__ = ()
+
+    def _read_only(self, *args: Any, **kwargs: Any) -> NoReturn:
+        raise TypeError(f"{type(self).__name__} is read-only.")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+
+    def __copy__(self) -> 'FrozenList':
+        return self
+
+    def __deepcopy__(self, memo: dict) -> 'FrozenList':
+        return self
+
+    def __reduce__(self) -> tuple:
+        return (FrozenList, (list(self),))
+
+
+def freeze_tree(value: Any) -> Any:
+    """
+    Returns a read-only copy of a parsed YAML tree, made of FrozenDict and FrozenList.
+
+    Args:
+        value (Any): The tree to freeze.
+
+    Returns:
+        Any: The frozen tree. Frozen subtrees are reused as they are.
+    """
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze_tree(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze_tree(item) for item in value)
+    return value
+
+
+def thaw_tree(value: Any) -> Any:
+    """
+    Returns a mutable deep copy of a tree, with plain dicts and lists in place of the
+    frozen ones. Use it before handing a shared tree to code that modifies it.
+
+    Args:
+        value (Any): The tree to copy.
+
+    Returns:
+        Any: The mutable copy.
+    """
+    if isinstance(value, dict):
+        return {key: thaw_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [thaw_tree(item) for item in value]
+    return value
+
+
+def copy_tree(value: Any) -> Any:
+    """
+    Returns a deep copy of a parsed YAML tree.
+
+    Much faster than `copy.deepcopy` for trees made only of dicts, lists and
+    immutable scalars, which is what YAML parsing produces. Frozen subtrees are
+    immutable, so they are shared with the copy instead of being copied.
+
+    Args:
+        value (Any): The tree to copy.
+
+    Returns:
+        Any: A copy sharing no mutable dict or list with the original tree.
+    """
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return {key: copy_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_tree(item) for item in value]
+    return value
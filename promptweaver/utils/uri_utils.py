@@ -0,0 +1,150 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+import os
+import re
+from promptweaver.utils.lru_cache import LRUCache
+from promptweaver.utils.mime_utils import get_mime_type
+
+# HTTPS endpoints of Cloud Storage objects, rewritten to gs:// URIs.
+GCS_HTTPS_PREFIXES = ('https://storage.googleapis.com/', 'https://storage.cloud.google.com/')
+
+# Media references embedded in multimodal text: Cloud Storage URIs and HTTPS links,
+# file:// URIs and base64 data: URIs. Bare local paths are left as text, so that prose
+# mentioning a path never reads a file; local files must use the file:// scheme. The
+# leading lookahead lets the regex engine skip quickly to the characters that can start
+# a reference.
+_MEDIA_REFERENCE_PATTERN = re.compile(
+    r'(?=[ghfd])(?:'
+    r'(?:gs://|https://storage\.googleapis\.com/|https://storage\.cloud\.google\.com/|file://)\S+'
+    r'|data:[\w.+-]+/[\w.+-]+;base64,[A-Za-z0-9+/]+=*)'
+)
+
+# Punctuation ending a sentence right after a URI, which is not part of it.
+_TRAILING_PUNCTUATION = '.,;:!?)]}>\'"'
+
+_SCHEME_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*:')
+
+
+class MediaSegment(NamedTuple):
+    """
+    A span of multimodal text.
+
+    Attributes:
+        kind (str): 'text' for plain text, 'gcs' for a gs:// URI, 'file' for a local
+            path, 'data' for base64 data, or 'uri' for any other URI.
+        value (str): The stripped text, the URI or path, or the base64 data.
+        mime_type (Optional[str]): The MIME type of media, when it is known.
+        reference (Optional[str]): The reference as written in the text, for media found
+            by `tokenize_multimodal_text`.
+    """
+    kind: str
+    value: str
+    mime_type: Optional[str] = None
+    reference: Optional[str] = None
+
+
+def classify_media_uri(uri: str) -> MediaSegment:
+    """
+    Normalizes a media reference.
+
+    Cloud Storage HTTPS links become gs:// URIs, file:// URIs become local paths, and
+    data: URIs are split into their MIME type and base64 data.
+
+    Args:
+        uri (str): The reference: a URI or a local path.
+
+    Returns:
+        MediaSegment: The classified reference.
+    """
+    if uri.startswith('gs://'):
+        return MediaSegment('gcs', uri, get_mime_type(uri))
+    for prefix in GCS_HTTPS_PREFIXES:
+        if uri.startswith(prefix):
+            uri = 'gs://' + uri[len(prefix):]
+            return MediaSegment('gcs', uri, get_mime_type(uri))
+    if uri.startswith('file://'):
+        path = unquote(uri[len('file://'):])
+        if path.startswith('localhost/'):
+            path = path[len('localhost'):]
+        return MediaSegment('file', path, get_mime_type(path))
+    if uri.startswith('data:'):
+        header, _, data = uri.partition(',')
+        return MediaSegment('data', data, header[len('data:'):].split(';', 1)[0] or None)
+    if _SCHEME_PATTERN.match(uri) and not os.path.isabs(uri):
+        return MediaSegment('uri', uri, get_mime_type(uri))
+    path = os.path.expanduser(uri)
+    return MediaSegment('file', path, get_mime_type(path))
+
+
+def _append_text(segments: List[MediaSegment], text: str, start: int, end: int) -> None:
+    if start < end:
+        stripped = text[start:end].strip()
+        if stripped:
+            segments.append(MediaSegment('text', stripped))
+
+
+def tokenize_multimodal_text(text: str) -> Tuple[MediaSegment, ...]:
+    """
+    Splits multimodal text into text spans and media references, in a single pass.
+
+    Media references are gs:// URIs, Cloud Storage HTTPS links, file:// URIs and base64
+    data: URIs. Local paths without the file:// scheme are plain text.
+
+    Args:
+        text (str): The text of a 'multimodal' entry.
+
+    Returns:
+        Tuple[MediaSegment, ...]: The segments, in order. Text spans are stripped, and
+            spans holding only whitespace are dropped.
+    """
+    segments: List[MediaSegment] = []
+    position = 0
+    for match in _MEDIA_REFERENCE_PATTERN.finditer(text):
+        start, end = match.span()
+        if text[start] != 'd':
+            while text[end - 1] in _TRAILING_PUNCTUATION:
+                end -= 1
+        _append_text(segments, text, position, start)
+        segments.append(classify_media_uri(text[start:end])._replace(reference=text[start:end]))
+        position = end
+    _append_text(segments, text, position, len(text))
+    return tuple(segments)
+
+
+# Segments of the multimodal texts that are the same in every render of their template.
+_static_segments = LRUCache(256)
+
+
+def tokenize_static_multimodal_text(text: str) -> Tuple[MediaSegment, ...]:
+    """
+    Memoized `tokenize_multimodal_text`, for the multimodal text of static template
+    entries. Texts holding rendered variables should not go through it, as each of them
+    would take a cache entry.
+
+    Args:
+        text (str): The text of a 'multimodal' entry.
+
+    Returns:
+        Tuple[MediaSegment, ...]: The segments, in order.
+    """
+    segments = _static_segments.get(text)
+    if segments is None:
+        segments = tokenize_multimodal_text(text)
+        _static_segments.put(text, segments)
+    return segments
@@ -0,0 +1,73 @@
+"""
+ Copyright 2024 Google LLC
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+      https://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+ """
+
+from typing import Any, Dict, Type, Union
+import yaml
+
+
+# Safe loaders available in this environment, by backend name.
+YAML_BACKENDS: Dict[str, Type] = {'python': yaml.SafeLoader}
+if getattr(yaml, '__with_libyaml__', False):
+    YAML_BACKENDS['libyaml'] = yaml.CSafeLoader
+
+_loader: Type = YAML_BACKENDS.get('libyaml', yaml.SafeLoader)
+
+
+def set_yaml_backend(backend: Union[str, Type] = 'auto') -> None:
+    """
+    Selects the loader used to parse every PromptWeaver YAML document.
+
+    Args:
+        backend (Union[str, Type]): 'auto' to use libyaml's CSafeLoader when PyYAML was
+            built with it and the pure-Python SafeLoader otherwise, 'libyaml', 'python',
+            or a custom yaml Loader class.
+
+    Raises:
+        ValueError: If the backend is unknown or not available in this environment.
+    """
+    global _loader
+    if isinstance(backend, type):
+        _loader = backend
+    elif backend == 'auto':
+        _loader = YAML_BACKENDS.get('libyaml', yaml.SafeLoader)
+    elif backend in YAML_BACKENDS:
+        _loader = YAML_BACKENDS[backend]
+    else:
+        raise ValueError(
+            f"YAML backend '{backend}' is not available. "
+            f"Expected 'auto', a yaml Loader class or one of {list(YAML_BACKENDS)}."
+        )
+
+
+def get_yaml_loader() -> Type:
+    """Returns the yaml Loader class currently used to parse YAML documents."""
+    return _loader
+
+
+def load_yaml(content: str) -> Any:
+    """
+    Parses a YAML document with the selected backend.
+
+    Args:
+        content (str): The YAML document.
+
+    Returns:
+        Any: The parsed data.
+
+    Raises:
+        yaml.YAMLError: If the document cannot be parsed.
+    """
+    return yaml.load(content, Loader=_loader)